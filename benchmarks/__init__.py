@@ -0,0 +1,30 @@
+"""
+Benchmarks for the Swiftly client hot paths.
+
+Everything runs offline: HTTP benchmarks go through
+:py:class:`swiftly.client.standardclient.StandardClient` to a local
+:py:class:`swiftly.standin.StandinServer`. Run from the top of the
+source tree with::
+
+    python -m benchmarks
+
+Results are compared against ``benchmarks/baseline.json`` and any
+result more than the tolerance worse than its baseline is reported
+as a regression; ``--check`` makes that a non-zero exit. Baselines
+are machine specific, so regenerate them with ``--save-baseline``
+on the machine you compare on.
+
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
@@ -0,0 +1,124 @@
+"""
+Runs the Swiftly benchmarks; see :py:mod:`benchmarks` for details.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import optparse
+import os
+import sys
+
+from benchmarks.suite import BENCHMARKS, BenchmarkEnv, SkipBenchmark
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def run(names=None, repeat=3, scale=1.0):
+    """
+    Runs the benchmarks and returns a dict of name: (value, unit).
+    Each benchmark is run repeat times and the best value is kept.
+    """
+    results = {}
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        best = None
+        for x in range(repeat):
+            with BenchmarkEnv(scale=scale) as env:
+                try:
+                    value, unit = func(env)
+                except SkipBenchmark as err:
+                    best = (None, str(err))
+                    break
+            if best is None or value > best[0]:
+                best = (value, unit)
+        results[func.__name__] = best
+    return results
+
+
+def report(results, baseline, tolerance, fp=sys.stdout):
+    """
+    Writes the results compared to the baseline to fp and returns
+    the list of benchmark names that regressed more than tolerance.
+    """
+    regressions = []
+    for func in BENCHMARKS:
+        name = func.__name__
+        if name not in results:
+            continue
+        value, unit = results[name]
+        if value is None:
+            fp.write('%-30s %14s  skipped: %s\n' % (name, '-', unit))
+            continue
+        line = '%-30s %14.02f %-7s' % (name, value, unit)
+        base = baseline.get(name)
+        if base:
+            change = 100.0 * (value - base) / base
+            line += ' baseline %14.02f %+7.01f%%' % (base, change)
+            if value < base * (1 - tolerance):
+                line += '  REGRESSION'
+                regressions.append(name)
+        fp.write(line + '\n')
+    fp.flush()
+    return regressions
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage='Usage: python -m benchmarks [options] [name ...]')
+    parser.add_option(
+        '--baseline', metavar='PATH', default=DEFAULT_BASELINE,
+        help='The baseline results file. Default: %default')
+    parser.add_option(
+        '--save-baseline', action='store_true',
+        help='Stores the results as the new baseline.')
+    parser.add_option(
+        '--tolerance', metavar='PERCENT', type='float', default=20,
+        help='How much worse than the baseline a result can be before '
+             'it is reported as a regression. Default: %default')
+    parser.add_option(
+        '--check', action='store_true',
+        help='Exits non-zero if any regression is reported.')
+    parser.add_option(
+        '--repeat', metavar='INTEGER', type='int', default=3,
+        help='Runs each benchmark INTEGER times and keeps the best. '
+             'Default: %default')
+    parser.add_option(
+        '--scale', metavar='FLOAT', type='float', default=1.0,
+        help='Multiplies the amount of work each benchmark does. '
+             'Default: %default')
+    options, names = parser.parse_args(args)
+    results = run(names=names, repeat=options.repeat, scale=options.scale)
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as fp:
+            baseline = json.load(fp)
+    regressions = report(results, baseline, options.tolerance / 100.0)
+    if options.save_baseline:
+        baseline.update(
+            (name, round(value, 2)) for name, (value, unit) in results.items()
+            if value is not None)
+        with open(options.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=4, sort_keys=True)
+            fp.write('\n')
+    if regressions and options.check:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Fault-injection harness for the StandardClient retry path.
+
+Runs workloads against a :py:class:`swiftly.standin.StandinApp`
+injecting connection resets, slow headers, mid-body disconnects,
+stalled responses and 5xx storms and reports, for each scenario, the
+success rate, the average attempts per operation, the bytes read from
+request bodies that were wasted on failed attempts, and the latency
+of operations that needed retries. Run from the top of the source tree with::
+
+    python -m benchmarks.faults
+
+Retry backoff sleeps are scaled down by ``--backoff-scale`` so runs
+finish quickly; use ``--backoff-scale 1`` for real timings.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import optparse
+import sys
+import time
+
+from six import moves
+
+from benchmarks.suite import MB, _Body
+from swiftly.client import StandardClient
+from swiftly.standin import StandinApp, StandinServer
+
+
+class _CountingBody(object):
+    """
+    Wraps a request body counting the bytes read from it. With
+    seekable=False the body only offers read, like a pipe would.
+    """
+
+    def __init__(self, body, seekable=True):
+        self.body = body
+        self.bytes_read = 0
+        if seekable:
+            self.tell = body.tell
+            self.seek = body.seek
+
+    def read(self, size=-1):
+        chunk = self.body.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class Scenario(object):
+    """
+    Describes one fault-injection run.
+
+    :param name: The name reported for the scenario.
+    :param method: PUT or GET.
+    :param app_kwargs: Keyword args for the StandinApp.
+    :param size: The object size in bytes.
+    :param seekable: For PUTs, whether the body can be seeked.
+    :param client_kwargs: Additional keyword args for the
+        StandardClient, such as timeouts.
+    """
+
+    def __init__(self, name, method, app_kwargs, size=MB, seekable=True,
+                 client_kwargs=None):
+        self.name = name
+        self.method = method
+        self.app_kwargs = app_kwargs
+        self.size = size
+        self.seekable = seekable
+        self.client_kwargs = client_kwargs or {}
+
+
+#: The scenarios run by default, in order.
+SCENARIOS = [
+    Scenario('put resets', 'PUT', {'reset_rate': 0.2}),
+    Scenario('put resets, pipe', 'PUT', {'reset_rate': 0.2},
+             seekable=False),
+    Scenario('put 5xx storms', 'PUT',
+             {'error_rate': 0.05, 'storm_length': 3}),
+    Scenario('put 5xx storms, pipe', 'PUT',
+             {'error_rate': 0.05, 'storm_length': 3}, seekable=False),
+    Scenario('put slow headers', 'PUT',
+             {'slow_rate': 0.1, 'slow_seconds': 0.2}),
+    Scenario('put hung headers', 'PUT',
+             {'slow_rate': 0.1, 'slow_seconds': 5},
+             client_kwargs={'first_byte_timeout': 0.5}),
+    Scenario('get disconnects', 'GET', {'disconnect_rate': 0.2}),
+    Scenario('get stalls', 'GET', {'stall_rate': 0.1, 'slow_seconds': 5},
+             client_kwargs={'read_timeout': 0.5}),
+    Scenario('get 5xx storms', 'GET',
+             {'error_rate': 0.05, 'storm_length': 3})]
+
+
+def run_scenario(scenario, count=50, attempts=5, backoff_scale=0.01):
+    """
+    Runs a scenario and returns a dict of its measurements.
+    """
+    app = StandinApp(seed=1)
+    results = {
+        'ops': count, 'successes': 0, 'attempts': 0, 'wasted_bytes': 0,
+        'retried': 0, 'retry_latency': 0.0, 'max_retry_latency': 0.0}
+    with StandinServer(app) as server:
+        client = StandardClient(
+            auth_url=server.auth_url, auth_user='test:tester',
+            auth_key='testing', eventlet=False, attempts=attempts,
+            **scenario.client_kwargs)
+        client.sleep = lambda seconds: time.sleep(seconds * backoff_scale)
+        client.put_container('faults')
+        if scenario.method == 'GET':
+            for x in moves.range(count):
+                client.put_object(
+                    'faults', 'o%d' % x, _Body(scenario.size),
+                    headers={'content-length': str(scenario.size)})
+        for key, value in scenario.app_kwargs.items():
+            setattr(app, key, value)
+        for x in moves.range(count):
+            name = 'o%d' % x
+            before = app.request_count
+            begin = time.time()
+            body = None
+            try:
+                if scenario.method == 'PUT':
+                    body = _CountingBody(
+                        _Body(scenario.size), seekable=scenario.seekable)
+                    status, reason, headers, contents = client.put_object(
+                        'faults', name, body,
+                        headers={'content-length': str(scenario.size)})
+                else:
+                    status, reason, headers, contents = client.get_object(
+                        'faults', name, stream=False)
+                success = status // 100 == 2
+            except Exception:
+                client.reset()
+                success = False
+            elapsed = time.time() - begin
+            tries = app.request_count - before
+            results['attempts'] += tries
+            if success:
+                results['successes'] += 1
+            if body:
+                results['wasted_bytes'] += body.bytes_read - (
+                    scenario.size if success else 0)
+            if tries > 1:
+                results['retried'] += 1
+                results['retry_latency'] += elapsed
+                results['max_retry_latency'] = max(
+                    results['max_retry_latency'], elapsed)
+    return results
+
+
+def report(name, results, fp=sys.stdout):
+    fp.write(
+        '%-24s %6.01f%% ok %5.02f tries/op %8.02f MB wasted '
+        '%4d retried %6.03fs avg %6.03fs max\n' % (
+            name, 100.0 * results['successes'] / results['ops'],
+            float(results['attempts']) / results['ops'],
+            float(results['wasted_bytes']) / MB, results['retried'],
+            results['retry_latency'] / (results['retried'] or 1),
+            results['max_retry_latency']))
+    fp.flush()
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage='Usage: python -m benchmarks.faults [options] [name ...]')
+    parser.add_option(
+        '--count', type='int', default=50,
+        help='Operations per scenario. Default: %default')
+    parser.add_option(
+        '--attempts', type='int', default=5,
+        help='Client attempts per operation. Default: %default')
+    parser.add_option(
+        '--backoff-scale', type='float', default=0.01,
+        help='Multiplier for the client retry backoff sleeps. '
+             'Default: %default')
+    options, names = parser.parse_args(args)
+    for scenario in SCENARIOS:
+        if names and scenario.name not in names:
+            continue
+        report(scenario.name, run_scenario(
+            scenario, count=options.count, attempts=options.attempts,
+            backoff_scale=options.backoff_scale))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+The individual benchmarks run by ``python -m benchmarks``.
+
+Each benchmark is a function taking a :py:class:`BenchmarkEnv` and
+returning a tuple of (value, unit) where a higher value is better.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import io
+import time
+
+from six import moves
+
+from swiftly.client import StandardClient
+from swiftly.client.h2transport import H2SessionPool, HTTP2_Support
+from swiftly.dencrypt import AES256CBC_Support, aes_decrypt, aes_encrypt
+from swiftly.filelikeiter import FileLikeIter
+from swiftly.standin import StandinServer
+
+
+MB = 1024 * 1024
+
+
+class SkipBenchmark(Exception):
+    """
+    Raise this from a benchmark that cannot run in this environment.
+    """
+    pass
+
+
+class _Body(io.RawIOBase):
+    """
+    A cheap, seekable, readable body of size bytes.
+    """
+
+    def __init__(self, size, chunk=b'x' * 65536):
+        self.size = size
+        self.pos = 0
+        self.chunk = chunk
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        self.pos = pos
+        return pos
+
+    def read(self, size=-1):
+        if size < 0 or size > len(self.chunk):
+            size = len(self.chunk)
+        size = min(size, self.size - self.pos)
+        self.pos += size
+        return self.chunk[:size]
+
+
+class BenchmarkEnv(object):
+    """
+    Shared state for a benchmark run: a running stand-in server and
+    a way to create clients for it.
+
+    :param scale: Multiplier for the amount of work each benchmark
+        does; useful for quick smoke runs (< 1) or steadier numbers
+        (> 1).
+    """
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.server = StandinServer()
+
+    def __enter__(self):
+        self.server.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.server.stop()
+
+    def scaled(self, value):
+        return max(1, int(value * self.scale))
+
+    def client(self, **kwargs):
+        client = StandardClient(
+            auth_url=self.server.auth_url, auth_user='test:tester',
+            auth_key='testing', eventlet=False, **kwargs)
+        client.auth()
+        return client
+
+    def container(self, client, name):
+        status, reason, headers, contents = client.put_container(name)
+        if status // 100 != 2:
+            raise Exception('PUT container %r: %s %s' % (name, status, reason))
+        return name
+
+
+def _check(status, reason, what):
+    if status // 100 != 2:
+        raise Exception('%s: %s %s' % (what, status, reason))
+
+
+def small_object_ops(env, client=None):
+    """
+    PUT, GET, HEAD and DELETE of 1k objects through
+    StandardClient.request; reports operations per second.
+    """
+    client = client or env.client()
+    container = env.container(client, 'small')
+    body = b'x' * 1024
+    count = env.scaled(250)
+    begin = time.time()
+    for x in moves.range(count):
+        name = 'o%d' % x
+        _check(*client.put_object(container, name, body)[:2], what='PUT')
+        _check(*client.get_object(
+            container, name, stream=False)[:2], what='GET')
+        _check(*client.head_object(container, name)[:2], what='HEAD')
+        _check(*client.delete_object(container, name)[:2], what='DELETE')
+    return count * 4 / (time.time() - begin), 'ops/s'
+
+
+def small_object_ops_http2(env):
+    """
+    small_object_ops using HTTP/2; reports operations per second.
+    """
+    if not HTTP2_Support:
+        raise SkipBenchmark('h2 is not installed')
+    pool = H2SessionPool()
+    try:
+        return small_object_ops(env, env.client(http2=pool))
+    finally:
+        pool.close()
+
+
+def _upload(env, name, headers):
+    client = env.client()
+    container = env.container(client, 'large')
+    size = env.scaled(64) * MB
+    begin = time.time()
+    _check(*client.put_object(
+        container, name, _Body(size), headers=headers)[:2], what='PUT')
+    return size / MB / (time.time() - begin), 'MB/s'
+
+
+def large_upload_content_length(env):
+    """
+    PUT of a large object with a Content-Length; reports MB/s.
+    """
+    size = env.scaled(64) * MB
+    return _upload(env, 'cl', {'content-length': str(size)})
+
+
+def large_upload_chunked(env):
+    """
+    PUT of a large object with chunked transfer encoding; reports
+    MB/s.
+    """
+    return _upload(env, 'chunked', None)
+
+
+def large_download(env):
+    """
+    Streaming GET of a large object read in 64k chunks; reports MB/s.
+    """
+    client = env.client()
+    container = env.container(client, 'large')
+    size = env.scaled(64) * MB
+    _check(*client.put_object(
+        container, 'download', _Body(size),
+        headers={'content-length': str(size)})[:2], what='PUT')
+    begin = time.time()
+    status, reason, headers, contents = client.get_object(
+        container, 'download')
+    _check(status, reason, 'GET')
+    read = 0
+    chunk = contents.read(65536)
+    while chunk:
+        read += len(chunk)
+        chunk = contents.read(65536)
+    contents.close()
+    if read != size:
+        raise Exception('GET read %d of %d bytes' % (read, size))
+    return size / MB / (time.time() - begin), 'MB/s'
+
+
+def listing_pagination(env):
+    """
+    Pages through a container listing with limit=100; reports
+    listed names per second.
+    """
+    client = env.client()
+    container = env.container(client, 'listing')
+    count = env.scaled(2000)
+    for x in moves.range(count):
+        _check(*client.put_object(
+            container, 'o%06d' % x, b'')[:2], what='PUT')
+    begin = time.time()
+    listed = 0
+    marker = None
+    while True:
+        status, reason, headers, contents = client.get_container(
+            container, marker=marker, limit=100)
+        _check(status, reason, 'GET container')
+        if not contents:
+            break
+        listed += len(contents)
+        marker = contents[-1]['name']
+    if listed != count:
+        raise Exception('Listed %d of %d names' % (listed, count))
+    return listed / (time.time() - begin), 'names/s'
+
+
+def _aes_check():
+    if not AES256CBC_Support:
+        raise SkipBenchmark('PyCrypto is not installed')
+
+
+def aes_encrypt_throughput(env):
+    """
+    :py:func:`swiftly.dencrypt.aes_encrypt` throughput in MB/s.
+    """
+    _aes_check()
+    size = env.scaled(32) * MB
+    begin = time.time()
+    for chunk in aes_encrypt('key', _Body(size)):
+        pass
+    return size / MB / (time.time() - begin), 'MB/s'
+
+
+def aes_decrypt_throughput(env):
+    """
+    :py:func:`swiftly.dencrypt.aes_decrypt` throughput in MB/s.
+    """
+    _aes_check()
+    size = env.scaled(32) * MB
+    encrypted = io.BytesIO(b''.join(aes_encrypt('key', _Body(size))))
+    begin = time.time()
+    for chunk in aes_decrypt('key', encrypted):
+        pass
+    return size / MB / (time.time() - begin), 'MB/s'
+
+
+def filelikeiter_readline(env):
+    """
+    :py:meth:`swiftly.filelikeiter.FileLikeIter.readline` over 64k
+    chunks of 100 byte lines; reports MB/s.
+    """
+    chunk = ('x' * 99 + '\n') * 655
+    chunks = env.scaled(160)
+    fli = FileLikeIter(chunk for x in moves.range(chunks))
+    begin = time.time()
+    read = 0
+    line = fli.readline()
+    while line:
+        read += len(line)
+        line = fli.readline()
+    return read / MB / (time.time() - begin), 'MB/s'
+
+
+#: The benchmarks run by default, in order.
+BENCHMARKS = [
+    small_object_ops,
+    small_object_ops_http2,
+    large_upload_content_length,
+    large_upload_chunked,
+    large_download,
+    listing_pagination,
+    aes_encrypt_throughput,
+    aes_decrypt_throughput,
+    filelikeiter_readline]
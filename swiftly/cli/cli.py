@@ -33,12 +33,15 @@ from swiftly.cli.iomanager import IOManager
 from swiftly.cli.optionparser import OptionParser
 from swiftly.client import ClientManager, DirectClient, LocalClient, \
     StandardClient
+from swiftly.client.headcache import default_head_cache
+from swiftly.client.httpcache import HTTPCache
 
 
 #: The list of CLICommand classes avaiable to CLI. You'll want to add any new
 #: CLICommand you create to this list.
 COMMANDS = [
     'swiftly.cli.auth.CLIAuth',
+    'swiftly.cli.copy.CLICopy',
     'swiftly.cli.decrypt.CLIDecrypt',
     'swiftly.cli.delete.CLIDelete',
     'swiftly.cli.encrypt.CLIEncrypt',
@@ -175,6 +178,10 @@ configuration file variables.
             help='Uses the local file system method to access a fake Swift. '
                  'The PATH is the path on the local file system where the '
                  'fake Swift stores its data.')
+        self.option_parser.add_option(
+            '--local-dedup', dest='local_dedup', action='store_true',
+            help='With --local, stores objects with identical contents only '
+                 'once, as hard links to a single file.')
         self.option_parser.add_option(
             '-P', '--proxy', dest='proxy', metavar='URL',
             help='Uses the given HTTP proxy URL.')
@@ -199,7 +206,9 @@ configuration file variables.
             help='If set true, the storage URL and auth token are cached in '
                  'your OS temporary directory as <user>.swiftly for reuse. If '
                  'there are already cached values, they are used without '
-                 'authenticating first.')
+                 'authenticating first. The cache is shared by concurrent '
+                 'swiftly processes, so only one of them authenticates when '
+                 'a token expires or is rejected.')
         self.option_parser.add_option(
             '--no-cache-auth', dest='no_cache_auth', action='store_true',
             help='Disables the above cache-auth value if it had been set '
@@ -248,9 +257,73 @@ configuration file variables.
                  'will enable direct client to use this ring for all the '
                  'queries. Use of this also requires the main Swift code  '
                  'is installed and importable.')
+        self.option_parser.add_option(
+            '--direct-memcache', dest='direct_memcache', metavar='PATH',
+            help='Shares the account and container info cached in direct '
+                 'mode with other swiftly processes. If PATH is a UNIX '
+                 'socket, the memcached listening on it is used; python -m '
+                 'swiftly.client.unixmemcache PATH runs one. Otherwise PATH '
+                 'is a memory mapped cache file, created if needed.')
         self.option_parser.add_option(
             '-k', '--insecure', dest='insecure', action='store_true',
             help='Allows "insecure" SSL connections for python >= 2.7.9')
+        self.option_parser.add_option(
+            '--http2', dest='http2', action='store_true',
+            help='Uses HTTP/2 for storage requests, multiplexing concurrent '
+                 'requests over one connection per proxy. Requires the h2 '
+                 'package and a proxy, or load balancer in front of it, that '
+                 'speaks HTTP/2.')
+        self.option_parser.add_option(
+            '--connect-timeout', dest='connect_timeout', metavar='SECONDS',
+            help='How long to wait for a connection to be established. '
+                 'Default: 10')
+        self.option_parser.add_option(
+            '--first-byte-timeout', dest='first_byte_timeout',
+            metavar='SECONDS',
+            help='How long to wait, once a request has been sent, for the '
+                 'response to begin. Default: 300')
+        self.option_parser.add_option(
+            '--read-timeout', dest='read_timeout', metavar='SECONDS',
+            help='How long to wait for each write of a request body or read '
+                 'of a response body. Default: 60')
+        self.option_parser.add_option(
+            '--request-timeout', dest='request_timeout', metavar='SECONDS',
+            help='How long each attempt at a request may take overall, '
+                 'including transferring its body. Default: no limit')
+        self.option_parser.add_option(
+            '--hedge', dest='hedge', action='store_true',
+            help='Sends GET and HEAD requests again on another connection '
+                 'if their responses are slower to begin than 95% of recent '
+                 'responses, using whichever response begins first. At most '
+                 '5% of requests are sent twice.')
+        self.option_parser.add_option(
+            '--http-cache', dest='http_cache', metavar='PATH',
+            help='Caches GET responses in the directory given, up to 256M, '
+                 'and later GETs of the same paths only transfer the body if '
+                 'it has changed. The directory may be shared by concurrent '
+                 'swiftly processes.')
+        self.option_parser.add_option(
+            '--head-cache', dest='head_cache', metavar='SECONDS',
+            help='Answers repeated HEADs of the same paths from memory for '
+                 'up to SECONDS. Writes made by this swiftly process drop '
+                 'the results they affect, but changes made by others are '
+                 'not seen until the results expire. Default: 0, disabled')
+        self.option_parser.add_option(
+            '--pool-min', dest='pool_min', metavar='INTEGER',
+            help='Connects and authenticates this many clients before a '
+                 'bulk put, get, delete or copy starts, so its first '
+                 'requests do not all wait on new connections. Default: 0')
+        self.option_parser.add_option(
+            '--pool-max', dest='pool_max', metavar='INTEGER',
+            help='The most clients, and so connections, to use at once; '
+                 'actions wait for a client once this many are in use. Set '
+                 'it to at least the concurrency, or its square for nested '
+                 'actions such as putting a directory of segmented objects. '
+                 'Default: no limit')
+        self.option_parser.add_option(
+            '--pool-timeout', dest='pool_timeout', metavar='SECONDS',
+            help='How long an action waits for a client when pool-max are '
+                 'in use before failing. Default: no limit')
 
         self.option_parser.raw_epilog = 'Commands:\n'
         for name in sorted(self.commands):
@@ -315,20 +388,24 @@ configuration file variables.
 
         for option_name in (
                 'auth_url', 'auth_user', 'auth_key', 'auth_tenant',
-                'auth_methods', 'region', 'direct', 'local', 'proxy', 'snet',
-                'no_snet', 'retries', 'cache_auth', 'no_cache_auth', 'cdn',
-                'no_cdn', 'concurrency', 'eventlet', 'no_eventlet', 'verbose',
-                'no_verbose', 'direct_object_ring', 'insecure', 'bypass_url'):
+                'auth_methods', 'region', 'direct', 'local', 'local_dedup',
+                'proxy', 'snet', 'no_snet', 'retries', 'cache_auth',
+                'no_cache_auth', 'cdn', 'no_cdn', 'concurrency', 'eventlet',
+                'no_eventlet', 'verbose', 'no_verbose', 'direct_object_ring',
+                'direct_memcache', 'insecure', 'bypass_url', 'http2',
+                'connect_timeout', 'first_byte_timeout', 'read_timeout',
+                'request_timeout', 'hedge', 'http_cache', 'head_cache',
+                'pool_min', 'pool_max', 'pool_timeout'):
             self._resolve_option(options, option_name, 'swiftly')
         for option_name in (
                 'snet', 'no_snet', 'cache_auth', 'no_cache_auth', 'cdn',
                 'no_cdn', 'eventlet', 'no_eventlet', 'verbose', 'no_verbose',
-                'insecure'):
+                'insecure', 'http2', 'hedge', 'local_dedup'):
             if isinstance(getattr(options, option_name), six.string_types):
                 setattr(
                     options, option_name,
                     getattr(options, option_name).lower() in TRUE_VALUES)
-        for option_name in ('retries', 'concurrency'):
+        for option_name in ('retries', 'concurrency', 'pool_min', 'pool_max'):
             if isinstance(getattr(options, option_name), six.string_types):
                 setattr(
                     options, option_name, int(getattr(options, option_name)))
@@ -348,6 +425,8 @@ configuration file variables.
             options.no_cdn = False
         if options.concurrency is None:
             options.concurrency = 1
+        if options.pool_min is None:
+            options.pool_min = 0
         if options.eventlet is None:
             options.eventlet = False
         if options.no_eventlet is None:
@@ -358,6 +437,10 @@ configuration file variables.
             options.no_verbose = False
         if options.insecure is None:
             options.insecure = False
+        if options.http2 is None:
+            options.http2 = False
+        if options.hedge is None:
+            options.hedge = False
 
         self.context.eventlet = None
         if options.eventlet:
@@ -393,17 +476,34 @@ configuration file variables.
                 self._verbose, skip_sub_command=True)
 
         options.retries = int(options.retries)
+        head_cache = None
+        if options.head_cache and float(options.head_cache) > 0:
+            # Shared with the sub-commands of fordo, which each get their
+            # own CLI and ClientManager.
+            head_cache = default_head_cache(ttl=float(options.head_cache))
+        timeouts = {}
+        for option_name in (
+                'connect_timeout', 'first_byte_timeout', 'read_timeout',
+                'request_timeout'):
+            if getattr(options, option_name) is not None:
+                timeouts[option_name] = float(getattr(options, option_name))
+        pool = {'pool_min': options.pool_min, 'pool_max': options.pool_max}
+        if options.pool_timeout is not None:
+            pool['pool_timeout'] = float(options.pool_timeout)
         if args and args[0] == 'help':
             return options, args
         elif options.local:
             self.context.client_manager = ClientManager(
-                LocalClient, local_path=options.local, verbose=self._verbose)
+                LocalClient, local_path=options.local, verbose=self._verbose,
+                dedup=options.local_dedup, head_cache=head_cache, **pool)
         elif options.direct:
             self.context.client_manager = ClientManager(
                 DirectClient, swift_proxy_storage_path=options.direct,
                 attempts=options.retries + 1, eventlet=self.context.eventlet,
                 verbose=self._verbose,
-                direct_object_ring=options.direct_object_ring)
+                direct_object_ring=options.direct_object_ring,
+                memcache=options.direct_memcache, head_cache=head_cache,
+                **dict(timeouts, **pool))
         else:
             auth_cache_path = None
             if options.cache_auth:
@@ -415,6 +515,9 @@ configuration file variables.
                     fp.write('No Auth URL has been given.\n')
                     fp.flush()
                 return None, None
+            http_cache = None
+            if options.http_cache:
+                http_cache = HTTPCache(options.http_cache)
             self.context.client_manager = ClientManager(
                 StandardClient, auth_methods=options.auth_methods,
                 auth_url=options.auth_url, auth_tenant=options.auth_tenant,
@@ -423,7 +526,9 @@ configuration file variables.
                 snet=options.snet, attempts=options.retries + 1,
                 eventlet=self.context.eventlet, verbose=self._verbose,
                 http_proxy=options.proxy, insecure=options.insecure,
-                bypass_url=options.bypass_url)
+                bypass_url=options.bypass_url, http2=options.http2,
+                hedge=options.hedge, http_cache=http_cache,
+                head_cache=head_cache, **dict(timeouts, **pool))
 
         self.context.cdn = options.cdn
         self.context.concurrency = int(options.concurrency)
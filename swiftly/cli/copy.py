@@ -0,0 +1,372 @@
+"""
+Contains a CLICommand that can copy objects within the cluster.
+
+Uses the following from :py:class:`swiftly.cli.context.CLIContext`:
+
+==============  =====================================================
+cdn             True if the CDN Management URL should be used instead
+                of the Storage URL.
+client_manager  For connecting to Swift.
+concurrency     The number of concurrent actions that can be
+                performed.
+headers         A dict of headers to send with each copy.
+ignore_404      True if 404s should be silently ignored.
+io_manager      For directing output.
+prefix          For container copies, only objects whose names begin
+                with this prefix are copied.
+query           A dict of query parameters to send with each copy.
+use_copy        True to copy with COPY requests rather than PUTs with
+                X-Copy-From headers.
+==============  =====================================================
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import time
+
+import six
+from six.moves.urllib.parse import unquote
+
+from swiftly.cli.cli import TRUE_VALUES
+from swiftly.cli.command import CLICommand, ReturnCode
+from swiftly.cli.put import cli_put_container, _create_container, \
+    _get_manifest_body, _get_segment_path
+from swiftly.concurrency import Concurrency
+
+
+COPIED_HEADERS = ('content-disposition', 'content-encoding', 'content-type')
+"""The headers, besides X-Object-Meta-*, kept by a segmented copy."""
+
+
+def _get_segments(context, client, path, headers):
+    """
+    Returns the list of (path, size, etag) of the segments of the
+    large object at path, whose HEAD response headers are given, or
+    None if it is not a large object.
+    """
+    if headers.get('x-static-large-object', '').lower() in TRUE_VALUES:
+        status, reason, hdrs, contents = client.get_object(
+            *path.split('/', 1), stream=False,
+            query={'multipart-manifest': 'get'}, cdn=context.cdn)
+        if status // 100 != 2:
+            raise ReturnCode(
+                'getting manifest %r: %s %s' % (path, status, reason))
+        if isinstance(contents, six.binary_type):
+            contents = contents.decode('utf8')
+        return [
+            (item['name'].lstrip('/'), item['bytes'], item['hash'])
+            for item in json.loads(contents)]
+    if headers.get('x-object-manifest'):
+        container, prefix = unquote(
+            headers['x-object-manifest']).split('/', 1)
+        segments = []
+        marker = None
+        while True:
+            status, reason, hdrs, contents = client.get_container(
+                container, prefix=prefix, marker=marker, cdn=context.cdn)
+            if status // 100 != 2:
+                raise ReturnCode(
+                    'listing segments of %r: %s %s' % (path, status, reason))
+            if not contents:
+                break
+            segments.extend(
+                ('%s/%s' % (container, item['name']), item['bytes'],
+                 item['hash'])
+                for item in contents)
+            marker = contents[-1]['name']
+        return segments
+    return None
+
+
+def _copy_segment(context, path, new_path, size):
+    """
+    Copies a segment for :py:func:`cli_copy_object`, returning the
+    (size, etag) of the copy.
+    """
+    with context.client_manager.with_client() as client:
+        status, reason, headers, contents = client.copy_object(
+            *(path.split('/', 1) + new_path.split('/', 1)),
+            cdn=context.cdn, method='COPY' if context.use_copy else 'PUT')
+        if hasattr(contents, 'read'):
+            contents.read()
+    if status // 100 != 2:
+        raise ReturnCode(
+            'copying segment %r to %r: %s %s' %
+            (path, new_path, status, reason))
+    return size, headers.get('etag', '').strip('"')
+
+
+def cli_copy_object(context, path, new_path):
+    """
+    Copies the object at path to new_path.
+
+    Large objects, unless context.query has multipart-manifest=get,
+    are copied segment by segment: each segment is copied into the new
+    object's own segments container, named as ``put`` would have named
+    it, and a manifest of the same kind is made referring to them. So
+    objects larger than the cluster's maximum object size can be
+    copied, and the copy does not depend on the original's segments.
+
+    See :py:mod:`swiftly.cli.copy` for context usage information.
+
+    See :py:class:`CLICopy` for more information.
+    """
+    method = 'COPY' if context.use_copy else 'PUT'
+    segments = None
+    if context.query.get('multipart-manifest') != 'get':
+        with context.client_manager.with_client() as client:
+            status, reason, headers, contents = client.head_object(
+                *path.split('/', 1), cdn=context.cdn)
+            if status // 100 != 2:
+                if status == 404 and context.ignore_404:
+                    return
+                raise ReturnCode(
+                    'heading object %r: %s %s' % (path, status, reason))
+            segments = _get_segments(context, client, path, headers)
+    if segments is None:
+        with context.client_manager.with_client() as client:
+            status, reason, headers, contents = client.copy_object(
+                *(path.split('/', 1) + new_path.split('/', 1)),
+                headers=context.headers, query=context.query,
+                cdn=context.cdn, method=method)
+            if hasattr(contents, 'read'):
+                contents.read()
+        if status // 100 != 2:
+            if status == 404 and context.ignore_404:
+                return
+            raise ReturnCode(
+                'copying object %r to %r: %s %s' %
+                (path, new_path, status, reason))
+        return
+    new_context = context.copy()
+    new_context.query = {}
+    new_context.static_segments = not headers.get('x-object-manifest')
+    prefix = _create_container(
+        new_context, new_path,
+        headers.get('x-object-meta-mtime') or time.time(),
+        headers.get('content-length') or 0)
+    context.client_manager.warm()
+    conc = Concurrency(context.concurrency)
+    path2info = {}
+    for segment, (segment_path, size, etag) in enumerate(segments):
+        new_segment_path = _get_segment_path(prefix, segment)
+        for (ident, (exc_type, exc_value, exc_tb, result)) in \
+                six.iteritems(conc.get_results()):
+            if exc_value:
+                conc.join()
+                raise exc_value
+            path2info[ident] = result
+        conc.spawn(
+            new_segment_path, _copy_segment, context, segment_path,
+            new_segment_path, size)
+    conc.join()
+    for (ident, (exc_type, exc_value, exc_tb, result)) in \
+            six.iteritems(conc.get_results()):
+        if exc_value:
+            raise exc_value
+        path2info[ident] = result
+    put_headers = {}
+    if context.headers.get('x-fresh-metadata', '').lower() not in \
+            TRUE_VALUES:
+        put_headers.update(
+            (k, v) for k, v in six.iteritems(headers)
+            if k.startswith('x-object-meta-') or k in COPIED_HEADERS)
+    put_headers.update(
+        (k, v) for k, v in six.iteritems(context.headers)
+        if k != 'x-fresh-metadata')
+    body = _get_manifest_body(new_context, prefix, path2info, put_headers)
+    with context.client_manager.with_client() as client:
+        status, reason, headers, contents = client.put_object(
+            *new_path.split('/', 1), contents=body, headers=put_headers,
+            query=new_context.query, cdn=context.cdn)
+        if hasattr(contents, 'read'):
+            contents.read()
+    if status // 100 != 2:
+        raise ReturnCode(
+            'putting manifest %r: %s %s' % (new_path, status, reason))
+
+
+def cli_copy_container(context, path, new_path):
+    """
+    Copies the objects in the container at path, those whose names
+    begin with context.prefix if it is set, to new_path. The new_path
+    may be just a container, which is created if needed, or a
+    container/prefix to put in place of context.prefix in the names of
+    the copies.
+
+    See :py:mod:`swiftly.cli.copy` for context usage information.
+
+    See :py:class:`CLICopy` for more information.
+    """
+    prefix = context.prefix or ''
+    new_container, slash, new_prefix = new_path.partition('/')
+    if not slash:
+        new_prefix = prefix
+    if new_container == path and new_prefix.startswith(prefix):
+        raise ReturnCode(
+            'copying container %r to %r would copy the copies' %
+            (path, new_path))
+    new_context = context.copy()
+    new_context.input_ = None
+    new_context.headers = {}
+    new_context.query = {}
+    cli_put_container(new_context, new_container)
+    context.client_manager.warm()
+    conc = Concurrency(context.concurrency)
+    failures = []
+
+    def check_conc():
+        for (exc_type, exc_value, exc_tb, result) in \
+                six.itervalues(conc.get_results()):
+            if exc_value:
+                failures.append(exc_value)
+                with context.io_manager.with_stderr() as fp:
+                    fp.write(str(exc_value))
+                    fp.write('\n')
+                    fp.flush()
+
+    marker = None
+    while True:
+        with context.client_manager.with_client() as client:
+            status, reason, headers, contents = client.get_container(
+                path, prefix=prefix, marker=marker, cdn=context.cdn)
+        if status // 100 != 2:
+            if status == 404 and context.ignore_404:
+                return
+            raise ReturnCode(
+                'listing container %r: %s %s' % (path, status, reason))
+        if not contents:
+            break
+        for item in contents:
+            object_path = '%s/%s' % (path, item['name'])
+            new_object_path = '%s/%s%s' % (
+                new_container, new_prefix, item['name'][len(prefix):])
+            check_conc()
+            conc.spawn(
+                object_path, cli_copy_object, context, object_path,
+                new_object_path)
+        marker = contents[-1]['name']
+    conc.join()
+    check_conc()
+    if failures:
+        raise ReturnCode(
+            'copying container %r: %d objects failed' %
+            (path, len(failures)))
+
+
+def cli_copy(context, path, new_path, recursive=False):
+    """
+    Copies the object at path to new_path or, if recursive is True
+    and path is a container, the objects in the container.
+
+    See :py:mod:`swiftly.cli.copy` for context usage information.
+
+    See :py:class:`CLICopy` for more information.
+
+    :param context: The :py:class:`swiftly.cli.context.CLIContext` to
+        use.
+    :param path: The path of the object or container to copy.
+    :param new_path: The path to copy to. For an object, this may be
+        just a container, in which case the copy keeps the object's
+        name.
+    :param recursive: Must be True to copy a container's objects.
+    """
+    path = path.lstrip('/')
+    new_path = new_path.lstrip('/')
+    if not path or not new_path:
+        raise ReturnCode('copying requires a path and a new path')
+    if '/' not in path.rstrip('/'):
+        if not recursive:
+            raise ReturnCode(
+                'copying container %r requires --recursive' % path)
+        cli_copy_container(context, path.rstrip('/'), new_path)
+    else:
+        if '/' not in new_path.rstrip('/'):
+            new_path = '%s/%s' % (new_path.rstrip('/'), path.split('/', 1)[1])
+        cli_copy_object(context, path, new_path)
+
+
+class CLICopy(CLICommand):
+    """
+    A CLICommand that can copy objects within the cluster.
+
+    See the output of ``swiftly help copy`` for more information.
+    """
+
+    def __init__(self, cli):
+        super(CLICopy, self).__init__(
+            cli, 'copy', min_args=2, max_args=2, usage="""
+Usage: %prog [main_options] copy [options] <path> <new_path>
+
+For help on [main_options] run %prog with no args.
+
+Copies the object at <path> to <new_path> within the cluster; the contents do
+not pass through Swiftly. If <new_path> is just a container, the copy keeps the
+object's name.
+
+With --recursive, <path> may be a container and each of its objects is copied
+into the <new_path> container, which is created if needed. With --prefix, only
+the objects whose names begin with PREFIX are copied, and a <new_path> of
+container/new-prefix puts new-prefix in place of PREFIX in the names of the
+copies.
+
+Segmented objects are copied segment by segment: each segment is copied into
+the new object's own "_segments" container, named as put would have named it,
+and a new manifest of the same kind is made referring to them. So objects
+larger than the cluster's maximum object size can be copied, and the copy does
+not depend on the original's segments. Use -qmultipart-manifest=get to copy
+just the manifest instead.""".strip())
+        self.option_parser.add_option(
+            '-h', '-H', '--header', dest='header', action='append',
+            metavar='HEADER:VALUE',
+            help='Add a header to the copy requests. This can be used '
+                 'multiple times for multiple headers. The copies keep the '
+                 'metadata of the originals, updated with any given, unless '
+                 'the header X-Fresh-Metadata:true is also given. Examples: '
+                 '-hx-object-meta-color:blue -h "Content-Type: text/html"')
+        self.option_parser.add_option(
+            '-q', '--query', dest='query', action='append',
+            metavar='NAME[=VALUE]',
+            help='Add a query parameter to the copy requests. This can be '
+                 'used multiple times for multiple query parameters. '
+                 'Example: -qmultipart-manifest=get')
+        self.option_parser.add_option(
+            '--recursive', dest='recursive', action='store_true',
+            help='Allows <path> to be a container, copying each of its '
+                 'objects.')
+        self.option_parser.add_option(
+            '-p', '--prefix', dest='prefix',
+            help='With --recursive, copies only the objects whose names '
+                 'begin with PREFIX.')
+        self.option_parser.add_option(
+            '--use-copy', dest='use_copy', action='store_true',
+            help='Copies with COPY requests and Destination headers rather '
+                 'than PUT requests and X-Copy-From headers; some proxies '
+                 'only support one of the two.')
+        self.option_parser.add_option(
+            '--ignore-404', dest='ignore_404', action='store_true',
+            help='Ignores 404 Not Found responses; the exit code will be 0 '
+                 'instead of 1.')
+
+    def __call__(self, args):
+        options, args, context = self.parse_args_and_create_context(args)
+        context.headers = self.options_list_to_lowered_dict(options.header)
+        context.query = self.options_list_to_lowered_dict(options.query)
+        context.prefix = options.prefix
+        context.use_copy = options.use_copy
+        context.ignore_404 = options.ignore_404
+        return cli_copy(
+            context, args[0], args[1], recursive=options.recursive)
@@ -99,6 +99,7 @@ def cli_empty_container(context, path, until_empty=False):
     See :py:class:`CLIDelete` for more information.
     """
     path = path.rstrip('/').decode('utf8')
+    context.client_manager.warm()
     conc = Concurrency(context.concurrency)
 
     def check_conc():
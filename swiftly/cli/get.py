@@ -216,6 +216,8 @@ def cli_get_container_listing(context, path=None):
         with context.io_manager.with_stdout() as fp:
             context.write_headers(
                 fp, headers, context.muted_container_headers)
+    if context.all_objects:
+        context.client_manager.warm()
     conc = Concurrency(context.concurrency)
     while contents:
         if context.all_objects:
@@ -343,10 +345,16 @@ def cli_get(context, path=None):
                 context.write_headers(
                     fp, headers, context.muted_object_headers)
                 fp.write('\n')
-            chunk = contents.read(65536)
-            while chunk:
-                fp.write(chunk)
+            if isinstance(contents, FileLikeIter):
+                # Such as direct mode responses; their chunks are written
+                # as they are rather than copied into reads.
+                for chunk in contents:
+                    fp.write(chunk)
+            else:
                 chunk = contents.read(65536)
+                while chunk:
+                    fp.write(chunk)
+                    chunk = contents.read(65536)
             fp.flush()
 
 
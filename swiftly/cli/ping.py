@@ -131,6 +131,89 @@ def _cli_ping_objects(context, heading, conc, container, objects, func,
                             time.time()))
 
 
+class _PingStats(object):
+    """
+    Streaming aggregate of ping request timings.
+
+    Each :py:meth:`add` is O(1) and only a count, a sum, the worst
+    timing with its transaction id, and a histogram of timings in
+    :py:attr:`resolution` second buckets are kept, so memory use does
+    not grow with the ping count.
+    """
+
+    #: The width in seconds of each histogram bucket.
+    resolution = 0.01
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.worst_xid = None
+        self.histogram = collections.defaultdict(lambda: 0)
+
+    def add(self, elapsed, xid):
+        """
+        Records a single request timing and its transaction id.
+        """
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.worst or self.worst_xid is None:
+            self.worst = elapsed
+            self.worst_xid = xid
+        self.histogram[int(elapsed / self.resolution)] += 1
+
+    def merge(self, other):
+        """
+        Folds the timings of another _PingStats into this one.
+        """
+        self.count += other.count
+        self.total += other.total
+        if other.worst > self.worst or self.worst_xid is None:
+            self.worst = other.worst
+            self.worst_xid = other.worst_xid
+        for bucket, count in six.iteritems(other.histogram):
+            self.histogram[bucket] += count
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def count_past(self, threshold):
+        """
+        Returns the number of timings past the threshold, to within
+        the histogram :py:attr:`resolution`.
+        """
+        return sum(
+            count for bucket, count in six.iteritems(self.histogram)
+            if bucket * self.resolution > threshold)
+
+
+def _cli_ping_results():
+    return {
+        'overall': [],
+        'node': collections.defaultdict(_PingStats),
+        'device': collections.defaultdict(_PingStats),
+        'zone': collections.defaultdict(_PingStats)}
+
+
+def _cli_ping_record(context, results, client, container, obj, headers,
+                     elapsed):
+    xid = headers.get('x-trans-id') or obj
+    results['overall'].append((elapsed, xid))
+    if context.object_ring:
+        for node in context.object_ring.get_nodes(
+                client.get_account_hash(), container, obj)[1]:
+            results['node'][node['ip']].add(elapsed, xid)
+            results['device'][
+                '%s:%s/%s' % (node['ip'], node['port'], node['device'])
+            ].add(elapsed, xid)
+            if 'region' in node:
+                zone = 'r%sz%s' % (node['region'], node['zone'])
+            else:
+                zone = 'z%s' % node['zone']
+            results['zone'][zone].add(elapsed, xid)
+
+
 def _cli_ping_object_put(context, results, container, obj):
     with context.client_manager.with_client() as client:
         begin = time.time()
@@ -145,12 +228,8 @@ def _cli_ping_object_put(context, results, container, obj):
                 'putting object %r: %s %s %s' %
                 (obj, status, reason, headers.get('x-trans-id') or '-'))
         elapsed = time.time() - begin
-        results['overall'].append((elapsed, headers.get('x-trans-id') or obj))
-        if context.object_ring:
-            for node in context.object_ring.get_nodes(
-                    client.get_account_hash(), container, obj)[1]:
-                results[node['ip']].append(
-                    (elapsed, headers.get('x-trans-id') or obj))
+        _cli_ping_record(
+            context, results, client, container, obj, headers, elapsed)
 
 
 def _cli_ping_object_get(context, results, container, obj):
@@ -167,12 +246,8 @@ def _cli_ping_object_get(context, results, container, obj):
                 'getting object %r: %s %s %s' %
                 (obj, status, reason, headers.get('x-trans-id') or '-'))
         elapsed = time.time() - begin
-        results['overall'].append((elapsed, headers.get('x-trans-id') or obj))
-        if context.object_ring:
-            for node in context.object_ring.get_nodes(
-                    client.get_account_hash(), container, obj)[1]:
-                results[node['ip']].append(
-                    (elapsed, headers.get('x-trans-id') or obj))
+        _cli_ping_record(
+            context, results, client, container, obj, headers, elapsed)
 
 
 def _cli_ping_object_delete(context, results, container, obj):
@@ -189,57 +264,44 @@ def _cli_ping_object_delete(context, results, container, obj):
                 'deleting object %r: %s %s %s' %
                 (obj, status, reason, headers.get('x-trans-id') or '-'))
         elapsed = time.time() - begin
-        results['overall'].append((elapsed, headers.get('x-trans-id') or obj))
-        if context.object_ring:
-            for node in context.object_ring.get_nodes(
-                    client.get_account_hash(), container, obj)[1]:
-                results[node['ip']].append(
-                    (elapsed, headers.get('x-trans-id') or obj))
+        _cli_ping_record(
+            context, results, client, container, obj, headers, elapsed)
 
 
-def _cli_ping_ring_report(context, timings_dict, label):
-    timings_dict.pop('overall', None)  # Not currently used in this function
-    if not timings_dict:
+def _cli_ping_ring_report(context, results, label):
+    nodes = results['node']
+    if not nodes:
         return
-    worsts = {}
-    for ip, timings in six.iteritems(timings_dict):
-        worst = [0, None]
-        for timing in timings:
-            if timing[0] > worst[0]:
-                worst = timing
-        worsts[ip] = worst
-    with context.io_manager.with_stdout() as fp:
-        fp.write(
-            'Worst %s times for up to %d nodes with implied usage:\n' %
-            (label, context.limit))
-        for ip, (elapsed, xid) in sorted(
-                six.iteritems(worsts), key=lambda x: x[1][0],
-                reverse=True)[:context.limit]:
-            fp.write('    %20s % 6.02fs %s\n' % (ip, elapsed, xid))
-        fp.flush()
+    for level, plural in (
+            ('node', 'nodes'), ('device', 'devices'), ('zone', 'zones')):
+        with context.io_manager.with_stdout() as fp:
+            fp.write(
+                'Worst %s times for up to %d %s with implied usage:\n' %
+                (label, context.limit, plural))
+            for name, stats in sorted(
+                    six.iteritems(results[level]), key=lambda x: x[1].worst,
+                    reverse=True)[:context.limit]:
+                fp.write(
+                    '    %20s % 6.02fs %s\n' %
+                    (name, stats.worst, stats.worst_xid))
+            fp.flush()
     with context.io_manager.with_stdout() as fp:
-        averages = {}
-        for ip, timings in six.iteritems(timings_dict):
-            averages[ip] = sum(t[0] for t in timings) / len(timings)
         fp.write(
             'Average %s times for up to %d nodes with implied usage:\n' %
             (label, context.limit))
-        for ip, elapsed in sorted(
-                six.iteritems(averages), key=lambda x: x[1],
+        for ip, stats in sorted(
+                six.iteritems(nodes), key=lambda x: x[1].average,
                 reverse=True)[:context.limit]:
-            fp.write('    %20s % 6.02fs\n' % (ip, elapsed))
+            fp.write('    %20s % 6.02fs\n' % (ip, stats.average))
         fp.flush()
-    total = 0.0
-    count = 0
-    for ip, timings in six.iteritems(timings_dict):
-        total += sum(t[0] for t in timings)
-        count += len(timings)
+    total = sum(stats.total for stats in six.itervalues(nodes))
+    count = sum(stats.count for stats in six.itervalues(nodes))
     threshold = total / count * context.threshold
-    counts = collections.defaultdict(lambda: 0)
-    for ip, timings in six.iteritems(timings_dict):
-        for t in timings:
-            if t[0] > threshold:
-                counts[ip] += 1
+    counts = {}
+    for ip, stats in six.iteritems(nodes):
+        past = stats.count_past(threshold)
+        if past:
+            counts[ip] = past
     with context.io_manager.with_stdout() as fp:
         fp.write(
             'Count of %s times past (average * %d) for up to %d nodes with '
@@ -252,8 +314,7 @@ def _cli_ping_ring_report(context, timings_dict, label):
     percentages = {}
     for ip, count in six.iteritems(counts):
         percentages[ip] = (
-            100.0 * count / len(timings_dict[ip]),
-            count, len(timings_dict[ip]))
+            100.0 * count / nodes[ip].count, count, nodes[ip].count)
     with context.io_manager.with_stdout() as fp:
         fp.write(
             'Percentage of %s times past (average * %d) for up to %d nodes '
@@ -283,9 +344,9 @@ def cli_ping(context, prefix):
     """
     if not prefix:
         prefix = 'swiftly-ping'
-    ping_ring_object_puts = collections.defaultdict(lambda: [])
-    ping_ring_object_gets = collections.defaultdict(lambda: [])
-    ping_ring_object_deletes = collections.defaultdict(lambda: [])
+    ping_ring_object_puts = _cli_ping_results()
+    ping_ring_object_gets = _cli_ping_results()
+    ping_ring_object_deletes = _cli_ping_results()
     context.ping_begin = context.ping_begin_last = time.time()
     container = prefix + '-' + uuid.uuid4().hex
     objects = [uuid.uuid4().hex for x in moves.range(context.ping_count)]
@@ -351,16 +412,14 @@ def cli_ping(context, prefix):
         elif not context.graphite:
             fp.write('%.02fs\n' % (end - context.ping_begin))
         fp.flush()
-    ping_ring_overall = collections.defaultdict(lambda: [])
-    _cli_ping_ring_report(context, ping_ring_object_puts, 'PUT')
-    for ip, timings in six.iteritems(ping_ring_object_puts):
-        ping_ring_overall[ip].extend(timings)
-    _cli_ping_ring_report(context, ping_ring_object_gets, 'GET')
-    for ip, timings in six.iteritems(ping_ring_object_gets):
-        ping_ring_overall[ip].extend(timings)
-    _cli_ping_ring_report(context, ping_ring_object_deletes, 'DELETE')
-    for ip, timings in six.iteritems(ping_ring_object_deletes):
-        ping_ring_overall[ip].extend(timings)
+    ping_ring_overall = _cli_ping_results()
+    for label, results in (
+            ('PUT', ping_ring_object_puts), ('GET', ping_ring_object_gets),
+            ('DELETE', ping_ring_object_deletes)):
+        _cli_ping_ring_report(context, results, label)
+        for level in ('node', 'device', 'zone'):
+            for name, stats in six.iteritems(results[level]):
+                ping_ring_overall[level][name].merge(stats)
     _cli_ping_ring_report(context, ping_ring_overall, 'overall')
 
 
@@ -390,8 +449,9 @@ swiftly-ping).""".strip())
         self.option_parser.add_option(
             '-o', '--object-ring', dest='object_ring',
             help='The current object ring of the cluster being pinged. This '
-                 'will enable output of which nodes are involved in the '
-                 'object requests and their implied behavior. Use of this '
+                 'will enable output of which nodes, devices, and zones are '
+                 'involved in the object requests and their implied '
+                 'behavior. Use of this '
                  'also requires the main Swift code is installed and '
                  'importable.')
         self.option_parser.add_option(
@@ -58,6 +58,7 @@ import time
 from swiftly.cli.command import CLICommand, ReturnCode
 from swiftly.concurrency import Concurrency
 from swiftly.dencrypt import AES256CBC, aes_encrypt
+from swiftly.client.replaybuffer import ReplayBuffer
 from swiftly.filelikeiter import FileLikeIter
 
 
@@ -87,6 +88,7 @@ def cli_put_directory_structure(context, path):
     ilen = len(context.input_)
     if not context.input_.endswith(os.sep):
         ilen += 1
+    context.client_manager.warm()
     conc = Concurrency(context.concurrency)
     for (dirpath, dirnames, filenames) in os.walk(context.input_):
         if not dirnames and not filenames:
@@ -228,11 +230,18 @@ def cli_put_object(context, path):
                 segment_body.reset_limit()
                 segment_n += 1
             body = _get_manifest_body(context, prefix, path2info, put_headers)
+        elif context.encrypt:
+            # Encrypting makes the body unseekable again; the client
+            # records the encrypted body itself for any retry.
+            body = stdin if context.stdin is None else context.stdin
         else:
-            if hasattr(context, 'stdin'):
-                body = context.stdin
+            # Record what is sent so a failed attempt can be retried;
+            # stdin segments are never larger than the segment size.
+            if context.stdin is not None:
+                body = ReplayBuffer(
+                    context.stdin, max_size=context.segment_size)
             else:
-                body = stdin
+                body = ReplayBuffer(stdin)
     elif context.seek is not None:
         if context.encrypt:
             raise ReturnCode(
@@ -284,6 +293,7 @@ def cli_put_object(context, path):
                     'putting object %r: Cannot use encryption for objects '
                     'greater than the segment size' % path)
             prefix = _create_container(context, path, l_mtime, size)
+            context.client_manager.warm()
             conc = Concurrency(context.concurrency)
             start = 0
             segment = 0
@@ -38,6 +38,11 @@ class Client(object):
         self.user_agent = 'Swiftly v%s' % VERSION
         #: These HTTP methods do not allow contents
         self.no_content_methods = ['COPY', 'DELETE', 'GET', 'HEAD']
+        #: Set to a :py:class:`swiftly.client.headcache.HeadCache` to
+        #: answer repeated HEADs without headers or query values from
+        #: it; writes through this client drop the results they could
+        #: change.
+        self.head_cache = None
 
     def reset(self):
         """
@@ -111,6 +116,36 @@ class Client(object):
         # them.
         return container + '/' + quote(obj)
 
+    def _head(self, path, headers, query, cdn):
+        cache = self.head_cache
+        if not cache or headers or query:
+            return self.request(
+                'HEAD', path, '', headers, query=query, cdn=cdn)
+        key = (cdn, path)
+        result = cache.get(key)
+        if result is None:
+            generation = cache.generation
+            result = self.request(
+                'HEAD', path, '', headers, query=query, cdn=cdn)
+            if result[0] // 100 == 2 or result[0] == 404:
+                cache.set(key, result, generation)
+        status, reason, hdrs, contents = result
+        return status, reason, dict(hdrs), contents
+
+    def _write(self, method, path, contents, headers, query, cdn,
+               written=None):
+        # written is the path changed, if it is not the path requested.
+        try:
+            return self.request(
+                method, path, contents, headers, query=query, cdn=cdn)
+        finally:
+            if self.head_cache:
+                if query:
+                    # Bulk operations can change anything.
+                    self.head_cache.clear()
+                else:
+                    self.head_cache.invalidate((cdn, written or path))
+
     def head_account(self, headers=None, query=None, cdn=False):
         """
         HEADs the account and returns the results. Useful headers
@@ -144,8 +179,7 @@ class Client(object):
                 list.
             :contents: is the str for the HTTP body.
         """
-        return self.request(
-            'HEAD', '', '', headers, query=query, cdn=cdn)
+        return self._head('', headers, query, cdn)
 
     def get_account(self, headers=None, prefix=None, delimiter=None,
                     marker=None, end_marker=None, limit=None, query=None,
@@ -257,8 +291,7 @@ class Client(object):
                 list.
             :contents: is the str for the HTTP body.
         """
-        return self.request(
-            'PUT', '', body or '', headers, query=query, cdn=cdn)
+        return self._write('PUT', '', body or '', headers, query, cdn)
 
     def post_account(self, headers=None, query=None, cdn=False, body=None):
         """
@@ -284,8 +317,7 @@ class Client(object):
                 list.
             :contents: is the str for the HTTP body.
         """
-        return self.request(
-            'POST', '', body or '', headers, query=query, cdn=cdn)
+        return self._write('POST', '', body or '', headers, query, cdn)
 
     def delete_account(self, headers=None,
                        yes_i_mean_delete_the_account=False, query=None,
@@ -329,8 +361,7 @@ class Client(object):
                 not body or not query or 'bulk-delete' not in query):
             return (0, 'yes_i_mean_delete_the_account was not set to True', {},
                     '')
-        return self.request(
-            'DELETE', '', body or '', headers, query=query, cdn=cdn)
+        return self._write('DELETE', '', body or '', headers, query, cdn)
 
     def head_container(self, container, headers=None, query=None, cdn=False):
         """
@@ -365,8 +396,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._container_path(container)
-        return self.request(
-            'HEAD', path, '', headers, query=query, cdn=cdn)
+        return self._head(path, headers, query, cdn)
 
     def get_container(self, container, headers=None, prefix=None,
                       delimiter=None, marker=None, end_marker=None,
@@ -482,8 +512,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._container_path(container)
-        return self.request(
-            'PUT', path, body or '', headers, query=query, cdn=cdn)
+        return self._write('PUT', path, body or '', headers, query, cdn)
 
     def post_container(self, container, headers=None, query=None, cdn=False,
                        body=None):
@@ -512,8 +541,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._container_path(container)
-        return self.request(
-            'POST', path, body or '', headers, query=query, cdn=cdn)
+        return self._write('POST', path, body or '', headers, query, cdn)
 
     def delete_container(self, container, headers=None, query=None, cdn=False,
                          body=None):
@@ -538,8 +566,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._container_path(container)
-        return self.request(
-            'DELETE', path, body or '', headers, query=query, cdn=cdn)
+        return self._write('DELETE', path, body or '', headers, query, cdn)
 
     def head_object(self, container, obj, headers=None, query=None, cdn=False):
         """
@@ -562,8 +589,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._object_path(container, obj)
-        return self.request(
-            'HEAD', path, '', headers, query=query, cdn=cdn)
+        return self._head(path, headers, query, cdn)
 
     def get_object(self, container, obj, headers=None, stream=True, query=None,
                    cdn=False):
@@ -636,8 +662,55 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._object_path(container, obj)
-        return self.request(
-            'PUT', path, contents, headers, query=query, cdn=cdn)
+        return self._write('PUT', path, contents, headers, query, cdn)
+
+    def copy_object(self, container, obj, new_container, new_obj,
+                    headers=None, query=None, cdn=False, method='PUT'):
+        """
+        Copies the object to new_container/new_obj within the cluster,
+        without the contents passing through the client, and returns
+        the results. The copy has the object's metadata, updated with
+        any X-Object-Meta-xxx and other headers given, unless the
+        X-Fresh-Metadata: true header is also given.
+
+        Note that Swift copies a large object as a single object of
+        its contents, which fails if they exceed the cluster's maximum
+        object size, unless the multipart-manifest=get query is given
+        to copy the manifest itself.
+
+        :param container: The name of the container.
+        :param obj: The name of the object.
+        :param new_container: The name of the container to copy to.
+        :param new_obj: The name of the object to copy to.
+        :param headers: Additional headers to send with the request.
+        :param query: Set to a dict of query values to send on the
+            query string of the request.
+        :param cdn: If set True, the CDN management interface will be
+            used.
+        :param method: The request to copy with. Default: 'PUT' to
+            send a PUT with an X-Copy-From header to the new object;
+            'COPY' sends a COPY with a Destination header to the
+            object instead.
+        :returns: A tuple of (status, reason, headers, contents).
+
+            :status: is an int for the HTTP status code.
+            :reason: is the str for the HTTP status (ex: "Ok").
+            :headers: is a dict with all lowercase keys of the HTTP
+                headers; if a header has multiple values, it will be a
+                list.
+            :contents: is the str for the HTTP body.
+        """
+        path = self._object_path(container, obj)
+        new_path = self._object_path(new_container, new_obj)
+        headers = dict(headers or {})
+        if method == 'COPY':
+            headers['Destination'] = new_path
+            return self._write(
+                'COPY', path, '', headers, query, cdn, written=new_path)
+        headers['X-Copy-From'] = path
+        if 'content-length' not in (k.lower() for k in headers):
+            headers['Content-Length'] = '0'
+        return self._write('PUT', new_path, '', headers, query, cdn)
 
     def post_object(self, container, obj, headers=None, query=None, cdn=False,
                     body=None):
@@ -670,8 +743,7 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._object_path(container, obj)
-        return self.request(
-            'POST', path, body or '', headers, query=query, cdn=cdn)
+        return self._write('POST', path, body or '', headers, query, cdn)
 
     def delete_object(self, container, obj, headers=None, query=None,
                       cdn=False, body=None):
@@ -697,5 +769,4 @@ class Client(object):
             :contents: is the str for the HTTP body.
         """
         path = self._object_path(container, obj)
-        return self.request(
-            'DELETE', path, body or '', headers, query=query, cdn=cdn)
+        return self._write('DELETE', path, body or '', headers, query, cdn)
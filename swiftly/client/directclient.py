@@ -19,10 +19,128 @@ limitations under the License.
 """
 import six
 import json
+import os
+import socket
+import stat
+import threading
+import time
 from six.moves import StringIO
 
 from swiftly.client.client import Client
+from swiftly.client.replaybuffer import DEFAULT_MAX_SIZE, \
+    DEFAULT_MEMORY_SIZE, replay_buffer
 from swiftly.client.utils import quote, headers_to_dict
+from swiftly.filelikeiter import FileLikeIter
+
+
+#: Guards the process-wide proxies, rings and memcaches below.
+_shared_lock = threading.RLock()
+#: Default proxies shared by all DirectClients in this process, keyed
+#: by their conf, memcache and object ring override.
+_proxies = {}
+#: Rings shared by those proxies, keyed by path and ring name. Each Ring
+#: checks its file's mtime every 15 seconds and reloads only if it has
+#: changed.
+_rings = {}
+#: Memcaches shared by those proxies, keyed by path; None is the key
+#: of the default LocalMemcache.
+_memcaches = {}
+
+
+def _shared_ring(path, ring_name=None):
+    import swift.common.ring.ring
+    with _shared_lock:
+        key = (path, ring_name)
+        if key not in _rings:
+            _rings[key] = swift.common.ring.ring.Ring(
+                path, ring_name=ring_name)
+        return _rings[key]
+
+
+def _shared_memcache(memcache):
+    """
+    Returns memcache if it is an instance, or the process-wide one for
+    the path given: a UnixMemcache if the path is a socket or an
+    MmapMemcache otherwise. None gives the process-wide LocalMemcache.
+    """
+    if memcache is not None and \
+            not isinstance(memcache, six.string_types):
+        return memcache
+    with _shared_lock:
+        if memcache not in _memcaches:
+            if memcache is None:
+                from swiftly.client.localmemcache import LocalMemcache
+                _memcaches[memcache] = LocalMemcache()
+            else:
+                path = os.path.expanduser(memcache)
+                if os.path.exists(path) and \
+                        stat.S_ISSOCK(os.stat(path).st_mode):
+                    from swiftly.client.unixmemcache import UnixMemcache
+                    _memcaches[memcache] = UnixMemcache(path)
+                else:
+                    from swiftly.client.mmapmemcache import MmapMemcache
+                    _memcaches[memcache] = MmapMemcache(path)
+        return _memcaches[memcache]
+
+
+def _shared_proxy(conf, memcache, direct_object_ring, verbose):
+    """
+    Returns the process-wide proxy application for the conf, memcache
+    and object ring override given, creating it if needed.
+    """
+    import swift.proxy.server
+    from swiftly.client.nulllogger import NullLogger
+    memcache = _shared_memcache(memcache)
+    key = (tuple(sorted(conf.items())), id(memcache), direct_object_ring)
+    with _shared_lock:
+        if key in _proxies:
+            return _proxies[key]
+        verbose('Creating default proxy instance.')
+        swift_dir = conf.get('swift_dir', '/etc/swift')
+        proxy = swift.proxy.server.Application(
+            conf, memcache=memcache, logger=NullLogger(),
+            account_ring=_shared_ring(swift_dir, 'account'),
+            container_ring=_shared_ring(swift_dir, 'container'))
+        if direct_object_ring:
+            oring = _shared_ring(direct_object_ring)
+            proxy.get_object_ring = lambda *args: oring
+        _proxies[key] = proxy
+        return proxy
+
+
+class _AppIterReader(FileLikeIter):
+    """
+    Reads a response's app_iter as a file, taking each chunk only as
+    it is needed, so memory stays bounded by the chunk size the proxy
+    yields. Iterating gives those chunks as they are, without copying.
+    The app_iter is closed once it is exhausted or the reader is
+    closed, as WSGI requires.
+    """
+
+    def __init__(self, app_iter, deadline=None):
+        super(_AppIterReader, self).__init__(app_iter)
+        self.app_iter = app_iter
+        self.deadline = deadline
+        self.empty = b''
+
+    def _next_chunk(self):
+        if self.app_iter is None:
+            return None
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise socket.timeout('Request deadline exceeded')
+        chunk = super(_AppIterReader, self)._next_chunk()
+        if chunk is None:
+            self._close_app_iter()
+        return chunk
+
+    def _close_app_iter(self):
+        app_iter, self.app_iter = self.app_iter, None
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+    def close(self):
+        self._close_app_iter()
+        super(_AppIterReader, self).close()
 
 
 class DirectClient(Client):
@@ -32,13 +150,16 @@ class DirectClient(Client):
 
     :param swift_proxy: Default: None. If set, the
         swift.proxy.server.Application given will be used instead of
-        creating a default Swift proxy application.
+        the default Swift proxy application. The default one, and its
+        rings, are created once per process and shared by all the
+        DirectClients with the same timeouts, memcache and
+        direct_object_ring.
     :param swift_proxy_storage_path: The path to the Swift account to
         use (example: /v1/AUTH_test).
     :param swift_proxy_cdn_path: The path to the Swift account to use
         for CDN management (example: /v1/AUTH_test).
     :param attempts: The number of times to try requests if a server
-        error occurs (5xx response). Default: 5
+        error occurs (5xx response) or a request times out. Default: 5
     :param eventlet: Default: None. If True, Eventlet will be used if
         installed. If False, Eventlet will not be used even if
         installed. If None, the default, Eventlet will be used if
@@ -53,17 +174,52 @@ class DirectClient(Client):
         multiple Clients are in use.
     :param direct_object_ring: The path to custom object ring to used
         by the DirectClient
+    :param replay_memory_size: Request bodies that cannot be seeked,
+        such as pipes, are recorded as they are sent so they can be
+        replayed on retries; this many bytes are kept in memory before
+        spilling to a temporary file. Default: 4M
+    :param replay_max_size: The most bytes of such a body to record;
+        larger bodies are sent without the ability to retry. Set to 0
+        to disable recording. Default: 5G, the maximum object size.
+    :param connect_timeout: Seconds the default proxy waits to connect
+        to a storage node. Default: None, the proxy's own default.
+    :param first_byte_timeout: Seconds the default proxy waits for a
+        storage node to begin responding. Default: None, the proxy's
+        own default.
+    :param read_timeout: Seconds the default proxy waits for each read
+        of a request body or of an object from a storage node.
+        Default: None, the proxy's own defaults.
+    :param request_timeout: Seconds after a request is made that
+        reading a response returned with ``stream=True`` must be done
+        by. The proxy runs in this process, so the request itself is
+        bounded by the proxy's own timeouts above. Default: None, no
+        limit.
+    :param memcache: The memcache the default proxy keeps account and
+        container info in, such as a
+        :py:class:`swiftly.client.mmapmemcache.MmapMemcache` or
+        :py:class:`swiftly.client.unixmemcache.UnixMemcache` shared with
+        other processes, or the path to one: a UNIX socket for a
+        UnixMemcache or a file for an MmapMemcache. Default: None, a
+        :py:class:`swiftly.client.localmemcache.LocalMemcache` shared
+        within this process.
     """
 
     def __init__(self, swift_proxy=None, swift_proxy_storage_path=None,
                  swift_proxy_cdn_path=None, attempts=5, eventlet=None,
                  chunk_size=65536, verbose=None, verbose_id='',
-                 direct_object_ring=None):
+                 direct_object_ring=None,
+                 replay_memory_size=DEFAULT_MEMORY_SIZE,
+                 replay_max_size=DEFAULT_MAX_SIZE, connect_timeout=None,
+                 first_byte_timeout=None, read_timeout=None,
+                 request_timeout=None, memcache=None):
         super(DirectClient, self).__init__()
         self.storage_path = swift_proxy_storage_path
         self.cdn_path = swift_proxy_cdn_path
         self.attempts = attempts
         self.chunk_size = chunk_size
+        self.replay_memory_size = replay_memory_size
+        self.replay_max_size = replay_max_size
+        self.request_timeout = request_timeout
         if verbose:
             self.verbose = lambda m, *a, **k: verbose(
                 self._verbose_id + m, *a, **k)
@@ -73,27 +229,24 @@ class DirectClient(Client):
         self._verbose_id = self.verbose_id
         if self._verbose_id:
             self._verbose_id += ' '
+        try:
+            import swift.common.swob
+            self.Request = swift.common.swob.Request
+        except ImportError:
+            import webob
+            self.Request = webob.Request
         self.swift_proxy = swift_proxy
         if not swift_proxy:
-            self.verbose('Creating default proxy instance.')
-            import swift.proxy.server
-            from swiftly.client.localmemcache import LocalMemcache
-            from swiftly.client.nulllogger import NullLogger
-            try:
-                import swift.common.swob
-                self.Request = swift.common.swob.Request
-            except ImportError:
-                import webob
-                self.Request = webob.Request
-            self.swift_proxy = swift.proxy.server.Application(
-                {}, memcache=LocalMemcache(), logger=NullLogger())
-            self.oring = None
-            def get_oring(*args):
-                return self.oring
-
-            if direct_object_ring:
-                self.oring = swift.common.ring.ring.Ring(direct_object_ring)
-                self.swift_proxy.get_object_ring = get_oring
+            conf = {}
+            for name, value in (
+                    ('conn_timeout', connect_timeout),
+                    ('node_timeout', first_byte_timeout),
+                    ('recoverable_node_timeout', read_timeout),
+                    ('client_timeout', read_timeout)):
+                if value is not None:
+                    conf[name] = str(value)
+            self.swift_proxy = _shared_proxy(
+                conf, memcache, direct_object_ring, self.verbose)
 
         if eventlet is None:
             try:
@@ -108,10 +261,8 @@ class DirectClient(Client):
                 import eventlet
                 self.sleep = eventlet.sleep
             except ImportError:
-                import time
                 self.sleep = time.sleep
         else:
-            import time
             self.sleep = time.sleep
 
     def _default_reset_func(self):
@@ -140,11 +291,28 @@ class DirectClient(Client):
                 tell = seek = None
         elif not contents:
             reset_func = lambda: None
+        replay = None
+        if not (tell and seek):
+            replay = replay_buffer(
+                contents, headers, memory_size=self.replay_memory_size,
+                max_size=self.replay_max_size)
+        if replay:
+            self.verbose('Buffering request body for replay.')
+            contents = replay
+
+            def reset_func():
+                if not replay.replayable:
+                    self._default_reset_func()
+                replay.seek(0)
+
         status = 0
         reason = 'Unknown'
         attempt = 0
         while attempt < self.attempts:
             attempt += 1
+            deadline = None
+            if self.request_timeout:
+                deadline = time.time() + self.request_timeout
             if cdn:
                 conn_path = self.cdn_path
             else:
@@ -196,16 +364,7 @@ class DirectClient(Client):
             reason = resp.status.split(' ', 1)[1]
             hdrs = headers_to_dict(resp.headers.items())
             if stream:
-                def iter_reader(size=-1):
-                    if size == -1:
-                        return ''.join(resp.app_iter)
-                    else:
-                        try:
-                            return next(resp.app_iter)
-                        except StopIteration:
-                            return ''
-                iter_reader.read = iter_reader
-                value = iter_reader
+                value = _AppIterReader(resp.app_iter, deadline)
             else:
                 value = resp.body
             self.verbose('< %s %s', status, reason)
@@ -216,6 +375,8 @@ class DirectClient(Client):
                     else:
                         value = None
                 return (status, reason, hdrs, value)
+            if stream:
+                value.close()
             if reset_func:
                 reset_func()
             self.sleep(2 ** attempt)
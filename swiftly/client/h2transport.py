@@ -0,0 +1,725 @@
+"""
+Provides an optional HTTP/2 transport for the standard client.
+
+Requests from every client sharing an :py:class:`H2SessionPool` are
+multiplexed as concurrent streams over one connection per proxy
+address (more only if the server limits concurrent streams), rather
+than each concurrent request needing its own socket.
+:py:class:`H2HTTPConnection` presents the parts of the httplib
+HTTPConnection interface :py:class:`swiftly.client.StandardClient`
+uses, so the client's request and retry logic is unchanged.
+
+Requires the h2 package; :py:data:`HTTP2_Support` is False if it is
+not installed. HTTPS connections must negotiate ``h2`` with ALPN and
+plain HTTP connections use HTTP/2 with prior knowledge (h2c), as
+:py:mod:`swiftly.standin` supports.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import select
+import socket
+import threading
+import time
+
+from six.moves import http_client as httplib
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+    #: True if the h2 package is installed and HTTP/2 can be used.
+    HTTP2_Support = True
+except ImportError:
+    HTTP2_Support = False
+
+
+#: The receive window given to each stream; larger windows let large
+#: downloads stream without waiting on window updates.
+STREAM_WINDOW = 1024 * 1024
+
+#: The receive window for a whole connection.
+CONNECTION_WINDOW = 16 * 1024 * 1024
+
+#: Request headers that are specific to HTTP/1.1 connections and not
+#: allowed in HTTP/2.
+_CONNECTION_HEADERS = (
+    'connection', 'host', 'keep-alive', 'proxy-connection',
+    'transfer-encoding', 'upgrade')
+
+
+class H2Error(httplib.HTTPException):
+    """
+    Raised for HTTP/2 connection and stream failures.
+    """
+    pass
+
+
+class _H2Stream(object):
+
+    def __init__(self):
+        self.headers = None
+        self.data = []
+        self.ended = False
+        self.error = None
+
+
+class H2Session(object):
+    """
+    A single HTTP/2 connection carrying many concurrent streams.
+
+    Any thread waiting on the connection may read from the socket and
+    dispatch what arrives to every stream, so no dedicated reader
+    thread is needed; with green is True the locks are polled with
+    sleep so Eventlet can switch green threads while another holds
+    them.
+
+    :param scheme: http or https.
+    :param host: The host to connect to.
+    :param port: The port to connect to.
+    :param sleep: The sleep function to use while waiting.
+    :param green: True if Eventlet green sockets should be used.
+    :param create_connection: The socket.create_connection style
+        function used to connect. Default: socket.create_connection,
+        or Eventlet's green version if green is True.
+    :param timeout: Seconds to wait for the connection to be
+        established, or None to wait indefinitely.
+    """
+
+    def __init__(self, scheme, host, port, sleep=time.sleep, green=False,
+                 create_connection=None, timeout=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.sleep = sleep
+        self.green = green
+        if green:
+            from eventlet.green import select as select_module
+            from eventlet.green import socket as socket_module
+        else:
+            select_module = select
+            socket_module = socket
+        self.select = select_module.select
+        if not create_connection:
+            create_connection = socket_module.create_connection
+        sock = create_connection((host, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if scheme == 'https':
+            if green:
+                from eventlet.green import ssl
+            else:
+                import ssl
+            context = ssl._create_default_https_context()
+            context.set_alpn_protocols(['h2'])
+            sock = context.wrap_socket(sock, server_hostname=host)
+            if sock.selected_alpn_protocol() != 'h2':
+                sock.close()
+                raise H2Error(
+                    '%s:%s did not negotiate HTTP/2.' % (host, port))
+        # Waits on streams have their own timeouts; see _read.
+        sock.settimeout(None)
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=True, header_encoding=None))
+        self.conn.initiate_connection()
+        self.conn.update_settings({
+            h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: STREAM_WINDOW})
+        self.conn.increment_flow_control_window(
+            CONNECTION_WINDOW - self.conn.inbound_flow_control_window)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        # Guards reserved; never held while waiting, so it is safe to
+        # take even with green threads.
+        self.reserve_lock = threading.Lock()
+        #: Streams promised by reserve but not yet opened.
+        self.reserved = 0
+        self.reading = False
+        self.streams = {}
+        self.error = None
+        self._lock()
+        try:
+            self._flush()
+        finally:
+            self.lock.release()
+
+    def _lock(self):
+        if self.green:
+            while not self.lock.acquire(False):
+                self.sleep(0)
+        else:
+            self.lock.acquire()
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            try:
+                self.sock.sendall(data)
+            except (IOError, OSError) as err:
+                self._fail(err)
+                raise H2Error(str(err))
+
+    def _fail(self, err):
+        if not self.error:
+            self.error = err
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        for stream in self.streams.values():
+            if not stream.ended:
+                stream.error = err
+                stream.ended = True
+        self.condition.notify_all()
+
+    def _check(self, stream_id=None):
+        if self.error:
+            raise H2Error('HTTP/2 connection failed: %s' % self.error)
+        stream = self.streams.get(stream_id)
+        if stream and stream.error and not stream.data:
+            raise H2Error(str(stream.error))
+
+    def _read(self, timeout=None):
+        if timeout is not None and \
+                not getattr(self.sock, 'pending', lambda: 0)():
+            if not self.select([self.sock], [], [], timeout)[0]:
+                return
+        error = None
+        try:
+            data = self.sock.recv(65536)
+        except (IOError, OSError) as err:
+            data = None
+            error = err
+        self._lock()
+        try:
+            if not data:
+                self._fail(error or IOError('Connection closed by server'))
+                return
+            try:
+                events = self.conn.receive_data(data)
+            except h2.exceptions.ProtocolError as err:
+                self._fail(err)
+                return
+            for event in events:
+                stream = self.streams.get(getattr(event, 'stream_id', None))
+                if isinstance(event, h2.events.ResponseReceived):
+                    if stream:
+                        stream.headers = event.headers
+                elif isinstance(event, h2.events.DataReceived):
+                    if stream:
+                        stream.data.append(event.data)
+                        padding = event.flow_controlled_length - \
+                            len(event.data)
+                    else:
+                        padding = event.flow_controlled_length
+                    if padding:
+                        self.conn.acknowledge_received_data(
+                            padding, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    if stream:
+                        stream.ended = True
+                elif isinstance(event, h2.events.StreamReset):
+                    if stream:
+                        stream.error = H2Error(
+                            'Stream reset by server: %s' % event.error_code)
+                        stream.ended = True
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    self._fail(H2Error(
+                        'Connection terminated by server: %s' %
+                        event.error_code))
+            if not self.error:
+                self._flush()
+            self.condition.notify_all()
+        finally:
+            self.lock.release()
+
+    def _wait(self, predicate, stream_id=None, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        left = None
+        while True:
+            self._lock()
+            try:
+                self._check(stream_id)
+                if predicate():
+                    return
+                if deadline is not None:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        raise socket.timeout(
+                            'HTTP/2 stream %s timed out' % stream_id)
+                reader = not self.reading
+                if reader:
+                    self.reading = True
+                elif not self.green:
+                    self.condition.wait(0.1)
+            finally:
+                self.lock.release()
+            if reader:
+                try:
+                    self._read(left)
+                finally:
+                    self._lock()
+                    self.reading = False
+                    self.condition.notify_all()
+                    self.lock.release()
+            elif self.green:
+                self.sleep(0.001)
+
+    def available(self):
+        """
+        Returns True if another stream can be opened.
+        """
+        return not self.error and \
+            self.conn.open_outbound_streams + self.reserved < \
+            self.conn.remote_settings.max_concurrent_streams
+
+    def reserve(self):
+        """
+        Claims room for another stream, to be opened by the next
+        open_stream, returning False if there is none. Claims not
+        followed by an open_stream must be given back with release.
+        """
+        with self.reserve_lock:
+            if not self.available():
+                return False
+            self.reserved += 1
+            return True
+
+    def release(self):
+        """
+        Gives back a claim made with reserve that will not be used.
+        """
+        with self.reserve_lock:
+            self.reserved = max(self.reserved - 1, 0)
+
+    def open_stream(self, headers, end_stream=False, flush=True):
+        """
+        Sends the request headers on a new stream and returns its id.
+        With flush False the headers are only queued, to go out with
+        the first send_data.
+        """
+        self._lock()
+        try:
+            self._check()
+            stream_id = self.conn.get_next_available_stream_id()
+            self.streams[stream_id] = _H2Stream()
+            self.conn.send_headers(stream_id, headers, end_stream=end_stream)
+            if flush:
+                self._flush()
+            return stream_id
+        finally:
+            # The stream, once sent, counts against the limit itself.
+            self.release()
+            self.lock.release()
+
+    def send_data(self, stream_id, data, end_stream=False, timeout=None):
+        """
+        Sends request body data, waiting for flow control as needed
+        but raising socket.timeout after waiting timeout seconds for
+        any one window update.
+        """
+        offset = 0
+        while True:
+            self._lock()
+            try:
+                self._check(stream_id)
+                size = min(
+                    self.conn.local_flow_control_window(stream_id),
+                    self.conn.max_outbound_frame_size, len(data) - offset)
+                if size > 0 or (end_stream and offset >= len(data)):
+                    self.conn.send_data(
+                        stream_id, data[offset:offset + size],
+                        end_stream=end_stream and offset + size >= len(data))
+                    self._flush()
+                    offset += size
+                if offset >= len(data):
+                    return
+            except h2.exceptions.StreamClosedError as err:
+                raise H2Error('Stream closed while sending: %s' % err)
+            finally:
+                self.lock.release()
+            self._wait(
+                lambda: self._send_ready(stream_id), stream_id, timeout)
+
+    def _send_ready(self, stream_id):
+        stream = self.streams.get(stream_id)
+        if not stream or stream.ended:
+            raise H2Error('Stream closed while sending.')
+        return self.conn.local_flow_control_window(stream_id) > 0
+
+    def get_response(self, stream_id, timeout=None):
+        """
+        Waits up to timeout seconds for and returns the response
+        headers of a stream as a list of (name, value) byte string
+        tuples; socket.timeout is raised if they do not arrive in
+        time.
+        """
+        stream = self.streams[stream_id]
+        self._wait(lambda: stream.headers is not None, stream_id, timeout)
+        return stream.headers
+
+    def read(self, stream_id, amt=None, timeout=None):
+        """
+        Reads up to amt bytes, or all remaining if amt is None, of a
+        stream's response body, raising socket.timeout if no data
+        arrives for timeout seconds.
+        """
+        if amt is None:
+            chunks = []
+            chunk = self.read(stream_id, STREAM_WINDOW, timeout)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.read(stream_id, STREAM_WINDOW, timeout)
+            return b''.join(chunks)
+        stream = self.streams.get(stream_id)
+        if not stream:
+            return b''
+        self._wait(lambda: stream.data or stream.ended, stream_id, timeout)
+        self._lock()
+        try:
+            chunk = b''
+            if stream.data:
+                chunk = stream.data[0][:amt]
+                if len(chunk) < len(stream.data[0]):
+                    stream.data[0] = stream.data[0][len(chunk):]
+                else:
+                    stream.data.pop(0)
+            if chunk and not self.error:
+                self.conn.acknowledge_received_data(len(chunk), stream_id)
+                self._flush()
+            if stream.ended and not stream.data:
+                del self.streams[stream_id]
+                if stream.error and not chunk:
+                    raise H2Error(str(stream.error))
+            return chunk
+        finally:
+            self.lock.release()
+
+    def close_stream(self, stream_id):
+        """
+        Discards a stream, resetting it if it is still open.
+        """
+        self._lock()
+        try:
+            stream = self.streams.pop(stream_id, None)
+            if stream and not self.error:
+                if not stream.ended:
+                    try:
+                        self.conn.reset_stream(stream_id)
+                    except h2.exceptions.StreamClosedError:
+                        pass
+                unread = sum(len(d) for d in stream.data)
+                if unread:
+                    self.conn.acknowledge_received_data(unread, stream_id)
+                self._flush()
+        except H2Error:
+            pass
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self._lock()
+        try:
+            if not self.error:
+                try:
+                    self.conn.close_connection()
+                    self._flush()
+                except Exception:
+                    pass
+            self._fail(H2Error('Connection closed'))
+        finally:
+            self.lock.release()
+
+
+class H2SessionPool(object):
+    """
+    The HTTP/2 sessions shared by a set of clients, keyed by scheme,
+    host and port; a new session is only opened when every existing
+    one for the address is at its concurrent stream limit, and only
+    one is opened at a time for each address, the other requests
+    waiting for it rather than each connecting their own.
+
+    :param sleep: The sleep function to use while waiting.
+    :param green: True if Eventlet green sockets should be used.
+    """
+
+    def __init__(self, sleep=time.sleep, green=False):
+        self.sleep = sleep
+        self.green = green
+        self.sessions = {}
+        # The (event, errors) of each address a session is being
+        # connected to; the event is set once it is connected or has
+        # failed, with the error in errors.
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def session(self, scheme, host, port, create_connection=None,
+                timeout=None):
+        """
+        Returns a session with room reserved for another stream (see
+        :py:meth:`H2Session.reserve`), using create_connection and
+        timeout if a new session has to be connected; see
+        :py:class:`H2Session`.
+        """
+        key = (scheme, host, port)
+        while True:
+            with self.lock:
+                sessions = [
+                    s for s in self.sessions.get(key, []) if not s.error]
+                self.sessions[key] = sessions
+                for session in sessions:
+                    if session.reserve():
+                        return session
+                pending = self.pending.get(key)
+                if not pending:
+                    event = threading.Event()
+                    errors = []
+                    self.pending[key] = (event, errors)
+            if pending:
+                event, errors = pending
+                if self.green:
+                    while not event.is_set():
+                        self.sleep(0.01)
+                else:
+                    event.wait()
+                if errors:
+                    raise errors[0]
+                continue
+            session = None
+            try:
+                session = H2Session(
+                    scheme, host, port, sleep=self.sleep, green=self.green,
+                    create_connection=create_connection, timeout=timeout)
+                session.reserve()
+            except Exception as err:
+                errors.append(err)
+                raise
+            finally:
+                with self.lock:
+                    del self.pending[key]
+                    if session:
+                        self.sessions.setdefault(key, []).append(session)
+                event.set()
+            return session
+
+    def close(self):
+        """
+        Closes every session.
+        """
+        with self.lock:
+            sessions = [s for v in self.sessions.values() for s in v]
+            self.sessions = {}
+        for session in sessions:
+            session.close()
+
+
+_default_pools = {}
+
+
+def default_session_pool(sleep=time.sleep, green=False):
+    """
+    Returns the process-wide :py:class:`H2SessionPool` for clients
+    using the given kind of sockets.
+    """
+    if green not in _default_pools:
+        _default_pools[green] = H2SessionPool(sleep=sleep, green=green)
+    return _default_pools[green]
+
+
+class H2Response(object):
+    """
+    The response to a request made with :py:class:`H2HTTPConnection`,
+    offering the parts of the httplib HTTPResponse interface used by
+    the clients.
+    """
+
+    version = 20
+
+    def __init__(self, session, stream_id, headers):
+        self.session = session
+        self.stream_id = stream_id
+        self.headers = []
+        self.status = 0
+        for name, value in headers:
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == ':status':
+                self.status = int(value)
+            elif not name.startswith(':'):
+                self.headers.append((name, value))
+        self.reason = httplib.responses.get(self.status, '')
+        self.closed = False
+        self.timeout = None
+
+    def getheaders(self):
+        return list(self.headers)
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        values = [v for n, v in self.headers if n == name]
+        return ', '.join(values) if values else default
+
+    def read(self, amt=None):
+        if self.closed:
+            return b''
+        chunk = self.session.read(self.stream_id, amt, self.timeout)
+        if not chunk and amt != 0:
+            self.closed = True
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.session.close_stream(self.stream_id)
+
+
+class H2HTTPConnection(object):
+    """
+    Makes requests as streams on a shared :py:class:`H2Session`,
+    offering the parts of the httplib HTTPConnection interface used by
+    :py:class:`swiftly.client.StandardClient`.
+
+    :param netloc: The host[:port] to connect to.
+    :param scheme: http or https.
+    :param pool: The :py:class:`H2SessionPool` to get sessions from.
+    """
+
+    #: HTTP/2 frames request bodies itself, so StandardClient must not
+    #: apply chunked transfer encoding.
+    frames_bodies = True
+
+    def __init__(self, netloc, scheme='http', pool=None):
+        self.scheme = scheme
+        self.netloc = netloc
+        host, _junk, port = netloc.rpartition(':')
+        if not host or ']' in port:
+            host = netloc
+            port = None
+        self.host = host.strip('[]')
+        self.port = int(port) if port else (443 if scheme == 'https' else 80)
+        self.pool = pool or default_session_pool()
+        if self.pool.green:
+            from eventlet.green import socket as socket_module
+        else:
+            socket_module = socket
+        #: Used to connect new sessions; may be replaced, as with the
+        #: httplib HTTPConnection attribute of the same name.
+        self._create_connection = socket_module.create_connection
+        #: Seconds to wait when a new session has to be connected, as
+        #: with the httplib HTTPConnection attribute of the same name.
+        self.timeout = None
+        self.stream_timeout = None
+        self.session = None
+        # True once room for the next stream is reserved on session.
+        self.reserved = False
+        self.stream_id = None
+        self.response = None
+        self.method = None
+        self.headers = []
+        self.ended = False
+
+    def _set_tunnel(self, host, port=None, headers=None):
+        raise H2Error('HTTP/2 cannot be used with a tunnelling proxy.')
+
+    def connect(self):
+        if self.reserved:
+            return
+        if not self.session or not self.session.reserve():
+            self.session = self.pool.session(
+                self.scheme, self.host, self.port,
+                create_connection=self._create_connection,
+                timeout=self.timeout)
+        self.reserved = True
+
+    def settimeout(self, timeout):
+        """
+        Sets how long, in seconds, each later wait on the request's
+        stream may take before socket.timeout is raised, like
+        socket.settimeout does for an HTTP/1.1 connection's socket.
+        """
+        self.stream_timeout = timeout
+        if self.response:
+            self.response.timeout = timeout
+
+    def putrequest(self, method, url, skip_host=False,
+                   skip_accept_encoding=False):
+        self.close()
+        self.method = method
+        self.headers = [
+            (':method', method), (':scheme', self.scheme),
+            (':authority', self.netloc), (':path', url)]
+
+    def putheader(self, header, *values):
+        header = header.lower()
+        if header not in _CONNECTION_HEADERS:
+            self.headers.append(
+                (header, ', '.join(str(v) for v in values)))
+
+    def endheaders(self, message_body=None, end_stream=False, flush=True):
+        self.connect()
+        self.reserved = False
+        self.stream_id = self.session.open_stream(
+            self.headers, end_stream=end_stream, flush=flush)
+        self.ended = end_stream
+
+    def send(self, data):
+        if isinstance(data, str) and not isinstance(data, bytes):
+            data = data.encode('utf8')
+        if data:
+            self.session.send_data(
+                self.stream_id, data, timeout=self.stream_timeout)
+
+    def request(self, method, url, body=None, headers=None):
+        self.putrequest(method, url)
+        for header, value in (headers or {}).items():
+            self.putheader(header, value)
+        if body:
+            if not isinstance(body, bytes):
+                body = body.encode('utf8')
+            self.endheaders(flush=False)
+            self.session.send_data(
+                self.stream_id, body, end_stream=True,
+                timeout=self.stream_timeout)
+            self.ended = True
+        else:
+            self.endheaders(end_stream=True)
+
+    def getresponse(self):
+        if not self.ended:
+            self.session.send_data(
+                self.stream_id, b'', end_stream=True,
+                timeout=self.stream_timeout)
+            self.ended = True
+        self.response = H2Response(
+            self.session, self.stream_id,
+            self.session.get_response(self.stream_id, self.stream_timeout))
+        self.response.timeout = self.stream_timeout
+        if self.method == 'HEAD':
+            self.response.close()
+        return self.response
+
+    def close(self):
+        if self.reserved:
+            self.session.release()
+            self.reserved = False
+        if self.stream_id is not None:
+            if not self.response:
+                self.session.close_stream(self.stream_id)
+            self.stream_id = None
+            self.response = None
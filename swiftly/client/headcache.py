@@ -0,0 +1,117 @@
+"""
+Provides a short-lived cache of HEAD results.
+
+Commands like ``put --newer`` and many ``fordo`` recipes HEAD the
+same account, containers and objects again and again. A
+:py:class:`HeadCache` set as a client's ``head_cache`` answers repeat
+HEADs for a few seconds from memory; writes made through any client
+using the cache drop the entries they could have changed. Writes made
+by anyone else are only noticed once entries expire, so the TTL
+should be no longer than the staleness that is acceptable.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+import threading
+import time
+
+
+class HeadCache(object):
+    """
+    A least recently used, TTL bounded cache of HEAD results keyed by
+    (cdn, path).
+
+    :param ttl: Seconds a result is used for. Default: 60
+    :param max_entries: The most results kept. Default: 100000
+    """
+
+    def __init__(self, ttl=60, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        #: Incremented by every invalidation; see :py:meth:`set`.
+        self.generation = 0
+        #: The number of results answered from the cache.
+        self.hits = 0
+        #: The number of lookups not answered from the cache.
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                del self.entries[key]
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, result, generation):
+        """
+        Caches result for key, unless anything has been invalidated
+        since generation was read, before the HEAD was sent, as the
+        result might predate that write.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.ttl, result)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Drops the result for key and those of the containers and
+        account above it, whose counts and sizes a write may change.
+        """
+        cdn, path = key
+        with self.lock:
+            self.generation += 1
+            while True:
+                self.entries.pop((cdn, path), None)
+                if not path:
+                    break
+                path = path.rsplit('/', 1)[0]
+
+    def clear(self):
+        """
+        Drops every result.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+_default_head_cache = None
+
+
+def default_head_cache(ttl=60):
+    """
+    Returns the process-wide :py:class:`HeadCache`, created with the
+    ttl given by the first call.
+    """
+    global _default_head_cache
+    if _default_head_cache is None:
+        _default_head_cache = HeadCache(ttl=ttl)
+    return _default_head_cache
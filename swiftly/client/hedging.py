@@ -0,0 +1,132 @@
+"""
+Provides the latency tracking and budget for hedged requests.
+
+A hedged request is an idempotent request, such as a GET or HEAD,
+that is sent a second time, on another connection, if its response
+has not begun by the time most responses have; whichever response
+begins first is used and the other request is abandoned. The
+:py:class:`Hedger` decides how long to wait before hedging, from the
+recent response times it has been given, and limits how many
+requests may be hedged so that a slow cluster is not handed extra
+load in proportion to its slowness.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+import threading
+
+
+class Hedger(object):
+    """
+    Tracks response times and hands out the delay after which a
+    request should be hedged.
+
+    :param percentile: The percentile of recent response times to
+        wait before hedging. Default: 95
+    :param budget: The fraction of requests that may be hedged; each
+        response recorded earns this much of a hedge. Default: 0.05
+    :param burst: The most hedges that may be saved up and spent at
+        once. Default: 10
+    :param window: How many recent response times to keep.
+        Default: 1000
+    :param min_samples: No requests are hedged until this many
+        response times have been recorded. Default: 20
+    :param min_delay: The shortest delay ever returned, in seconds.
+        Default: 0.005
+    """
+
+    def __init__(self, percentile=95, budget=0.05, burst=10, window=1000,
+                 min_samples=20, min_delay=0.005):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.samples = collections.deque(maxlen=window)
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+        # The percentile is a sort of the samples, so it is only
+        # recomputed once a fair share of the window has changed.
+        self._refresh = max(window // 50, 1)
+        self._recorded = 0
+        self._delay = None
+        #: The number of requests hedged.
+        self.hedges = 0
+        #: The number of hedged requests answered first by the hedge.
+        self.wins = 0
+
+    def delay(self):
+        """
+        Returns the seconds to wait for a response before hedging, or
+        None if the request should not be hedged because too few
+        response times are known or the budget is spent.
+        """
+        if self.tokens < 1:
+            return None
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            if self._delay is None or self._recorded >= self._refresh:
+                ordered = sorted(self.samples)
+                index = min(
+                    len(ordered) - 1,
+                    int(len(ordered) * self.percentile / 100.0))
+                self._delay = max(ordered[index], self.min_delay)
+                self._recorded = 0
+            return self._delay
+
+    def record(self, seconds):
+        """
+        Records the seconds a response took to begin and earns a
+        fraction of a hedge.
+        """
+        with self.lock:
+            self.samples.append(seconds)
+            self._recorded += 1
+            self.tokens = min(self.tokens + self.budget, self.burst)
+
+    def spend(self):
+        """
+        Takes one hedge from the budget, returning False if there is
+        not one to take.
+        """
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.hedges += 1
+            return True
+
+    def won(self):
+        """
+        Records that a hedge was answered before the request it
+        hedged.
+        """
+        with self.lock:
+            self.wins += 1
+
+
+_default_hedger = None
+
+
+def default_hedger():
+    """
+    Returns the process-wide :py:class:`Hedger`.
+    """
+    global _default_hedger
+    if _default_hedger is None:
+        _default_hedger = Hedger()
+    return _default_hedger
@@ -0,0 +1,234 @@
+"""
+Provides a disk-backed cache of GET responses that are revalidated
+with conditional requests.
+
+Each cached response is kept in one file, named for a hash of the
+request, holding a JSON line of the response status and headers
+followed by the body. Cached responses are always revalidated with
+``If-None-Match`` and ``If-Modified-Since``; the server answers 304
+Not Modified if the cached copy is still current, saving the transfer
+of the body, and authorization is still checked on every request.
+The least recently used files are removed once the cache grows past
+its size limit. Several clients and processes may share one cache
+directory.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+#: The default size limit of a cache, in bytes.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+#: The default size limit of a single cached body, in bytes.
+DEFAULT_MAX_ENTRY_SIZE = 16 * 1024 * 1024
+
+#: Request headers that ask for something other than the whole current
+#: response; requests with any of these bypass the cache.
+_BYPASS_HEADERS = (
+    'if-match', 'if-modified-since', 'if-none-match', 'if-unmodified-since',
+    'range')
+
+#: Response headers describing the transfer of a body rather than the
+#: body itself; they are not copied from a 304 onto the cached headers.
+_TRANSFER_HEADERS = ('content-length', 'transfer-encoding', 'connection')
+
+
+class HTTPCache(object):
+    """
+    A directory of cached GET responses.
+
+    :param path: The directory to keep the cache in; it is created if
+        needed.
+    :param max_size: The size the cache is kept under, in bytes.
+        Default: 256M
+    :param max_entry_size: The largest body that is cached, in bytes.
+        Default: 16M
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE,
+                 max_entry_size=DEFAULT_MAX_ENTRY_SIZE):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        self.lock = threading.Lock()
+        self.size = None
+        #: The number of responses answered from the cache.
+        self.hits = 0
+        #: The number of responses stored in the cache.
+        self.stores = 0
+
+    def _file(self, key):
+        return os.path.join(
+            self.path, hashlib.sha1(key.encode('utf8')).hexdigest())
+
+    def cacheable(self, headers):
+        """
+        Returns True if a GET with the request headers given may be
+        answered from the cache.
+        """
+        for name in headers or {}:
+            if name.lower() in _BYPASS_HEADERS:
+                return False
+        return True
+
+    def lookup(self, key):
+        """
+        Returns the cached entry for key as a dict of status, reason,
+        headers and file, the file open at the cached body, or None if
+        there is none. The file stays readable even if the entry is
+        replaced or removed meanwhile; the caller must close it.
+        """
+        try:
+            fp = open(self._file(key), 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            entry = json.loads(fp.readline().decode('utf8'))
+            if entry.get('key') != key or \
+                    os.fstat(fp.fileno()).st_size != \
+                    fp.tell() + entry['size']:
+                fp.close()
+                return None
+        except (IOError, OSError, ValueError, KeyError):
+            fp.close()
+            return None
+        entry['file'] = fp
+        return entry
+
+    def validators(self, entry):
+        """
+        Returns the conditional request headers that revalidate entry.
+        """
+        validators = {}
+        etag = entry['headers'].get('etag')
+        if etag:
+            validators['If-None-Match'] = etag
+        last_modified = entry['headers'].get('last-modified')
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+        return validators
+
+    def hit(self, key, entry, headers):
+        """
+        Marks entry as recently used after a 304 Not Modified response
+        with the headers given revalidated it, and returns the entry's
+        headers updated with those of the 304.
+        """
+        try:
+            os.utime(self._file(key), None)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        updated = dict(entry['headers'])
+        for name, value in headers.items():
+            if name not in _TRANSFER_HEADERS:
+                updated[name] = value
+        return updated
+
+    def storable(self, status, headers):
+        """
+        Returns True if a response with the status and headers given
+        may be stored, as far as can be told before reading its body.
+        """
+        if status != 200:
+            return False
+        if 'etag' not in headers and 'last-modified' not in headers:
+            return False
+        if 'no-store' in headers.get('cache-control', ''):
+            return False
+        try:
+            return int(headers['content-length']) <= self.max_entry_size
+        except (KeyError, ValueError):
+            return True
+
+    def store(self, key, status, reason, headers, body):
+        """
+        Stores a response, replacing any cached for key, if its body
+        is no larger than max_entry_size.
+        """
+        if len(body) > self.max_entry_size:
+            return
+        entry = json.dumps({
+            'key': key, 'status': status, 'reason': reason,
+            'headers': headers, 'size': len(body)}).encode('utf8') + b'\n'
+        fd, temp = tempfile.mkstemp(dir=self.path, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(entry)
+                fp.write(body)
+            os.rename(temp, self._file(key))
+        except Exception:
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            raise
+        with self.lock:
+            self.stores += 1
+            if self.size is not None:
+                self.size += len(entry) + len(body)
+        if self.size is None or self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is
+        back under nine tenths of max_size.
+        """
+        files = []
+        size = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith('.'):
+                # Abandoned temporary files from interrupted stores.
+                if stat.st_mtime < time.time() - 3600:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            size += stat.st_size
+        if size > self.max_size:
+            files.sort()
+            target = self.max_size * 9 // 10
+            for mtime, file_size, path in files:
+                if size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                size -= file_size
+        with self.lock:
+            self.size = size
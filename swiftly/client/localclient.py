@@ -16,27 +16,34 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import six
-from six import moves
+import threading
 from contextlib import contextmanager
-from errno import EAGAIN
-from fcntl import flock, LOCK_EX, LOCK_NB
+from datetime import datetime
+from email.utils import formatdate
+from errno import EEXIST, ENOTEMPTY
+from hashlib import md5, sha256
+from fcntl import flock, ioctl, LOCK_EX
 from json import dumps, loads
-from os import close as os_close, listdir, mkdir, open as os_open, O_CREAT, \
-    O_WRONLY, rename, rmdir, unlink
-from os.path import exists, getsize, isdir, isfile, join as path_join, \
-    sep as path_sep
+from math import ceil
+from os import close as os_close, link, makedirs, mkdir, \
+    open as os_open, O_CREAT, O_WRONLY, rename, rmdir, unlink
+from os.path import dirname, exists, getsize, isdir, isfile, \
+    join as path_join, sep as path_sep
 from sqlite3 import connect, Row
+from sys import platform
 from six.moves import StringIO
+from six.moves.urllib.parse import unquote
 from time import time
 from uuid import uuid4
 
 from swiftly.client.client import Client
 from swiftly.client.utils import quote
+from swiftly.filelikeiter import FileLikeIter
 
 try:
-    from eventlet import sleep
+    from os import copy_file_range
 except ImportError:
-    from time import sleep
+    copy_file_range = None
 
 
 SUBS = [
@@ -55,6 +62,14 @@ SUBS = [
 """The list of strings in names to substitute for."""
 # Note that _- is reserved for use as the start of internal data file names.
 
+OBJECT_HEADERS = (
+    'content-disposition', 'content-encoding', 'x-delete-at',
+    'x-object-manifest', 'x-static-large-object')
+"""The headers, besides X-Object-Meta-*, stored with objects."""
+
+_FICLONE = 0x40049409
+"""The Linux ioctl making a file a copy on write clone of another."""
+
 
 def _encode_name(name):
     for a, b in SUBS:
@@ -68,24 +83,181 @@ def _decode_name(name):
     return name
 
 
+def _http_date(timestamp):
+    # As Swift does, Last-Modified is rounded up to the next second so
+    # it is never earlier than the X-Timestamp.
+    return formatdate(ceil(float(timestamp)), usegmt=True)
+
+
+def _listing_date(timestamp):
+    return datetime.utcfromtimestamp(float(timestamp)).strftime(
+        '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def _stored_headers(headers):
+    """
+    Returns the dict of the headers given that are stored with an
+    object.
+    """
+    return dict(
+        (k, v) for k, v in six.iteritems(headers)
+        if k.startswith('x-object-meta-') or k in OBJECT_HEADERS)
+
+
+def _byte_range(value, length):
+    """
+    Returns the (start, stop) offsets of the bytes of a body length
+    bytes long that the Range header value given asks for, None if the
+    header is to be ignored, or False if the range cannot be
+    satisfied. Only single ranges are served; as HTTP allows, a
+    request for several is answered with the whole body.
+    """
+    units, _junk, spec = value.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            stop = length
+            if last:
+                stop = int(last) + 1
+                if stop <= start:
+                    return None
+        else:
+            start = max(length - int(last), 0)
+            stop = length
+    except ValueError:
+        return None
+    stop = min(stop, length)
+    if start >= stop:
+        return False
+    return start, stop
+
+
+def _copy_file(source_path, dest_path, chunk_size):
+    """
+    Makes dest_path a copy of source_path as cheaply as the file system
+    allows and returns how: 'link' for a hard link, 'reflink' for a
+    copy on write clone, 'copy_file_range' for a copy made within the
+    kernel, or 'copy' for one read and written here.
+
+    A hard link is a safe copy of an object as objects are only ever
+    replaced, by renaming another file over them, never changed in
+    place.
+    """
+    try:
+        link(source_path, dest_path)
+        return 'link'
+    except OSError:
+        pass
+    with open(source_path, 'rb') as source:
+        with open(dest_path, 'wb') as dest:
+            if platform.startswith('linux'):
+                try:
+                    ioctl(dest.fileno(), _FICLONE, source.fileno())
+                    return 'reflink'
+                except (IOError, OSError):
+                    pass
+            if copy_file_range:
+                try:
+                    while copy_file_range(
+                            source.fileno(), dest.fileno(), 1 << 30):
+                        pass
+                    return 'copy_file_range'
+                except OSError:
+                    source.seek(0)
+                    dest.seek(0)
+                    dest.truncate()
+            chunk = source.read(chunk_size)
+            while chunk:
+                dest.write(chunk)
+                chunk = source.read(chunk_size)
+    return 'copy'
+
+
+class _FileRange(object):
+    """
+    A read only file of length bytes of fp from its current position.
+    The fileno, offset and length let a caller hand the range to
+    os.sendfile rather than read it.
+    """
+
+    def __init__(self, fp, length):
+        self.fp = fp
+        self.offset = fp.tell()
+        self.length = length
+        self.left = length
+
+    def fileno(self):
+        return self.fp.fileno()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.left:
+            size = self.left
+        chunk = self.fp.read(size)
+        self.left -= len(chunk)
+        return chunk
+
+    def close(self):
+        self.fp.close()
+
+
+class _SegmentReader(FileLikeIter):
+    """
+    Reads the chunks of a large object's segments as a file, closing
+    the segment being read once the reader is closed.
+    """
+
+    def __init__(self, chunks):
+        super(_SegmentReader, self).__init__(chunks)
+        self.chunks = chunks
+        self.empty = b''
+
+    def close(self):
+        self.chunks.close()
+        super(_SegmentReader, self).close()
+
+
+#: The lock of each path lock_dir has been called for, which keeps
+#: threads of the same process from contending for the file lock.
+_dir_locks = {}
+_dir_locks_lock = threading.Lock()
+
+#: The SQLite connections of each thread, keyed by database path.
+_connections = threading.local()
+
+
 @contextmanager
 def lock_dir(path):
+    with _dir_locks_lock:
+        lock = _dir_locks.setdefault(path, threading.Lock())
     path = path_join(path, '_-lock')
-    fd = os_open(path, O_WRONLY | O_CREAT, 0o0600)
+    with lock:
+        fd = os_open(path, O_WRONLY | O_CREAT, 0o0600)
+        try:
+            flock(fd, LOCK_EX)
+            yield True
+        finally:
+            os_close(fd)
+
+
+@contextmanager
+def _transaction(db):
+    """
+    Runs the statements within as one transaction, holding the
+    database's write lock from the start so that other threads and
+    processes wait for it rather than fail.
+    """
+    db.execute('BEGIN IMMEDIATE')
     try:
-        for x in moves.range(100):
-            try:
-                flock(fd, LOCK_EX | LOCK_NB)
-                break
-            except IOError as err:
-                if err.errno != EAGAIN:
-                    raise
-            sleep(0.1)
-        else:
-            raise Exception('Timeout 10s trying to get lock on %r' % path)
-        yield True
-    finally:
-        os_close(fd)
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
 
 
 class LocalClient(Client):
@@ -105,13 +277,20 @@ class LocalClient(Client):
     :param verbose_id: Set to a string you wish verbose messages to
         be prepended with; can help in identifying output when
         multiple Clients are in use.
+    :param dedup: If True, objects put are stored once per distinct
+        contents: each is a hard link to a file in the _-blobs
+        directory named for the SHA-256 of its contents, and that file
+        is removed once no object refers to it. Objects put with and
+        without dedup may be mixed in the same local_path. Default:
+        False
     """
 
     def __init__(self, local_path=None, chunk_size=65536, verbose=None,
-                 verbose_id=''):
+                 verbose_id='', dedup=False):
         super(LocalClient, self).__init__()
         self.local_path = local_path.rstrip(path_sep) if local_path else '.'
         self.chunk_size = chunk_size
+        self.dedup = dedup
         if verbose:
             self.verbose = lambda m, *a, **k: verbose(
                 self._verbose_id + m, *a, **k)
@@ -135,7 +314,8 @@ class LocalClient(Client):
             headers = {}
         if not query:
             query = {}
-        rpath = path.lstrip('/')
+        # As with Swift, names are sent quoted and stored unquoted.
+        rpath = unquote(path).lstrip('/')
         if '/' in rpath:
             container_name, object_name = rpath.split('/', 1)
         else:
@@ -160,27 +340,45 @@ class LocalClient(Client):
             return (status, reason, hdrs, body)
         raise Exception('%s %s failed: %s %s' % (method, path, status, reason))
 
-    def _connect(self, db_path):
-        db = connect(db_path)
+    def _connect(self, db_path, journal_mode='WAL'):
+        # Transactions are begun explicitly; see _transaction.
+        db = connect(db_path, timeout=60, isolation_level=None)
         db.row_factory = Row
         db.text_factory = str
         db.executescript('''
             PRAGMA synchronous = NORMAL;
             PRAGMA count_changes = OFF;
             PRAGMA temp_store = MEMORY;
-            PRAGMA journal_mode = DELETE;
-        ''')
+            PRAGMA journal_mode = %s;
+        ''' % journal_mode)
         return db
 
     def _get_db(self):
+        """
+        Returns this thread's connection to the account database,
+        creating the database if needed. The connection is kept open
+        and shared by all LocalClients the thread uses with the same
+        local_path.
+        """
         db_path = path_join(self.local_path, '_-account.db')
+        dbs = getattr(_connections, 'dbs', None)
+        if dbs is None:
+            dbs = _connections.dbs = {}
+        db = dbs.get(db_path)
+        if db is None:
+            db = dbs[db_path] = self._create_db(db_path)
+        return db
+
+    def _create_db(self, db_path):
         if isfile(db_path):
-            return self._connect(db_path)
+            return self._upgrade_db(self._connect(db_path))
         with lock_dir(self.local_path):
             if isfile(db_path):
-                return self._connect(db_path)
+                return self._upgrade_db(self._connect(db_path))
             temp_path = path_join(self.local_path, '_-temp-account.db')
-            db = self._connect(temp_path)
+            # Built with a rollback journal, as a write-ahead log would be
+            # left behind under the temporary name by the rename.
+            db = self._connect(temp_path, journal_mode='DELETE')
             db.executescript('''
                 CREATE TABLE account_entry (
                     container_count INTEGER,
@@ -231,11 +429,19 @@ class LocalClient(Client):
                     container_name TEXT,
                     object_name TEXT,
                     put_timestamp TEXT,
-                    byte_count INTEGER);
+                    byte_count INTEGER,
+                    etag TEXT,
+                    content_type TEXT,
+                    metadata TEXT,
+                    digest TEXT);
 
                 CREATE UNIQUE INDEX object_entry_primary_key
                 ON object_entry (container_name, object_name);
 
+                CREATE TABLE blob_entry (
+                    digest TEXT PRIMARY KEY,
+                    ref_count INTEGER);
+
                 CREATE TRIGGER object_insert
                 AFTER INSERT
                 ON object_entry
@@ -266,7 +472,6 @@ class LocalClient(Client):
                     WHERE container_name = old.container_name;
                 END;
             ''')
-            db.commit()
             db.close()
             if isfile(db_path):
                 unlink(temp_path)
@@ -274,6 +479,204 @@ class LocalClient(Client):
                 rename(temp_path, db_path)
         return self._connect(db_path)
 
+    def _upgrade_db(self, db):
+        """
+        Adds the object_entry columns and tables that databases created
+        by older releases lack; their objects have no stored ETag,
+        content type or metadata until they are next put.
+        """
+        columns = [r['name'] for r in db.execute(
+            'PRAGMA table_info(object_entry)')]
+        if 'digest' not in columns:
+            with _transaction(db):
+                columns = [r['name'] for r in db.execute(
+                    'PRAGMA table_info(object_entry)')]
+                for column in ('etag', 'content_type', 'metadata', 'digest'):
+                    if column not in columns:
+                        db.execute(
+                            'ALTER TABLE object_entry ADD COLUMN %s TEXT' %
+                            column)
+                db.execute('''
+                    CREATE TABLE IF NOT EXISTS blob_entry (
+                        digest TEXT PRIMARY KEY,
+                        ref_count INTEGER)
+                ''')
+        return db
+
+    def _blob_path(self, digest):
+        return path_join(self.local_path, '_-blobs', digest[:2], digest)
+
+    def _store_blob(self, db, temp_path, fs_object_path, digest):
+        """
+        Puts the contents written to temp_path at fs_object_path as a
+        link to the blob for digest, storing the contents as that blob
+        if there is not one yet, and counts the reference. Must be
+        called within a transaction. Returns False, having done
+        nothing, if the file system does not support hard links.
+        """
+        blob_path = self._blob_path(digest)
+        link_path = temp_path + '-link'
+        try:
+            if exists(blob_path):
+                link(blob_path, link_path)
+                rename(link_path, fs_object_path)
+                # The rename does nothing if fs_object_path is already a
+                # link to the blob.
+                if exists(link_path):
+                    unlink(link_path)
+                unlink(temp_path)
+            else:
+                if not isdir(dirname(blob_path)):
+                    makedirs(dirname(blob_path))
+                link(temp_path, blob_path)
+                rename(temp_path, fs_object_path)
+                if exists(temp_path):
+                    unlink(temp_path)
+        except OSError as err:
+            self.verbose('Storing %s without dedup: %s', digest, err)
+            return False
+        if not db.execute('''
+            UPDATE blob_entry
+            SET ref_count = ref_count + 1
+            WHERE digest = ?
+        ''', (digest,)).rowcount:
+            db.execute('''
+                INSERT INTO blob_entry (digest, ref_count)
+                VALUES (?, 1)
+            ''', (digest,))
+        return True
+
+    def _index_object(self, db, container_name, object_name, temp_path,
+                      digest, entry):
+        """
+        Puts the object written to temp_path in place, as a link to the
+        blob for digest if given and possible, and indexes it with the
+        (put_timestamp, byte_count, etag, content_type, metadata) entry
+        given, releasing any object it replaces. Must be called within
+        a transaction.
+        """
+        fs_object_path = path_join(
+            self.local_path, _encode_name(container_name),
+            _encode_name(object_name))
+        row = db.execute('''
+            SELECT digest
+            FROM object_entry
+            WHERE container_name = ? AND object_name = ?
+        ''', (container_name, object_name)).fetchone()
+        if not digest or not self._store_blob(
+                db, temp_path, fs_object_path, digest):
+            digest = None
+            rename(temp_path, fs_object_path)
+            # As in _store_blob, the rename does nothing if
+            # fs_object_path is already a link to the same file, as a
+            # repeated copy leaves it.
+            if exists(temp_path):
+                unlink(temp_path)
+        entry = tuple(entry) + (digest, container_name, object_name)
+        if row:
+            db.execute('''
+                UPDATE object_entry
+                SET put_timestamp = ?, byte_count = ?, etag = ?,
+                    content_type = ?, metadata = ?, digest = ?
+                WHERE container_name = ? AND object_name = ?
+            ''', entry)
+            self._release_blob(db, row['digest'])
+        else:
+            db.execute('''
+                INSERT INTO object_entry (
+                    put_timestamp, byte_count, etag, content_type,
+                    metadata, digest, container_name, object_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', entry)
+
+    def _release_blob(self, db, digest):
+        """
+        Drops a reference to the blob for digest, removing the blob once
+        nothing refers to it. Must be called within a transaction.
+        """
+        if not digest:
+            return
+        db.execute('''
+            UPDATE blob_entry
+            SET ref_count = ref_count - 1
+            WHERE digest = ?
+        ''', (digest,))
+        row = db.execute('''
+            SELECT ref_count
+            FROM blob_entry
+            WHERE digest = ?
+        ''', (digest,)).fetchone()
+        if row and row['ref_count'] <= 0:
+            db.execute('DELETE FROM blob_entry WHERE digest = ?', (digest,))
+            try:
+                unlink(self._blob_path(digest))
+            except OSError:
+                pass
+
+    def _listing(self, db, select, column, where, args, query):
+        """
+        Returns the list of rows, as dicts, of the select given for a
+        listing with the query parameters given, ordered by column.
+
+        Markers and prefix bound the range of column scanned, so only
+        the index entries actually listed are read. With a delimiter,
+        each subdir found is listed once and the scan then skips past
+        every name under it rather than reading them.
+        """
+        prefix = query.get('prefix') or ''
+        delimiter = query.get('delimiter')
+        marker = query.get('marker') or ''
+        end_marker = query.get('end_marker')
+        limit = min(int(query.get('limit') or 10000), 10000)
+        start = max(marker, prefix)
+        inclusive = start != marker
+        stop = end_marker
+        if prefix:
+            prefix_end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            if stop is None or prefix_end < stop:
+                stop = prefix_end
+        listing = []
+        while len(listing) < limit:
+            clauses = list(where)
+            clause_args = list(args)
+            if start:
+                clauses.append(
+                    '%s %s ?' % (column, '>=' if inclusive else '>'))
+                clause_args.append(start)
+            if stop is not None:
+                clauses.append('%s < ?' % column)
+                clause_args.append(stop)
+            sql = select
+            if clauses:
+                sql += ' WHERE ' + ' AND '.join(clauses)
+            sql += ' ORDER BY %s LIMIT ?' % column
+            clause_args.append(limit - len(listing))
+            curs = db.execute(sql, clause_args)
+            if not delimiter:
+                listing.extend(dict(r) for r in curs)
+                break
+            for row in curs:
+                name = row['name']
+                end = name.find(delimiter, len(prefix))
+                if end < 0:
+                    listing.append(dict(row))
+                    start = name
+                    inclusive = False
+                    continue
+                subdir = name[:end + len(delimiter)]
+                if subdir != marker:
+                    listing.append({'subdir': subdir})
+                # Skip to the first name past everything under subdir.
+                start = name[:end] + chr(ord(delimiter[0]) + 1)
+                inclusive = True
+                curs.close()
+                break
+            else:
+                # Every row was listed, so the limit has been reached or
+                # there are no more.
+                break
+        return listing
+
     def _account(self, method, contents, headers, stream, query, cdn):
         if cdn:
             raise Exception('CDN not yet supported with LocalClient')
@@ -283,73 +686,15 @@ class LocalClient(Client):
         body = ''
         if method in ('GET', 'HEAD'):
             db = self._get_db()
-            prefix = query.get('prefix')
-            delimiter = query.get('delimiter')
-            marker = query.get('marker')
-            end_marker = query.get('end_marker')
-            limit = int(query.get('limit') or 10000)
-            if delimiter and not prefix:
-                prefix = ''
-            orig_marker = marker
-            body = []
-            done = False
-            while len(body) < limit and not done:
-                query = '''
+            if method == 'GET':
+                body = dumps(self._listing(db, '''
                     SELECT container_name AS name, object_count AS count,
                         byte_count AS bytes
                     FROM container_entry
-                '''
-                query_args = []
-                where = []
-                if end_marker:
-                    where.append('name < ?')
-                    query_args.append(end_marker)
-                if marker and marker >= prefix:
-                    where.append('name > ?')
-                    query_args.append(marker)
-                elif prefix:
-                    where.append('name >= ?')
-                    query_args.append(prefix)
-                if where:
-                    query += ' WHERE ' + ' AND '.join(where)
-                query += ' ORDER BY name LIMIT ? '
-                query_args.append(limit - len(body))
-                curs = db.execute(query, query_args)
-                if prefix is None:
-                    body = [dict(r) for r in curs]
-                    break
-                if not delimiter:
-                    if not prefix:
-                        body = [dict(r) for r in curs]
-                    else:
-                        body = [
-                            dict(r) for r in curs if r[0].startswith(prefix)]
-                    break
-                rowcount = 0
-                for row in curs:
-                    rowcount += 1
-                    marker = name = row[0]
-                    if len(body) >= limit or not name.startswith(prefix):
-                        curs.close()
-                        done = True
-                        break
-                    end = name.find(delimiter, len(prefix))
-                    if end > 0:
-                        marker = name[:end] + chr(ord(delimiter) + 1)
-                        dir_name = name[:end + 1]
-                        if dir_name != orig_marker:
-                            body.append({'subdir': dir_name})
-                        curs.close()
-                        break
-                    body.append(dict(row))
-                if not rowcount:
-                    break
+                ''', 'container_name', [], [], query))
             status = 200
             reason = 'OK'
-            body = dumps(body)
             hdrs['content-length'] = str(len(body))
-            if method == 'HEAD':
-                body = ''
             row = db.execute('''
                 SELECT container_count, object_count, byte_count
                 FROM account_entry
@@ -357,7 +702,6 @@ class LocalClient(Client):
             hdrs['x-account-container-count'] = row['container_count']
             hdrs['x-account-object-count'] = row['object_count']
             hdrs['x-account-bytes-used'] = row['byte_count']
-            db.close()
         if stream:
             return status, reason, hdrs, StringIO(body)
         else:
@@ -373,62 +717,42 @@ class LocalClient(Client):
         hdrs = {}
         body = ''
         if method in ('GET', 'HEAD'):
-            local_path = path_join(self.local_path, fs_container)
-            if not isdir(local_path):
+            db = self._get_db()
+            row = db.execute('''
+                SELECT object_count, byte_count
+                FROM container_entry
+                WHERE container_name = ?
+            ''', (container_name,)).fetchone()
+            if not row:
                 status = 404
                 reason = 'Not Found'
-                body = ''
-                hdrs['content-length'] = str(len(body))
             else:
-                object_count = 0
-                bytes_used = 0
-                prefix = query.get('prefix')
-                delimiter = query.get('delimiter')
-                marker = query.get('marker')
-                end_marker = query.get('end_marker')
-                limit = query.get('limit')
-                objects = {}
-                for item in listdir(local_path):
-                    item_local_path = path_join(local_path, item)
-                    if isfile(item_local_path):
-                        object_name = _decode_name(item)
-                        object_count += 1
-                        object_size = getsize(item_local_path)
-                        bytes_used += object_size
-                        if prefix and not object_name.startswith(prefix):
-                            continue
-                        if delimiter:
-                            index = object_name.find(
-                                delimiter, len(prefix) + 1 if prefix else 0)
-                            if index >= 0:
-                                object_name = object_name[:index + 1]
-                        objects[object_name] = {
-                            'name': object_name, 'bytes': object_size}
-                objects = sorted(six.itervalues(objects), key=lambda x: x['name'])
-                if marker:
-                    objects = [o for o in objects if o['name'] > marker]
-                if end_marker:
-                    objects = [o for o in objects if o['name'] < end_marker]
-                if limit:
-                    objects = objects[:int(limit)]
                 status = 200
                 reason = 'OK'
-                body = dumps([
-                    ({'subdir': o} if o['name'][-1] == delimiter else o)
-                    for o in objects])
-                hdrs['content-length'] = str(len(body))
-                hdrs['x-container-object-count'] = str(object_count)
-                hdrs['x-container-bytes-used'] = str(bytes_used)
-            if method == 'HEAD':
-                body = ''
+                if method == 'GET':
+                    listing = self._listing(db, '''
+                        SELECT object_name AS name, byte_count AS bytes,
+                            etag AS hash, put_timestamp AS last_modified,
+                            COALESCE(content_type, 'application/octet-stream')
+                                AS content_type
+                        FROM object_entry
+                    ''', 'object_name', ['container_name = ?'],
+                        [container_name], query)
+                    for item in listing:
+                        if 'last_modified' in item:
+                            item['last_modified'] = _listing_date(
+                                item['last_modified'])
+                    body = dumps(listing)
+                hdrs['x-container-object-count'] = str(row['object_count'])
+                hdrs['x-container-bytes-used'] = str(row['byte_count'])
+            hdrs['content-length'] = str(len(body))
         elif method == 'PUT':
             fs_container_path = path_join(self.local_path, fs_container)
             if isdir(fs_container_path):
                 status = 202
                 reason = 'Accepted'
             else:
-                db = self._get_db()
-                with lock_dir(self.local_path):
+                with _transaction(self._get_db()) as db:
                     if isdir(fs_container_path):
                         status = 202
                         reason = 'Accepted'
@@ -439,8 +763,6 @@ class LocalClient(Client):
                                 container_name, object_count, byte_count)
                             VALUES (?, 0, 0)
                         ''', (container_name,))
-                        db.commit()
-                        db.close()
                         status = 201
                         reason = 'Created'
             body = ''
@@ -456,20 +778,25 @@ class LocalClient(Client):
                 status = 404
                 reason = 'Not Found'
             else:
-                db = self._get_db()
-                with lock_dir(self.local_path):
+                with _transaction(self._get_db()) as db:
                     if not isdir(fs_container_path):
                         status = 404
                         reason = 'Not Found'
                     else:
-                        rmdir(fs_container_path)
-                        db.execute('''
-                            DELETE FROM container_entry
-                            WHERE container_name = ?
-                        ''', (container_name,))
-                        db.commit()
-                        status = 204
-                        reason = 'No Content'
+                        try:
+                            rmdir(fs_container_path)
+                        except OSError as err:
+                            if err.errno not in (ENOTEMPTY, EEXIST):
+                                raise
+                            status = 409
+                            reason = 'Conflict'
+                        else:
+                            db.execute('''
+                                DELETE FROM container_entry
+                                WHERE container_name = ?
+                            ''', (container_name,))
+                            status = 204
+                            reason = 'No Content'
             body = ''
             hdrs['content-length'] = str(len(body))
         if stream:
@@ -487,92 +814,223 @@ class LocalClient(Client):
         reason = 'Internal Server Error'
         hdrs = {}
         body = ''
-        if method in ('GET', 'HEAD'):
-            local_path = path_join(self.local_path, fs_container, fs_object)
-            if not exists(local_path):
+        headers = dict((k.lower(), v) for k, v in six.iteritems(headers))
+        # As Swift keeps it as system metadata, X-Static-Large-Object is
+        # only ever set by a PUT with multipart-manifest=put.
+        headers.pop('x-static-large-object', None)
+        fs_object_path = path_join(self.local_path, fs_container, fs_object)
+        if method == 'COPY' or (
+                method == 'PUT' and 'x-copy-from' in headers):
+            if method == 'COPY':
+                source = '%s/%s' % (container_name, object_name)
+                destination = headers.pop('destination', '')
+            else:
+                source = headers.pop('x-copy-from')
+                destination = '%s/%s' % (container_name, object_name)
+            source = unquote(source).lstrip('/').split('/', 1)
+            destination = unquote(destination).lstrip('/').split('/', 1)
+            if len(source) != 2 or len(destination) != 2:
+                status = 412
+                reason = 'Precondition Failed'
+                body = 'The copy source and destination must be of the ' \
+                    'form <container name>/<object name>'
+                hdrs['content-length'] = str(len(body))
+            else:
+                status, reason, hdrs, body = self._copy(
+                    source[0], source[1], destination[0], destination[1],
+                    headers, query)
+        elif method in ('GET', 'HEAD'):
+            row = None
+            if exists(fs_object_path):
+                row = self._get_db().execute('''
+                    SELECT put_timestamp, byte_count, etag, content_type,
+                        metadata
+                    FROM object_entry
+                    WHERE container_name = ? AND object_name = ?
+                ''', (container_name, object_name)).fetchone()
+            if not row:
                 status = 404
                 reason = 'Not Found'
             else:
-                content_length = getsize(local_path)
-                hdrs['content-length'] = str(content_length)
-                status = 200 if content_length else 204
-                if method == 'HEAD':
-                    body = ''
+                status = 200
+                reason = 'OK'
+                metadata = loads(row['metadata'] or '{}')
+                hdrs.update(metadata)
+                hdrs['content-type'] = \
+                    row['content_type'] or 'application/octet-stream'
+                hdrs['last-modified'] = _http_date(row['put_timestamp'])
+                hdrs['x-timestamp'] = '%.5f' % float(row['put_timestamp'])
+                # As with Swift, multipart-manifest=get gives a manifest
+                # itself rather than the large object it describes.
+                segments = None
+                if query.get('multipart-manifest') == 'get':
+                    if 'x-static-large-object' in metadata:
+                        hdrs['content-type'] = \
+                            'application/json; charset=utf-8'
+                elif 'x-object-manifest' in metadata:
+                    segments = self._dlo_segments(
+                        metadata['x-object-manifest'])
+                elif 'x-static-large-object' in metadata:
+                    segments = self._slo_segments(fs_object_path)
+                if segments is None:
+                    length = getsize(fs_object_path)
+                    hdrs['etag'] = row['etag'] or self._legacy_etag(
+                        container_name, object_name, fs_object_path)
                 else:
-                    body = open(local_path, 'rb')
-                    if not stream:
-                        body = body.read()
+                    length = sum(s[2] for s in segments)
+                    hdrs['etag'] = '"%s"' % md5(''.join(
+                        s[3] for s in segments).encode('ascii')).hexdigest()
+                byte_range = None
+                if 'range' in headers:
+                    byte_range = _byte_range(headers['range'], length)
+                if byte_range is False:
+                    status = 416
+                    reason = 'Requested Range Not Satisfiable'
+                    hdrs['content-range'] = 'bytes */%d' % length
+                    hdrs['content-length'] = '0'
+                else:
+                    start, stop = byte_range or (0, length)
+                    if byte_range:
+                        status = 206
+                        reason = 'Partial Content'
+                        hdrs['content-range'] = 'bytes %d-%d/%d' % (
+                            start, stop - 1, length)
+                    hdrs['content-length'] = str(stop - start)
+                    if method == 'GET' and segments is not None:
+                        body = _SegmentReader(
+                            self._segment_chunks(segments, start, stop))
+                    elif method == 'GET':
+                        body = open(fs_object_path, 'rb')
+                        if byte_range:
+                            body.seek(start)
+                            body = _FileRange(body, stop - start)
         elif method == 'PUT':
-            fs_object_path = path_join(
-                self.local_path, fs_container, fs_object)
             temp_path = path_join(
                 self.local_path, fs_container, '_-temp' + uuid4().hex)
             content_length = headers.get('content-length')
             if content_length is not None:
                 content_length = int(content_length)
-            fp = open(temp_path, 'wb')
-            left = content_length
-            written = 0
-            while left is None or left > 0:
-                if left is not None:
-                    chunk = contents.read(max(left, self.chunk_size))
-                    left -= len(chunk)
-                else:
-                    chunk = contents.read(self.chunk_size)
-                if not chunk:
-                    break
-                fp.write(chunk)
-                written += len(chunk)
-            fp.flush()
-            fp.close()
-            if content_length is not None and written != content_length:
-                unlink(temp_path)
-                status = 503
-                reason = 'Internal Server Error'
-                body = 'Wrote %d bytes when Content-Length was %d' % (
-                    written, content_length)
+            errors = None
+            slo_etag = None
+            if query.get('multipart-manifest') == 'put':
+                # The manifest given is checked against the segments and
+                # stored in Swift's form in its place.
+                manifest, errors = self._slo_manifest(
+                    contents, content_length)
+                if not errors:
+                    slo_etag = md5(''.join(
+                        s['hash'] for s in manifest).encode('ascii')
+                    ).hexdigest()
+                    if headers.pop('etag', slo_etag).strip('"').lower() != \
+                            slo_etag:
+                        errors.append('Etag Mismatch')
+                contents = six.BytesIO(dumps(manifest).encode('utf8'))
+                content_length = len(contents.getvalue())
+                headers['x-static-large-object'] = 'True'
+            if errors:
+                status = 400
+                reason = 'Bad Request'
+                body = 'Errors:\n' + '\n'.join(errors)
+            elif not isdir(path_join(self.local_path, fs_container)):
+                status = 404
+                reason = 'Not Found'
             else:
-                db = self._get_db()
-                with lock_dir(self.local_path):
-                    if isfile(fs_object_path):
-                        rename(temp_path, fs_object_path)
-                        db.execute('''
-                            UPDATE object_entry
-                            SET put_timestamp = ?, byte_count = ?
-                            WHERE container_name = ? AND object_name = ?
-                        ''', (time(), written, container_name, object_name))
+                fp = open(temp_path, 'wb')
+                hasher = md5()
+                digester = sha256() if self.dedup else None
+                left = content_length
+                written = 0
+                while left is None or left > 0:
+                    if left is not None:
+                        chunk = contents.read(min(left, self.chunk_size))
+                        left -= len(chunk)
                     else:
-                        rename(temp_path, fs_object_path)
-                        db.execute('''
-                            INSERT INTO object_entry (
-                                container_name, object_name, put_timestamp,
-                                byte_count)
-                            VALUES (?, ?, ?, ?)
-                        ''', (container_name, object_name, time(), written))
-                    db.commit()
-                status = 201
-                reason = 'Created'
-                body = ''
+                        chunk = contents.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    fp.write(chunk)
+                    hasher.update(chunk)
+                    if digester:
+                        digester.update(chunk)
+                    written += len(chunk)
+                fp.flush()
+                fp.close()
+                etag = hasher.hexdigest()
+                if content_length is not None and written != content_length:
+                    unlink(temp_path)
+                    status = 503
+                    reason = 'Internal Server Error'
+                    body = 'Wrote %d bytes when Content-Length was %d' % (
+                        written, content_length)
+                elif headers.get('etag', etag).strip('"').lower() != etag:
+                    unlink(temp_path)
+                    status = 422
+                    reason = 'Unprocessable Entity'
+                else:
+                    timestamp = '%.5f' % time()
+                    # Only the renames and the index update are
+                    # serialized; the data was written beforehand.
+                    with _transaction(self._get_db()) as db:
+                        self._index_object(
+                            db, container_name, object_name, temp_path,
+                            digester.hexdigest() if digester else None, (
+                                timestamp, written, etag,
+                                headers.get('content-type'),
+                                dumps(_stored_headers(headers))))
+                    status = 201
+                    reason = 'Created'
+                    hdrs['etag'] = '"%s"' % slo_etag if slo_etag else etag
+                    hdrs['last-modified'] = _http_date(timestamp)
+            hdrs['content-length'] = str(len(body))
+        elif method == 'POST':
+            # As with Swift, a POST replaces all the stored headers and
+            # may change the content type.
+            with _transaction(self._get_db()) as db:
+                row = db.execute('''
+                    SELECT content_type, metadata
+                    FROM object_entry
+                    WHERE container_name = ? AND object_name = ?
+                ''', (container_name, object_name)).fetchone()
+                if not row:
+                    status = 404
+                    reason = 'Not Found'
+                else:
+                    metadata = _stored_headers(headers)
+                    if 'x-static-large-object' in \
+                            loads(row['metadata'] or '{}'):
+                        metadata['x-static-large-object'] = 'True'
+                    db.execute('''
+                        UPDATE object_entry
+                        SET content_type = ?, metadata = ?
+                        WHERE container_name = ? AND object_name = ?
+                    ''', (
+                        headers.get('content-type', row['content_type']),
+                        dumps(metadata), container_name, object_name))
+                    status = 202
+                    reason = 'Accepted'
             hdrs['content-length'] = str(len(body))
         elif method == 'DELETE':
-            fs_object_path = path_join(
-                self.local_path, fs_container, fs_object)
             if not isfile(fs_object_path):
                 status = 404
                 reason = 'Not Found'
             else:
-                db = self._get_db()
-                with lock_dir(self.local_path):
+                with _transaction(self._get_db()) as db:
                     if not isfile(fs_object_path):
                         status = 404
                         reason = 'Not Found'
                     else:
                         unlink(fs_object_path)
-                        db.execute('''
-                            DELETE FROM object_entry
+                        row = db.execute('''
+                            SELECT digest
+                            FROM object_entry
                             WHERE container_name = ? AND object_name = ?
-                        ''', (container_name, object_name))
-                        db.commit()
+                        ''', (container_name, object_name)).fetchone()
+                        if row:
+                            db.execute('''
+                                DELETE FROM object_entry
+                                WHERE container_name = ? AND object_name = ?
+                            ''', (container_name, object_name))
+                            self._release_blob(db, row['digest'])
                         status = 204
                         reason = 'No Content'
             body = ''
@@ -583,6 +1041,250 @@ class LocalClient(Client):
             body = body.read()
         return status, reason, hdrs, body
 
+    def _copy(self, source_container, source_object, container_name,
+              object_name, headers, query):
+        """
+        Copies an object as a PUT with X-Copy-From or a COPY does,
+        returning the status, reason, headers and body of the response.
+
+        The copy keeps the source's metadata, updated with any given in
+        headers unless X-Fresh-Metadata is true. Large objects are
+        copied as the contents of their segments, read and written as
+        with a GET and PUT, unless multipart-manifest=get asks for the
+        manifest itself to be copied. Other objects are copied with
+        :py:func:`_copy_file`, usually without reading them at all.
+        """
+        hdrs = {}
+        body = ''
+        source_path = path_join(
+            self.local_path, _encode_name(source_container),
+            _encode_name(source_object))
+        row = None
+        if exists(source_path):
+            row = self._get_db().execute('''
+                SELECT put_timestamp, byte_count, etag, content_type,
+                    metadata, digest
+                FROM object_entry
+                WHERE container_name = ? AND object_name = ?
+            ''', (source_container, source_object)).fetchone()
+        if not row or not isdir(
+                path_join(self.local_path, _encode_name(container_name))):
+            status = 404
+            reason = 'Not Found'
+            hdrs['content-length'] = str(len(body))
+            return status, reason, hdrs, body
+        metadata = loads(row['metadata'] or '{}')
+        if headers.get('x-fresh-metadata', '').lower() in (
+                '1', 'on', 't', 'true', 'y', 'yes'):
+            metadata = {}
+        metadata.update(_stored_headers(headers))
+        content_type = headers.get('content-type', row['content_type'])
+        large = 'x-object-manifest' in metadata or \
+            'x-static-large-object' in metadata
+        if large and query.get('multipart-manifest') != 'get':
+            metadata.pop('x-object-manifest', None)
+            metadata.pop('x-static-large-object', None)
+            put_headers = dict(metadata)
+            if content_type:
+                put_headers['content-type'] = content_type
+            status, reason, source_hdrs, contents = self._object(
+                'GET', source_container, source_object, None, {}, True,
+                {}, False)
+            put_headers['content-length'] = source_hdrs['content-length']
+            try:
+                status, reason, hdrs, body = self._object(
+                    'PUT', container_name, object_name, contents,
+                    put_headers, False, {}, False)
+            finally:
+                contents.close()
+        else:
+            etag = row['etag'] or self._legacy_etag(
+                source_container, source_object, source_path)
+            temp_path = path_join(
+                self.local_path, _encode_name(container_name),
+                '_-temp' + uuid4().hex)
+            try:
+                how = _copy_file(source_path, temp_path, self.chunk_size)
+            except (IOError, OSError):
+                if exists(temp_path):
+                    unlink(temp_path)
+                if exists(source_path):
+                    raise
+                # The source was deleted since it was looked up.
+                status = 404
+                reason = 'Not Found'
+                hdrs['content-length'] = str(len(body))
+                return status, reason, hdrs, body
+            self.verbose(
+                'Copied %s/%s to %s/%s by %s', source_container,
+                source_object, container_name, object_name, how)
+            timestamp = '%.5f' % time()
+            with _transaction(self._get_db()) as db:
+                self._index_object(
+                    db, container_name, object_name, temp_path,
+                    row['digest'], (
+                        timestamp, row['byte_count'], etag, content_type,
+                        dumps(metadata)))
+            status = 201
+            reason = 'Created'
+            hdrs['etag'] = etag
+            hdrs['last-modified'] = _http_date(timestamp)
+        if status == 201:
+            hdrs['x-copied-from'] = quote(
+                '%s/%s' % (source_container, source_object))
+            hdrs['x-copied-from-last-modified'] = \
+                _http_date(row['put_timestamp'])
+        hdrs['content-length'] = str(len(body))
+        return status, reason, hdrs, body
+
+    def _slo_manifest(self, contents, content_length):
+        """
+        Returns the manifest of a static large object as Swift stores
+        it, made from the manifest put in contents, and the list of
+        any problems found checking it against its segments.
+        """
+        data = ''
+        if contents:
+            data = contents.read(content_length) \
+                if content_length is not None else contents.read()
+        if isinstance(data, six.binary_type):
+            data = data.decode('utf8')
+        try:
+            items = loads(data)
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or not items:
+            return [], ['Manifest must be a JSON list of segments']
+        db = self._get_db()
+        manifest = []
+        errors = []
+        for item in items:
+            try:
+                path = item['path']
+                container_name, object_name = path.lstrip('/').split('/', 1)
+                size = item.get('size_bytes')
+                if size is not None:
+                    size = int(size)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                errors.append('%r: Invalid segment' % (item,))
+                continue
+            row = db.execute('''
+                SELECT put_timestamp, byte_count, etag, content_type
+                FROM object_entry
+                WHERE container_name = ? AND object_name = ?
+            ''', (container_name, object_name)).fetchone()
+            if not row:
+                errors.append('%s: 404 Not Found' % path)
+                continue
+            etag = row['etag'] or self._legacy_etag(
+                container_name, object_name, path_join(
+                    self.local_path, _encode_name(container_name),
+                    _encode_name(object_name)))
+            if item.get('etag') and item['etag'].strip('"').lower() != etag:
+                errors.append('%s: Etag Mismatch' % path)
+            elif size is not None and size != row['byte_count']:
+                errors.append('%s: Size Mismatch' % path)
+            else:
+                manifest.append({
+                    'name': '/%s/%s' % (container_name, object_name),
+                    'bytes': row['byte_count'], 'hash': etag,
+                    'content_type': row['content_type'] or
+                    'application/octet-stream',
+                    'last_modified': _listing_date(row['put_timestamp'])})
+        return manifest, errors
+
+    def _dlo_segments(self, manifest):
+        """
+        Returns the list of (container_name, object_name, size, etag)
+        of the segments of a dynamic large object, those named with the
+        container/prefix of its X-Object-Manifest, in order.
+        """
+        container_name, _junk, prefix = unquote(manifest).partition('/')
+        db = self._get_db()
+        segments = []
+        marker = ''
+        while True:
+            listing = self._listing(db, '''
+                SELECT object_name AS name, byte_count AS bytes, etag
+                FROM object_entry
+            ''', 'object_name', ['container_name = ?'], [container_name],
+                {'prefix': prefix, 'marker': marker})
+            if not listing:
+                break
+            for item in listing:
+                etag = item['etag'] or self._legacy_etag(
+                    container_name, item['name'], path_join(
+                        self.local_path, _encode_name(container_name),
+                        _encode_name(item['name'])))
+                segments.append(
+                    (container_name, item['name'], item['bytes'], etag))
+            marker = listing[-1]['name']
+        return segments
+
+    def _slo_segments(self, fs_object_path):
+        """
+        Returns the list of (container_name, object_name, size, etag)
+        of the segments of the static large object whose manifest is
+        stored at fs_object_path.
+        """
+        with open(fs_object_path, 'rb') as fp:
+            manifest = loads(fp.read().decode('utf8'))
+        segments = []
+        for item in manifest:
+            container_name, object_name = \
+                item['name'].lstrip('/').split('/', 1)
+            segments.append(
+                (container_name, object_name, item['bytes'], item['hash']))
+        return segments
+
+    def _segment_chunks(self, segments, start, stop):
+        """
+        Yields the bytes from start to stop of the concatenation of
+        the segments given, opening each segment only once it is
+        reached.
+        """
+        offset = 0
+        for container_name, object_name, size, _junk in segments:
+            if offset >= stop:
+                break
+            if offset + size > start:
+                fs_object_path = path_join(
+                    self.local_path, _encode_name(container_name),
+                    _encode_name(object_name))
+                with open(fs_object_path, 'rb') as fp:
+                    if start > offset:
+                        fp.seek(start - offset)
+                    left = min(offset + size, stop) - max(offset, start)
+                    while left > 0:
+                        chunk = fp.read(min(left, self.chunk_size))
+                        if not chunk:
+                            raise Exception(
+                                'Segment %s/%s is shorter than its %d '
+                                'bytes' % (container_name, object_name, size))
+                        left -= len(chunk)
+                        yield chunk
+            offset += size
+
+    def _legacy_etag(self, container_name, object_name, fs_object_path):
+        """
+        Computes and stores the ETag of an object put by an older
+        release, which did not store one.
+        """
+        hasher = md5()
+        with open(fs_object_path, 'rb') as fp:
+            chunk = fp.read(self.chunk_size)
+            while chunk:
+                hasher.update(chunk)
+                chunk = fp.read(self.chunk_size)
+        etag = hasher.hexdigest()
+        with _transaction(self._get_db()) as db:
+            db.execute('''
+                UPDATE object_entry
+                SET etag = ?
+                WHERE container_name = ? AND object_name = ?
+            ''', (etag, container_name, object_name))
+        return etag
+
     def get_account_hash(self):
         """
         See :py:func:`swiftly.client.client.Client.get_account_hash`
@@ -20,83 +20,150 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import collections
+import threading
+import time as _time
 
 import six
 
-class _Node(object):
 
-    def __init__(self, key, val, prv, nxt):
-        self.key = key
-        self.val = val
-        self.prv = prv
-        self.nxt = nxt
+#: Expiry times larger than this many seconds are absolute Unix
+#: timestamps rather than relative ones, as with memcached.
+_RELATIVE_LIMIT = 30 * 24 * 60 * 60
+
+
+def _expires(timeout, time):
+    # Swift passes time= now; older releases passed timeout=.
+    time = time or timeout
+    if not time:
+        return None
+    if time > _RELATIVE_LIMIT:
+        return time
+    return _time.time() + time
+
+
+def _size(key, value):
+    # Only an estimate to bound memory by; the values are never actually
+    # serialized.
+    return len(key) + len(repr(value))
 
 
 class LocalMemcache(object):
+    """
+    A least recently used cache bounded by both its number of entries
+    and an estimate of their size in bytes; entries also expire as
+    requested by the time given when they are set. It is safe to share
+    between threads and greenthreads.
+    """
 
     def __init__(self, name=None, parsed_conf=None, next_app=None):
-        self.max_count = 1000
+        self.max_count = 10000
+        self.max_bytes = 64 * 1024 * 1024
         # Copy all items from the parsed_conf to actual instance attributes.
         if parsed_conf:
             for k, v in six.iteritems(parsed_conf):
                 setattr(self, k, v)
         self.name = name
         self.next_app = next_app
-        self.cache = {}
-        self.first = None
-        self.last = None
-        self.count = 0
+        # Values are (expires, size, value) tuples, least recently used
+        # first.
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        #: The estimated size of all entries, in bytes.
+        self.bytes = 0
+        #: The number of gets answered from the cache.
+        self.hits = 0
+        #: The number of gets not answered from the cache.
+        self.misses = 0
+        #: The number of entries dropped to stay within max_count or
+        #: max_bytes.
+        self.evictions = 0
+
+    @property
+    def count(self):
+        return len(self.cache)
 
     def __call__(self, env, start_response):
         env['memcache'] = self
         return self.next_app(env, start_response)
 
+    def _get(self, key):
+        # Must be called with the lock held.
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= _time.time():
+            self.bytes -= entry[1]
+            return None
+        self.cache[key] = entry
+        return entry
+
+    def _set(self, key, value, expires):
+        # Must be called with the lock held.
+        entry = self.cache.pop(key, None)
+        if entry:
+            self.bytes -= entry[1]
+        size = _size(key, value)
+        if size > self.max_bytes:
+            return
+        self.cache[key] = (expires, size, value)
+        self.bytes += size
+        while len(self.cache) > self.max_count or \
+                self.bytes > self.max_bytes:
+            self.bytes -= self.cache.popitem(last=False)[1][1]
+            self.evictions += 1
+
     def set(self, key, value, serialize=True, timeout=0, time=0):
-        self.delete(key)
-        self.last = node = _Node(key, value, self.last, None)
-        if node.prv:
-            node.prv.nxt = node
-        elif not self.first:
-            self.first = node
-        self.cache[key] = node
-        self.count += 1
-        if self.count > self.max_count:
-            self.delete(self.first.key)
+        expires = _expires(timeout, time)
+        with self.lock:
+            self._set(key, value, expires)
 
     def get(self, key):
-        node = self.cache.get(key)
-        return node.val if node else None
+        with self.lock:
+            entry = self._get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
 
     def incr(self, key, delta=1, timeout=0, time=0):
-        result = (self.get(key) or 0) + delta
-        self.set(key, result)
-        return result
+        with self.lock:
+            entry = self._get(key)
+            if entry is None:
+                # As with memcached, a new counter gets the expiry given
+                # but an existing one keeps its own.
+                expires = _expires(timeout, time)
+                result = delta
+            else:
+                expires = entry[0]
+                result = int(entry[2]) + delta
+            # Also as with memcached, counters do not go below zero.
+            result = max(result, 0)
+            self._set(key, result, expires)
+            return result
 
     def decr(self, key, delta=1, timeout=0, time=0):
         return self.incr(key, delta=-delta, timeout=timeout, time=time)
 
     def delete(self, key):
-        node = self.cache.get(key)
-        if node:
-            del self.cache[key]
-            if node.prv:
-                node.prv.nxt = node.nxt
-            if node.nxt:
-                node.nxt.prv = node.prv
-            if self.first == node:
-                self.first = node.nxt
-            if self.last == node:
-                self.last = node.prv
-            self.count -= 1
+        with self.lock:
+            entry = self.cache.pop(key, None)
+            if entry:
+                self.bytes -= entry[1]
 
     def set_multi(self, mapping, server_key, serialize=True, timeout=0,
                   time=0):
-        for key, value in six.iteritems(mapping):
-            self.set(key, value)
+        expires = _expires(timeout, time)
+        with self.lock:
+            for key, value in six.iteritems(mapping):
+                self._set(key, value, expires)
 
     def get_multi(self, keys, server_key):
         return [self.get(k) for k in keys]
 
     @classmethod
     def parse_conf(cls, name, conf):
-        return {'max_count': conf.get_int(name, 'max_count', 1000)}
+        return {
+            'max_count': conf.get_int(name, 'max_count', 10000),
+            'max_bytes': conf.get_int(name, 'max_bytes', 64 * 1024 * 1024)}
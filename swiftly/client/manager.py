@@ -18,13 +18,56 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import contextlib
+import functools
+import threading
+import time
+
 from six.moves import queue
 
 
+#: The client attributes that hold the results of authentication; these
+#: are shared by all the clients of a ClientManager.
+AUTH_ATTRIBUTES = (
+    'storage_url', 'cdn_url', 'auth_token', 'auth_token_expires', 'regions',
+    'default_region')
+
+
+class ClientPoolTimeout(Exception):
+    """
+    Raised by :py:meth:`ClientManager.get_client` when the pool is at
+    its maximum size and no client was returned to it in time.
+    """
+    pass
+
+
 class ClientManager(object):
     """
     Can be used to manage a set of clients.
 
+    Clients that authenticate (those with an auth_token attribute,
+    such as :py:class:`swiftly.client.standardclient.StandardClient`)
+    share a single authentication: only one client at a time performs
+    auth requests and the resulting storage URL, token, etc. are given
+    to every other client, both new ones and those needing a new token
+    after a 401 or as their token nears expiry.
+
+    The following keyword args are used by the manager itself rather
+    than passed to the client constructor:
+
+    ============  =======================================================
+    pool_min      The number of clients :py:meth:`warm` prepares by
+                  default. Default: 0
+    pool_max      The most clients that will exist at once; once
+                  reached, get_client waits for a client to be
+                  returned. Default: None, no limit.
+    pool_timeout  The seconds get_client waits before raising
+                  :py:exc:`ClientPoolTimeout`. Default: None, forever.
+    head_cache    A :py:class:`swiftly.client.headcache.HeadCache` set
+                  as the head_cache of every client, so repeated HEADs
+                  through any of them are answered from it and writes
+                  through any of them invalidate it. Default: None
+    ============  =======================================================
+
     :param client_class: The class to create when a new client is
         needed.
     :param args: The args for the client constructor.
@@ -32,28 +75,108 @@ class ClientManager(object):
     """
 
     def __init__(self, client_class, *args, **kwargs):
+        self.pool_min = kwargs.pop('pool_min', 0)
+        self.pool_max = kwargs.pop('pool_max', None)
+        self.pool_timeout = kwargs.pop('pool_timeout', None)
+        self.head_cache = kwargs.pop('head_cache', None)
         self.client_class = client_class
         self.args = args
         self.kwargs = kwargs
         self.clients = queue.Queue()
         self.client_id = 0
+        self.pool_size = 0
+        self.pool_lock = threading.Lock()
+        self.sleep = time.sleep
+        self.auth_values = None
+        self.auth_lock = threading.Lock()
 
-    def get_client(self):
+    def _auth_seed(self, client):
+        if self.auth_values and \
+                client.auth_token != self.auth_values['auth_token']:
+            if client.storage_url != self.auth_values['storage_url'] or \
+                    client.cdn_url != self.auth_values['cdn_url']:
+                client.reset()
+            for name, value in self.auth_values.items():
+                setattr(client, name, value)
+
+    def _auth(self, client):
+        stale_token = client.auth_token
+        # Non-blocking with sleeps so Eventlet can run the other green
+        # threads, one of which may be holding the lock.
+        while not self.auth_lock.acquire(False):
+            client.sleep(0.01)
+        try:
+            if self.auth_values and \
+                    self.auth_values['auth_token'] != stale_token:
+                client.verbose('Using auth shared by the client manager.')
+                self._auth_seed(client)
+                return
+            type(client).auth(client)
+            self.auth_values = dict(
+                (name, getattr(client, name, None))
+                for name in AUTH_ATTRIBUTES)
+        finally:
+            self.auth_lock.release()
+
+    def _new_client(self):
+        with self.pool_lock:
+            if self.pool_max is not None and self.pool_size >= self.pool_max:
+                return None
+            self.pool_size += 1
+            self.client_id += 1
+            client_id = self.client_id
+        try:
+            kwargs = dict(self.kwargs)
+            kwargs['verbose_id'] = kwargs.get(
+                'verbose_id', '') + str(client_id)
+            client = self.client_class(*self.args, **kwargs)
+        except Exception:
+            with self.pool_lock:
+                self.pool_size -= 1
+            raise
+        if hasattr(client, 'auth_token'):
+            client.auth = functools.partial(self._auth, client)
+        if self.head_cache:
+            client.head_cache = self.head_cache
+        # Waits for a returned client should use the same sleep as the
+        # clients so Eventlet can run the green threads returning them.
+        self.sleep = getattr(client, 'sleep', self.sleep)
+        return client
+
+    def get_client(self, timeout=None):
         """
         Obtains a client for use, whether an existing unused client
-        or a brand new one if none are available.
+        or a brand new one if none are available. If the pool is at
+        pool_max, this waits for a client to be returned.
+
+        :param timeout: The seconds to wait for a client before
+            raising :py:exc:`ClientPoolTimeout`. Default: pool_timeout
         """
         client = None
         try:
             client = self.clients.get(block=False)
         except queue.Empty:
-            pass
+            client = self._new_client()
         if not client:
-            self.client_id += 1
-            kwargs = dict(self.kwargs)
-            kwargs['verbose_id'] = kwargs.get(
-                'verbose_id', '') + str(self.client_id)
-            client = self.client_class(*self.args, **kwargs)
+            if timeout is None:
+                timeout = self.pool_timeout
+            give_up = None if timeout is None else time.time() + timeout
+            while not client:
+                try:
+                    client = self.clients.get(block=False)
+                except queue.Empty:
+                    # A client evicted meanwhile frees a place for a new
+                    # one rather than returning a client to the pool.
+                    client = self._new_client()
+                    if client:
+                        break
+                    if give_up is not None and time.time() >= give_up:
+                        raise ClientPoolTimeout(
+                            'No client available after %ss; all %s are in '
+                            'use.' % (timeout, self.pool_max))
+                    self.sleep(0.01)
+        if hasattr(client, 'auth_token'):
+            self._auth_seed(client)
         return client
 
     def put_client(self, client):
@@ -65,13 +188,63 @@ class ClientManager(object):
         """
         self.clients.put(client)
 
+    def evict_client(self, client):
+        """
+        Discards a client obtained with get_client rather than
+        returning it to the pool, such as after an exception left its
+        state uncertain; this frees its place for a new client.
+        """
+        try:
+            client.reset()
+        except Exception:
+            pass
+        with self.pool_lock:
+            self.pool_size -= 1
+
     @contextlib.contextmanager
-    def with_client(self):
+    def with_client(self, timeout=None):
         """
         A context manager that obtains a client for use, whether an
         existing unused client or a brand new one if none are
-        available.
+        available. If an exception is raised within the context, the
+        client is evicted rather than returned to the pool.
+
+        :param timeout: See :py:meth:`get_client`.
         """
-        client = self.get_client()
-        yield client
+        client = self.get_client(timeout=timeout)
+        try:
+            yield client
+        except Exception:
+            self.evict_client(client)
+            raise
         self.put_client(client)
+
+    def warm(self, count=None):
+        """
+        Prepares count clients, default pool_min, before they are
+        needed: each is authenticated (once, shared as usual) and has
+        made a HEAD request of the account to establish its
+        connection. The clients are then returned to the pool. Clients
+        made earlier count toward count, so once the pool has warmed
+        further calls do nothing.
+        """
+        if count is None:
+            count = self.pool_min
+        if self.pool_max is not None:
+            count = min(count, self.pool_max)
+        if self.pool_size >= count:
+            return
+        clients = []
+        try:
+            while len(clients) < count:
+                client = self.get_client()
+                clients.append(client)
+                try:
+                    client.head_account()
+                except Exception:
+                    clients.pop()
+                    self.evict_client(client)
+                    raise
+        finally:
+            for client in clients:
+                self.put_client(client)
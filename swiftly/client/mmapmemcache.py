@@ -0,0 +1,245 @@
+"""
+Provides a memcache client lookalike kept in a memory mapped file,
+for use as the memcache of Swift Proxy Server code.
+
+Every process that maps the same file shares the cached account and
+container info, so a host running many direct mode workers looks
+each up once rather than once per worker. The file is a fixed number
+of fixed size slots, grouped in sets of four; a key may only be kept
+in the four slots of the set its hash picks, replacing the entry in
+that set written longest ago once the set is full. Values are stored
+as JSON and values too large for a slot are not cached. Access is
+serialized by an flock of the file.
+
+See swift.common.memcached.MemcacheRing for what this is acting as.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time as _time
+
+import six
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from swiftly.client.localmemcache import _expires
+
+
+#: The magic, version, slot count and slot size at the start of a file.
+_HEADER = struct.Struct('<4sIII')
+_MAGIC = b'SWMC'
+_VERSION = 1
+
+#: The key hash, expiry time (0 for never), write time and value length
+#: at the start of each slot.
+_SLOT_HEADER = struct.Struct('<16sddI')
+
+#: The number of slots a key may be kept in.
+_WAYS = 4
+
+
+class MmapMemcache(object):
+    """
+    A memcache lookalike shared through the memory mapped file at
+    path, which is created if needed. A file that already exists keeps
+    the slots and slot_size it was created with.
+
+    :param path: The file to keep the cache in.
+    :param slots: The number of entries the file can hold.
+        Default: 16384
+    :param slot_size: The size of each slot in bytes; values must
+        serialize to somewhat less than this to be cached.
+        Default: 4096
+    """
+
+    def __init__(self, path, slots=16384, slot_size=4096):
+        self.path = os.path.expanduser(path)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.lock = threading.Lock()
+        try:
+            with self._locked(exclusive=True):
+                header = os.read(self.fd, _HEADER.size)
+                if len(header) < _HEADER.size:
+                    slots = max(slots // _WAYS, 1) * _WAYS
+                    os.lseek(self.fd, 0, os.SEEK_SET)
+                    os.write(self.fd, _HEADER.pack(
+                        _MAGIC, _VERSION, slots, slot_size))
+                    os.ftruncate(self.fd, _HEADER.size + slots * slot_size)
+                else:
+                    magic, version, slots, slot_size = _HEADER.unpack(header)
+                    if magic != _MAGIC or version != _VERSION:
+                        raise ValueError(
+                            '%s is not a version %s memcache file' %
+                            (self.path, _VERSION))
+            self.slots = slots
+            self.slot_size = slot_size
+            self.map = mmap.mmap(
+                self.fd, _HEADER.size + slots * slot_size)
+        except Exception:
+            os.close(self.fd)
+            raise
+        #: The number of gets answered from the cache, by this instance.
+        self.hits = 0
+        #: The number of gets not answered from the cache, by this
+        #: instance.
+        self.misses = 0
+        #: The number of entries this instance replaced to make room.
+        self.evictions = 0
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive=False):
+        with self.lock:
+            if fcntl:
+                fcntl.flock(
+                    self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _hash(self, key):
+        if isinstance(key, six.text_type):
+            key = key.encode('utf8')
+        return hashlib.md5(key).digest()
+
+    def _offsets(self, digest):
+        first = struct.unpack('<Q', digest[:8])[0] % (self.slots // _WAYS)
+        first *= _WAYS
+        return [
+            _HEADER.size + (first + way) * self.slot_size
+            for way in six.moves.range(_WAYS)]
+
+    def _find(self, digest):
+        # Must be called with the lock held. Returns the offset of the
+        # slot holding digest, or None.
+        for offset in self._offsets(digest):
+            if self.map[offset:offset + 16] == digest:
+                return offset
+        return None
+
+    def _read(self, digest):
+        # Must be called with the lock held. Returns the (offset,
+        # expires, value) of the unexpired entry for digest, or None.
+        offset = self._find(digest)
+        if offset is None:
+            return None
+        _digest, expires, _written, length = _SLOT_HEADER.unpack_from(
+            self.map, offset)
+        if expires and expires <= _time.time():
+            return None
+        start = offset + _SLOT_HEADER.size
+        try:
+            value = json.loads(self.map[start:start + length].decode('utf8'))
+        except ValueError:
+            return None
+        return offset, expires, value
+
+    def _write(self, digest, value, expires):
+        # Must be called with the exclusive lock held.
+        offset = self._find(digest)
+        try:
+            data = json.dumps(value).encode('utf8')
+        except (TypeError, ValueError):
+            data = None
+        if data is None or \
+                len(data) > self.slot_size - _SLOT_HEADER.size:
+            if offset is not None:
+                self.map[offset:offset + 16] = b'\x00' * 16
+            return
+        now = _time.time()
+        if offset is None:
+            oldest = None
+            for candidate in self._offsets(digest):
+                _digest, cexpires, written, _length = \
+                    _SLOT_HEADER.unpack_from(self.map, candidate)
+                if _digest == b'\x00' * 16 or (cexpires and cexpires <= now):
+                    offset = candidate
+                    break
+                if oldest is None or written < oldest:
+                    oldest = written
+                    offset = candidate
+            else:
+                self.evictions += 1
+        _SLOT_HEADER.pack_into(
+            self.map, offset, digest, expires or 0, now, len(data))
+        start = offset + _SLOT_HEADER.size
+        self.map[start:start + len(data)] = data
+
+    def set(self, key, value, serialize=True, timeout=0, time=0):
+        digest = self._hash(key)
+        expires = _expires(timeout, time)
+        with self._locked(exclusive=True):
+            self._write(digest, value, expires)
+
+    def get(self, key):
+        digest = self._hash(key)
+        with self._locked():
+            entry = self._read(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[2]
+
+    def incr(self, key, delta=1, timeout=0, time=0):
+        digest = self._hash(key)
+        with self._locked(exclusive=True):
+            entry = self._read(digest)
+            if entry is None:
+                # As with memcached, a new counter gets the expiry given
+                # but an existing one keeps its own.
+                expires = _expires(timeout, time)
+                result = delta
+            else:
+                expires = entry[1]
+                result = int(entry[2]) + delta
+            # Also as with memcached, counters do not go below zero.
+            result = max(result, 0)
+            self._write(digest, result, expires)
+        return result
+
+    def decr(self, key, delta=1, timeout=0, time=0):
+        return self.incr(key, delta=-delta, timeout=timeout, time=time)
+
+    def delete(self, key):
+        digest = self._hash(key)
+        with self._locked(exclusive=True):
+            offset = self._find(digest)
+            if offset is not None:
+                self.map[offset:offset + 16] = b'\x00' * 16
+
+    def set_multi(self, mapping, server_key, serialize=True, timeout=0,
+                  time=0):
+        expires = _expires(timeout, time)
+        with self._locked(exclusive=True):
+            for key, value in six.iteritems(mapping):
+                self._write(self._hash(key), value, expires)
+
+    def get_multi(self, keys, server_key):
+        return [self.get(k) for k in keys]
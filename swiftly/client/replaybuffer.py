@@ -0,0 +1,157 @@
+"""
+Provides a bounded buffer that lets request bodies read from
+non-seekable sources, such as pipes, be replayed for retries.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import tempfile
+
+
+#: The default number of bytes kept in memory before spilling to a
+#: temporary file.
+DEFAULT_MEMORY_SIZE = 4 * 1024 * 1024
+
+#: The default maximum number of bytes recorded; this matches the
+#: default segment size and the maximum Swift object size.
+DEFAULT_MAX_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class ReplayBuffer(object):
+    """
+    Wraps a readable source, recording what is read so that it can be
+    seeked back to and read again.
+
+    Data is kept in memory up to memory_size bytes and then spills to
+    a temporary file that is removed once the buffer is closed or
+    garbage collected. If more than max_size bytes are read, recording
+    stops, the buffer is released, and :py:attr:`replayable` becomes
+    False; reads continue to pass through from the source but any
+    seek will raise an IOError.
+
+    :param source: The file-like object to read from; only its read
+        method is used.
+    :param memory_size: The number of bytes to hold in memory before
+        spilling to a temporary file.
+    :param max_size: The maximum number of bytes to record, or None
+        for no limit.
+    """
+
+    def __init__(self, source, memory_size=DEFAULT_MEMORY_SIZE,
+                 max_size=DEFAULT_MAX_SIZE):
+        self.source = source
+        self.memory_size = memory_size
+        self.max_size = max_size
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=memory_size)
+        self.recorded = 0
+        self.position = 0
+        self.replayable = True
+        self.eof = False
+
+    def read(self, size=-1):
+        """
+        Reads up to size bytes, or to the end if size is negative;
+        previously recorded data is replayed before more is read from
+        the source.
+        """
+        if self.position < self.recorded:
+            left = self.recorded - self.position
+            self.buffer.seek(self.position)
+            chunk = self.buffer.read(left if size < 0 else min(size, left))
+            self.position += len(chunk)
+            if size < 0:
+                chunk += self.read()
+            return chunk
+        if self.eof:
+            return b''
+        chunk = self.source.read(size)
+        if not chunk:
+            self.eof = True
+            return chunk
+        if self.replayable:
+            if self.max_size is not None and \
+                    self.recorded + len(chunk) > self.max_size:
+                self.replayable = False
+                self.buffer.close()
+                self.buffer = None
+            else:
+                self.buffer.seek(self.recorded)
+                self.buffer.write(chunk)
+                self.recorded += len(chunk)
+        self.position += len(chunk)
+        return chunk
+
+    def tell(self):
+        """
+        Returns the current position.
+        """
+        return self.position
+
+    def seek(self, offset, whence=0):
+        """
+        Seeks to a position within the recorded data. Only whence 0
+        (absolute) and 1 (relative) are supported.
+        """
+        if not self.replayable:
+            raise IOError(
+                'Cannot replay more than %s bytes.' % self.max_size)
+        if whence == 1:
+            offset += self.position
+        elif whence != 0:
+            raise IOError('Unsupported whence %r.' % whence)
+        if offset < 0 or offset > self.recorded:
+            raise IOError(
+                'Cannot seek to %s; only %s bytes recorded.' %
+                (offset, self.recorded))
+        self.position = offset
+        return offset
+
+    def close(self):
+        """
+        Releases the recorded data; the source is not closed.
+        """
+        self.replayable = False
+        if self.buffer:
+            self.buffer.close()
+            self.buffer = None
+
+
+def replay_buffer(contents, headers, memory_size=DEFAULT_MEMORY_SIZE,
+                  max_size=DEFAULT_MAX_SIZE):
+    """
+    Returns a :py:class:`ReplayBuffer` wrapping contents, or None if
+    contents should not be wrapped: it is not readable, it is already
+    seekable, max_size is 0 or None, or its Content-Length header
+    says it is larger than max_size. A smaller Content-Length lowers
+    the max_size of the buffer returned.
+
+    :param contents: The request body.
+    :param headers: The request headers dict, or None.
+    :param memory_size: See :py:class:`ReplayBuffer`.
+    :param max_size: See :py:class:`ReplayBuffer`.
+    """
+    if not max_size or not hasattr(contents, 'read'):
+        return None
+    try:
+        contents.seek(contents.tell())
+        return None
+    except Exception:
+        pass
+    for name, value in (headers or {}).items():
+        if name.lower() == 'content-length':
+            if int(value) > max_size:
+                return None
+            max_size = int(value)
+    return ReplayBuffer(contents, memory_size=memory_size, max_size=max_size)
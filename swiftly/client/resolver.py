@@ -0,0 +1,130 @@
+"""
+Provides a caching resolver that spreads new connections across all
+of a host's addresses.
+
+A proxy tier is often behind a single round-robin name; resolving it
+for every connection costs a lookup each time and, with many
+resolvers, always lands on whichever address comes back first. The
+:py:class:`Resolver` caches the addresses for a while, hands them out
+in turn and stops using, for a while, any address a connection to
+fails or times out.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import socket
+import threading
+import time
+
+
+class Resolver(object):
+    """
+    Caches host addresses and picks among them for new connections.
+
+    :param ttl: Seconds to cache a host's addresses. Default: 60
+    :param eject_time: Seconds to stop using an address after a
+        connection to it fails or times out. Default: 30
+    :param green: True if lookups should use Eventlet's green
+        getaddrinfo so they do not block other green threads.
+    """
+
+    def __init__(self, ttl=60, eject_time=30, green=False):
+        self.ttl = ttl
+        self.eject_time = eject_time
+        if green:
+            from eventlet.green import socket as socket_module
+        else:
+            socket_module = socket
+        self.getaddrinfo = socket_module.getaddrinfo
+        self.cache = {}
+        self.ejected = {}
+        self.turns = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """
+        Returns the list of addresses for host, from the cache if it
+        was resolved less than ttl seconds ago.
+        """
+        key = (host, port)
+        entry = self.cache.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        addresses = []
+        for info in self.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        with self.lock:
+            self.cache[key] = (time.time() + self.ttl, addresses)
+        return addresses
+
+    def candidates(self, host, port):
+        """
+        Returns the addresses of host in the order to try them: the
+        healthy addresses starting with the next in turn, followed by
+        the ejected addresses, those ejected longest ago first.
+        """
+        addresses = self.resolve(host, port)
+        now = time.time()
+        with self.lock:
+            healthy = [a for a in addresses if self.ejected.get(a, 0) <= now]
+            ejected = sorted(
+                (a for a in addresses if a not in healthy),
+                key=lambda a: self.ejected[a])
+            turn = self.turns.get((host, port), 0)
+            self.turns[(host, port)] = turn + 1
+        if healthy:
+            turn %= len(healthy)
+            healthy = healthy[turn:] + healthy[:turn]
+        return healthy + ejected
+
+    def eject(self, address):
+        """
+        Stops handing out address for eject_time seconds.
+        """
+        with self.lock:
+            self.ejected[address] = time.time() + self.eject_time
+
+    def create_connection(self, create_connection, address, *args,
+                          **kwargs):
+        """
+        Wraps a socket.create_connection style function, connecting
+        to the addresses :py:meth:`candidates` returns for the host
+        of address until one succeeds, ejecting each that fails.
+        Additional args are passed on to create_connection.
+        """
+        host, port = address[:2]
+        error = None
+        for candidate in self.candidates(host, port):
+            try:
+                return create_connection((candidate, port), *args, **kwargs)
+            except (socket.error, socket.timeout) as err:
+                self.eject(candidate)
+                error = err
+        raise error or socket.error('No addresses found for %s' % host)
+
+
+_default_resolvers = {}
+
+
+def default_resolver(green=False):
+    """
+    Returns the process-wide :py:class:`Resolver` for clients using
+    the given kind of sockets.
+    """
+    if green not in _default_resolvers:
+        _default_resolvers[green] = Resolver(green=green)
+    return _default_resolvers[green]
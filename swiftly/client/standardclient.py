@@ -16,21 +16,61 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import contextlib
 import errno
+import functools
 import json
 import os
+import socket
 import tempfile
 from codecs import decode, encode
+from io import BytesIO
 from time import time
 
 import six
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from swiftly.client.client import Client
-from swiftly.client.utils import headers_to_dict, quote
+from swiftly.client.hedging import default_hedger
+from swiftly.client.httpcache import HTTPCache
+from swiftly.client.resolver import default_resolver
+from swiftly.client.replaybuffer import DEFAULT_MAX_SIZE, \
+    DEFAULT_MEMORY_SIZE, replay_buffer
+from swiftly.client.utils import headers_to_dict, iso8601_to_timestamp, \
+    quote
 
 from six.moves import urllib_parse as urlparse
 from six.moves import StringIO
 
 
+class _DeadlineResponse(object):
+    """
+    Wraps a response so each read is first limited to the time left
+    before the request's deadline.
+    """
+
+    def __init__(self, resp, set_timeouts, chunk_size):
+        self.resp = resp
+        self.set_timeouts = set_timeouts
+        self.chunk_size = chunk_size
+
+    def __getattr__(self, name):
+        return getattr(self.resp, name)
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            chunks = []
+            chunk = self.read(self.chunk_size)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.read(self.chunk_size)
+            return b''.join(chunks)
+        self.set_timeouts()
+        return self.resp.read(amt)
+
+
 class StandardClient(Client):
     """
     The standard client for accessing Swift services.
@@ -50,7 +90,45 @@ class StandardClient(Client):
     :param auth_cache_path: Default: None. If set to a path, the
         storage URL and auth token are cached in the file for reuse.
         If there are already cached values in the file, they are used
-        without authenticating first.
+        without authenticating first. The file may be shared by many
+        clients and processes; authentication is serialized with a
+        lock on a ``.lock`` file next to it so that when several
+        clients need a new token only one authenticates and the rest
+        use the token it cached.
+    :param auth_refresh_margin: When the auth system says when a
+        token expires, a new token is obtained this many seconds
+        before then rather than waiting for a 401. Only one early
+        refresh is made for each token and the margin is never more
+        than half the token's lifetime. Default: 120
+    :param http2: Default: False. If True, storage and CDN requests
+        use HTTP/2 streams over connections shared with every other
+        client in the process using HTTP/2, rather than a connection
+        per client; see :py:mod:`swiftly.client.h2transport`. May
+        also be a :py:class:`swiftly.client.h2transport.H2SessionPool`
+        to share connections only with clients given the same pool.
+        Requires the h2 package. Auth requests always use HTTP/1.1.
+    :param resolver: Default: True. New connections go to the
+        addresses of a host in turn, skipping for a while any that
+        failed to connect, using the process-wide
+        :py:class:`swiftly.client.resolver.Resolver` that caches
+        addresses for a minute. May also be a Resolver instance, or
+        False to have each connection resolve the host itself. Has no
+        effect with Python 2's httplib, which offers no way to choose
+        the address connected to.
+    :param hedge: Default: False. If True, GET and HEAD requests whose
+        responses have not begun within the 95th percentile of recent
+        response times are sent again on another connection, and the
+        response that begins first is used; at most 5% of requests are
+        hedged. The process-wide
+        :py:class:`swiftly.client.hedging.Hedger` tracks the response
+        times; a Hedger instance may be given instead to share them
+        only with clients given the same one. Has no effect on HTTP/2
+        requests.
+    :param http_cache: Default: None. If set to a directory path, or a
+        :py:class:`swiftly.client.httpcache.HTTPCache`, GET responses
+        with an ETag or Last-Modified header are cached there and
+        later GETs of the same paths ask for the body only if it has
+        changed, using the cached copy if not.
     :param region: The region to access, if supported by auth
         (Example: DFW).
     :param snet: Uses the internalURL if Auth v2 is used or prepends
@@ -59,7 +137,19 @@ class StandardClient(Client):
         Cloud Files and wanting to use Rackspace ServiceNet. Default:
         False.
     :param attempts: The number of times to try requests if a server
-        error occurs (5xx response). Default: 5
+        error occurs (5xx response) or a request times out. Default: 5
+    :param connect_timeout: Seconds to wait for a connection to be
+        established. Default: 10
+    :param first_byte_timeout: Seconds to wait, once a request has
+        been sent, for the response to begin. Swift can take a while
+        to respond to some requests, such as server side copies of
+        large objects. Default: 300
+    :param read_timeout: Seconds to wait for each write of a request
+        body or read of a response body, including those made through
+        the response returned with ``stream=True``. Default: 60
+    :param request_timeout: Seconds each attempt at a request may
+        take overall, including reading a response returned with
+        ``stream=True``. Default: None, no limit.
     :param eventlet: Default: None. If True, Eventlet will be used if
         installed. If False, Eventlet will not be used even if
         installed. If None, the default, Eventlet will be used if
@@ -76,13 +166,25 @@ class StandardClient(Client):
         multiple Clients are in use.
     :param bypass_url: The URL to override the storage and CDN URL
         received during authentication.
+    :param replay_memory_size: Request bodies that cannot be seeked,
+        such as pipes, are recorded as they are sent so they can be
+        replayed on retries; this many bytes are kept in memory before
+        spilling to a temporary file. Default: 4M
+    :param replay_max_size: The most bytes of such a body to record;
+        larger bodies are sent without the ability to retry. Set to 0
+        to disable recording. Default: 5G, the maximum object size.
     """
 
     def __init__(self, auth_methods=None, auth_url=None, auth_tenant=None,
                  auth_user=None, auth_key=None, auth_cache_path=None,
                  region=None, snet=False, attempts=5, eventlet=None,
                  chunk_size=65536, http_proxy=None, verbose=None,
-                 verbose_id='', insecure=False, bypass_url=None):
+                 verbose_id='', insecure=False, bypass_url=None,
+                 replay_memory_size=DEFAULT_MEMORY_SIZE,
+                 replay_max_size=DEFAULT_MAX_SIZE, auth_refresh_margin=120,
+                 http2=False, resolver=True, connect_timeout=10,
+                 first_byte_timeout=300, read_timeout=60,
+                 request_timeout=None, hedge=False, http_cache=None):
         super(StandardClient, self).__init__()
         self.auth_methods = auth_methods
         self.auth_url = auth_url.rstrip('/') if auth_url else None
@@ -90,10 +192,17 @@ class StandardClient(Client):
         self.auth_user = auth_user
         self.auth_key = auth_key
         self.auth_cache_path = auth_cache_path
+        self.auth_refresh_margin = auth_refresh_margin
         self.region = region
         self.snet = snet
         self.attempts = attempts
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.read_timeout = read_timeout
+        self.request_timeout = request_timeout
         self.chunk_size = chunk_size
+        self.replay_memory_size = replay_memory_size
+        self.replay_max_size = replay_max_size
         self.http_proxy = http_proxy
         self.bypass_url = bypass_url.rstrip('/') if bypass_url else None
         if verbose:
@@ -106,6 +215,11 @@ class StandardClient(Client):
         if self._verbose_id:
             self._verbose_id += ' '
         self.auth_token = None
+        self.auth_token_expires = None
+        # When the token was obtained, if known; see _auth_expiring.
+        self.auth_token_issued = None
+        # The token an early refresh was last made for.
+        self.auth_refreshed_token = None
         self.regions = []
         self.default_region = None
         self.storage_url = None
@@ -115,6 +229,7 @@ class StandardClient(Client):
         self.storage_path = None
         self.cdn_conn = None
         self.cdn_path = None
+        green = False
         if eventlet is None:
             try:
                 import eventlet
@@ -129,6 +244,7 @@ class StandardClient(Client):
                 self.HTTPConnection = eventlet.green.httplib.HTTPConnection
                 self.HTTPSConnection = eventlet.green.httplib.HTTPSConnection
                 self.HTTPException = eventlet.green.httplib.HTTPException
+                green = True
                 try:
                     import swift.common.bufferedhttp
                     self.HTTPConnection = \
@@ -162,6 +278,33 @@ class StandardClient(Client):
             except AttributeError:
                 # Legacy Python doesn't verify HTTPS certificates by default
                 pass
+        if resolver is True:
+            resolver = default_resolver(green=green)
+        self.resolver = resolver
+        if hedge is True:
+            hedge = default_hedger()
+        self.hedger = hedge or None
+        if http_cache and not isinstance(http_cache, HTTPCache):
+            http_cache = HTTPCache(http_cache)
+        self.http_cache = http_cache
+        if green:
+            from eventlet.green import select
+        else:
+            import select
+        self.select = select.select
+        self.H2HTTPConnection = self.H2HTTPSConnection = None
+        if http2:
+            from swiftly.client import h2transport
+            if not h2transport.HTTP2_Support:
+                raise ValueError('HTTP/2 requires the h2 package.')
+            pool = http2
+            if pool is True:
+                pool = h2transport.default_session_pool(
+                    sleep=self.sleep, green=green)
+            self.H2HTTPConnection = functools.partial(
+                h2transport.H2HTTPConnection, scheme='http', pool=pool)
+            self.H2HTTPSConnection = functools.partial(
+                h2transport.H2HTTPConnection, scheme='https', pool=pool)
         self._auth_load_cache()
 
     def _auth_save_cache(self):
@@ -172,8 +315,11 @@ class StandardClient(Client):
             data = '\n'.join([
                 self.auth_url, self.auth_user, self.auth_key,
                 self.auth_tenant or '', self.region or '', self.storage_url,
-                self.cdn_url or '', self.auth_token, str(self.snet)])
-            fp, path = tempfile.mkstemp()
+                self.cdn_url or '', self.auth_token, str(self.snet),
+                '%f' % self.auth_token_expires
+                if self.auth_token_expires else ''])
+            fp, path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.auth_cache_path)))
             os.write(fp, encode(data.encode('utf-8'), 'base64'))
             os.close(fp)
             os.rename(path, self.auth_cache_path)
@@ -183,11 +329,16 @@ class StandardClient(Client):
             try:
                 data = decode(open(self.auth_cache_path, 'rb').read(), 'base64').decode('utf-8')
                 data = data.split('\n')
-                if len(data) == 9:
+                if len(data) in (9, 10):
+                    if len(data) == 9:
+                        data.append('')
                     (auth_url, auth_user, auth_key, auth_tenant, region,
                      self.storage_url, self.cdn_url, self.auth_token,
-                     snet) = data
+                     snet, expires) = data
                     snet = snet == 'True'
+                    self.auth_token_expires = None
+                    if expires:
+                        self.auth_token_expires = float(expires)
                     if auth_url != self.auth_url or \
                             auth_user != self.auth_user or \
                             auth_key != self.auth_key or \
@@ -197,6 +348,7 @@ class StandardClient(Client):
                         self.storage_url = None
                         self.cdn_url = None
                         self.auth_token = None
+                        self.auth_token_expires = None
                         self.verbose(
                             'Cache %s did not match new settings; discarding.',
                             self.auth_cache_path)
@@ -226,6 +378,25 @@ class StandardClient(Client):
         self.reset()
         if not self.auth_url:
             raise ValueError('No Auth URL has been provided.')
+        stale_token = self.auth_token
+        with self._auth_cache_lock():
+            if self.auth_cache_path:
+                # Another client may have authenticated while we waited
+                # for the lock; if so, use its token rather than making
+                # another auth request.
+                self._auth_load_cache()
+                if self.storage_url and self.auth_token and \
+                        self.auth_token != stale_token and \
+                        not self._auth_expiring():
+                    self.verbose(
+                        'Using auth response values another client cached '
+                        'in %r.', self.auth_cache_path)
+                    self.auth_token_issued = None
+                    return
+            self._auth()
+            self.auth_token_issued = time()
+
+    def _auth(self):
         funcs = []
         if self.auth_methods:
             for method in self.auth_methods.split(','):
@@ -249,6 +420,51 @@ class StandardClient(Client):
         else:
             raise self.HTTPException('Auth failure %r.' % info)
 
+    @contextlib.contextmanager
+    def _auth_cache_lock(self):
+        if not self.auth_cache_path or not fcntl:
+            yield
+            return
+        path = self.auth_cache_path + '.lock'
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o0600)
+        try:
+            # Non-blocking with sleeps so Eventlet can run the other
+            # green threads, one of which may be holding the lock.
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except IOError as err:
+                    if err.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                self.sleep(0.01)
+            yield
+        finally:
+            os.close(fd)
+
+    def _auth_expiring(self):
+        if self.auth_token_expires is None:
+            return False
+        margin = self.auth_refresh_margin
+        if self.auth_token_issued is not None:
+            margin = min(
+                margin,
+                (self.auth_token_expires - self.auth_token_issued) / 2.0)
+        return time() >= self.auth_token_expires - margin
+
+    def _auth_refresh_due(self):
+        """
+        Returns True if the token should be refreshed before it is
+        used: it is about to expire and no early refresh has been made
+        for it yet, or it has already expired. Auth systems that hand
+        back the same token until it expires would otherwise be asked
+        again on every request made within the margin.
+        """
+        if not self.auth_token or not self._auth_expiring():
+            return False
+        return self.auth_token != self.auth_refreshed_token or \
+            time() >= self.auth_token_expires
+
     def _auth1(self):
         status = 0
         reason = 'Unknown'
@@ -257,14 +473,17 @@ class StandardClient(Client):
             attempt += 1
             self.verbose('Attempting auth v1 with %s', self.auth_url)
             parsed, conn = self._connect(self.auth_url)
+            self._set_timeouts(conn, self.read_timeout)
             self.verbose('> GET %s', parsed.path)
             conn.request(
                 'GET', parsed.path, '',
                 {'User-Agent': self.user_agent,
                  'X-Auth-User': quote(self.auth_user),
                  'X-Auth-Key': quote(self.auth_key)})
+            self._set_timeouts(conn, self.first_byte_timeout)
             try:
                 resp = conn.getresponse()
+                self._set_timeouts(conn, self.read_timeout)
                 status = resp.status
                 reason = resp.reason
                 self.verbose('< %s %s', status, reason)
@@ -292,6 +511,12 @@ class StandardClient(Client):
                     self.storage_url = urlparse.urlunparse(parsed)
                 self.cdn_url = hdrs.get('x-cdn-management-url')
                 self.auth_token = hdrs.get('x-auth-token')
+                self.auth_token_expires = None
+                try:
+                    self.auth_token_expires = \
+                        time() + float(hdrs['x-auth-token-expires'])
+                except (KeyError, ValueError):
+                    pass
                 if not self.auth_token:
                     self.auth_token = hdrs.get('x-storage-token')
                     if not self.auth_token:
@@ -304,7 +529,7 @@ class StandardClient(Client):
                 break
             elif status // 100 != 5:
                 break
-            self.client.sleep(2 ** attempt)
+            self.sleep(2 ** attempt)
         return status, reason
 
     def _auth2key(self):
@@ -325,6 +550,7 @@ class StandardClient(Client):
             self.verbose(
                 'Attempting auth v2 %s with %s', cred_type, self.auth_url)
             parsed, conn = self._connect(self.auth_url)
+            self._set_timeouts(conn, self.read_timeout)
             data = {'auth': {cred_type: {'username': self.auth_user}}}
             if cred_type == 'RAX-KSKEY:apiKeyCredentials':
                 data['auth'][cred_type]['apiKey'] = self.auth_key
@@ -339,8 +565,10 @@ class StandardClient(Client):
                 'POST', parsed.path + '/tokens', body,
                 {'Content-Type': 'application/json',
                  'User-Agent': self.user_agent})
+            self._set_timeouts(conn, self.first_byte_timeout)
             try:
                 resp = conn.getresponse()
+                self._set_timeouts(conn, self.read_timeout)
                 status = resp.status
                 reason = resp.reason
                 self.verbose('< %s %s', status, reason)
@@ -406,6 +634,8 @@ class StandardClient(Client):
                     or storage_match4
                 self.cdn_url = cdn_match1 or cdn_match2 or cdn_match3
                 self.auth_token = body['access']['token']['id']
+                self.auth_token_expires = iso8601_to_timestamp(
+                    body['access']['token'].get('expires'))
                 if not self.storage_url:
                     status = 500
                     reason = (
@@ -422,7 +652,12 @@ class StandardClient(Client):
         return status, reason
 
     def _connect(self, url=None, cdn=False):
+        http_class = self.HTTPConnection
+        https_class = self.HTTPSConnection
         if not url:
+            if self.H2HTTPConnection:
+                http_class = self.H2HTTPConnection
+                https_class = self.H2HTTPSConnection
             if cdn:
                 if not self.cdn_url:
                     self.auth()
@@ -443,24 +678,130 @@ class StandardClient(Client):
         netloc = (http_proxy_parsed if self.http_proxy else parsed).netloc
         if parsed.scheme == 'http':
             self.verbose('Establishing HTTP connection to %s', netloc)
-            conn = self.HTTPConnection(netloc)
+            conn = http_class(netloc)
         elif parsed.scheme == 'https':
             self.verbose('Establishing HTTPS connection to %s', netloc)
-            conn = self.HTTPSConnection(netloc)
+            conn = https_class(netloc)
         else:
             raise self.HTTPException(
                 'Cannot handle protocol scheme %s for url %s' %
                 (parsed.scheme, repr(url)))
+        if self.resolver and hasattr(conn, '_create_connection'):
+            conn._create_connection = functools.partial(
+                self.resolver.create_connection, conn._create_connection)
         if self.http_proxy:
             self.verbose(
                 'Setting tunnelling to %s:%s', parsed.hostname, parsed.port)
             conn._set_tunnel(parsed.hostname, parsed.port)
         return parsed, conn
 
+    def _readable(self, socks, timeout):
+        ready = [s for s in socks if getattr(s, 'pending', lambda: 0)()]
+        if ready:
+            return ready
+        return self.select(socks, [], [], timeout)[0]
+
+    def _hedged_response(self, conn, method, path, headers, cdn, deadline):
+        """
+        Waits for the response to the request sent on conn, sending it
+        again on a new connection if the response has not begun
+        within the hedger's delay. Returns the response that begins
+        first and its connection; the other connection is closed.
+        """
+        begin = time()
+        sock = getattr(conn, 'sock', None)
+        delay = self.hedger.delay()
+        hedge = None
+        if sock and delay is not None and \
+                not self._readable([sock], delay) and self.hedger.spend():
+            self.verbose(
+                'Hedging %s %s after %.03fs', method, path, time() - begin)
+            try:
+                parsed, hedge = self._connect(cdn=cdn)
+                self._set_timeouts(hedge, self.first_byte_timeout, deadline)
+                hedge.request(method, path, None, headers)
+            except Exception as err:
+                self.verbose('Hedge failed: %s %s', type(err), err)
+                if hedge:
+                    hedge.close()
+                hedge = None
+        if hedge:
+            timeout = self._timeout(self.first_byte_timeout, deadline)
+            if timeout is not None:
+                timeout = max(timeout - (time() - begin), 0)
+            ready = self._readable([sock, hedge.sock], timeout)
+            if not ready:
+                hedge.close()
+                raise socket.timeout('timed out')
+            if sock not in ready:
+                self.verbose('Hedge answered first.')
+                self.hedger.won()
+                conn, hedge = hedge, conn
+            hedge.close()
+        resp = conn.getresponse()
+        self.hedger.record(time() - begin)
+        return resp, conn
+
+    def _cache_response(self, key, entry, status, reason, hdrs, value,
+                        stream):
+        """
+        Answers a 304 Not Modified to a GET revalidating entry with
+        the cached response, and stores other cacheable responses.
+        Returns the (status, reason, headers, value) for the caller.
+        """
+        cache = self.http_cache
+        if entry and status == 304:
+            self.verbose('< Using cached response')
+            if stream:
+                value.read()
+                value.close()
+            hdrs = cache.hit(key, entry, hdrs)
+            value = entry['file']
+            if not stream:
+                with value:
+                    value = value.read()
+            return entry['status'], entry['reason'], hdrs, value
+        if entry:
+            entry['file'].close()
+        if cache.storable(status, hdrs) and \
+                (not stream or 'content-length' in hdrs):
+            if stream:
+                body = value.read()
+                value.close()
+                value = BytesIO(body)
+            else:
+                body = value
+            try:
+                cache.store(key, status, reason, hdrs, body)
+            except (IOError, OSError) as err:
+                self.verbose('Could not cache response: %s', err)
+        return status, reason, hdrs, value
+
     def _default_reset_func(self):
         raise self.HTTPException(
             'Failure and no ability to reset contents for reupload.')
 
+    def _timeout(self, timeout, deadline):
+        if deadline is not None:
+            left = deadline - time()
+            if left <= 0:
+                raise socket.timeout('Request deadline exceeded')
+            if timeout is None or left < timeout:
+                timeout = left
+        return timeout
+
+    def _set_timeouts(self, conn, timeout, deadline=None):
+        """
+        Sets the timeout for conn's next operations, limited to the
+        time left before deadline; the connect_timeout is used instead
+        if conn still has to connect.
+        """
+        conn.timeout = self._timeout(self.connect_timeout, deadline)
+        if hasattr(conn, 'settimeout'):
+            conn.settimeout(self._timeout(timeout, deadline))
+        elif getattr(conn, 'sock', None):
+            conn.sock.settimeout(self._timeout(timeout, deadline))
+
     def request(self, method, path, contents, headers, decode_json=False,
                 stream=False, query=None, cdn=False):
         """
@@ -470,6 +811,21 @@ class StandardClient(Client):
             path += '?' + '&'.join(
                 ('%s=%s' % (quote(k), quote(v)) if v else quote(k))
                 for k, v in sorted(six.iteritems(query)))
+        if self._auth_refresh_due():
+            self.verbose('Auth token expires soon; getting a new one.')
+            self.auth_refreshed_token = self.auth_token
+            self.auth()
+        cache_key = cache_entry = None
+        if self.http_cache and method == 'GET' and \
+                self.http_cache.cacheable(headers):
+            if not (self.cdn_url if cdn else self.storage_url):
+                self.auth()
+            cache_key = (self.bypass_url or (
+                self.cdn_url if cdn else self.storage_url) or '') + path
+            cache_entry = self.http_cache.lookup(cache_key)
+            if cache_entry:
+                headers = dict(headers or {})
+                headers.update(self.http_cache.validators(cache_entry))
         reset_func = self._default_reset_func
         if isinstance(contents, six.string_types):
             contents = StringIO(contents)
@@ -483,6 +839,20 @@ class StandardClient(Client):
                 tell = seek = None
         elif not contents:
             reset_func = lambda: None
+        replay = None
+        if not (tell and seek):
+            replay = replay_buffer(
+                contents, headers, memory_size=self.replay_memory_size,
+                max_size=self.replay_max_size)
+        if replay:
+            self.verbose('Buffering request body for replay.')
+            contents = replay
+
+            def reset_func():
+                if not replay.replayable:
+                    self._default_reset_func()
+                replay.seek(0)
+
         status = 0
         reason = 'Unknown'
         attempt = 0
@@ -510,6 +880,9 @@ class StandardClient(Client):
                     raise self.HTTPException(
                         '%s %s failed: No connection' % (method, path))
             self.conn_discard = time() + 4
+            deadline = None
+            if self.request_timeout:
+                deadline = time() + self.request_timeout
             titled_headers = dict((k.title(), v) for k, v in six.iteritems({
                 'User-Agent': self.user_agent,
                 'X-Auth-Token': self.auth_token}))
@@ -517,6 +890,7 @@ class StandardClient(Client):
                 titled_headers.update(
                     (k.title(), v) for k, v in six.iteritems(headers))
             try:
+                self._set_timeouts(conn, self.read_timeout, deadline)
                 if not hasattr(contents, 'read'):
                     if method not in self.no_content_methods and contents and \
                             'Content-Length' not in titled_headers and \
@@ -551,11 +925,19 @@ class StandardClient(Client):
                         verbose_headers)
                     if method not in self.no_content_methods and \
                             content_length is None:
+                        frames_bodies = getattr(conn, 'frames_bodies', False)
                         chunk = contents.read(self.chunk_size)
                         while chunk:
-                            conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+                            self._set_timeouts(
+                                conn, self.read_timeout, deadline)
+                            if frames_bodies:
+                                conn.send(chunk)
+                            else:
+                                conn.send(
+                                    b'%x\r\n' % len(chunk) + chunk + b'\r\n')
                             chunk = contents.read(self.chunk_size)
-                        conn.send('0\r\n\r\n')
+                        if not frames_bodies:
+                            conn.send(b'0\r\n\r\n')
                     else:
                         left = content_length or 0
                         while left > 0:
@@ -565,9 +947,26 @@ class StandardClient(Client):
                             chunk = contents.read(size)
                             if not chunk:
                                 raise IOError('Early EOF from input')
+                            self._set_timeouts(
+                                conn, self.read_timeout, deadline)
                             conn.send(chunk)
                             left -= len(chunk)
-                resp = conn.getresponse()
+                self._set_timeouts(conn, self.first_byte_timeout, deadline)
+                if self.hedger and method in ('GET', 'HEAD'):
+                    resp, conn = self._hedged_response(
+                        conn, method, conn_path + path, titled_headers, cdn,
+                        deadline)
+                    if cdn:
+                        self.cdn_conn = conn
+                    else:
+                        self.storage_conn = conn
+                else:
+                    resp = conn.getresponse()
+                self._set_timeouts(conn, self.read_timeout, deadline)
+                if deadline:
+                    resp = _DeadlineResponse(resp, functools.partial(
+                        self._set_timeouts, conn, self.read_timeout,
+                        deadline), self.chunk_size)
                 status = resp.status
                 reason = resp.reason
                 hdrs = headers_to_dict(resp.getheaders())
@@ -590,6 +989,10 @@ class StandardClient(Client):
                 self.auth()
                 attempt -= 1
             elif status and status // 100 != 5:
+                if cache_key:
+                    status, reason, hdrs, value = self._cache_response(
+                        cache_key, cache_entry, status, reason, hdrs, value,
+                        stream)
                 if not stream and decode_json and status // 100 == 2:
                     if value:
                         value = json.loads(value.decode('utf-8'))
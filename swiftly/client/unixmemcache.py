@@ -0,0 +1,324 @@
+"""
+Provides a memcache client lookalike that talks the memcached text
+protocol over a UNIX socket, and a small server for it to talk to.
+
+The server keeps its entries in a :py:class:`LocalMemcache` and is
+meant to be run once per host, ``python -m swiftly.client.unixmemcache
+PATH``, for all of that host's direct mode workers to share; a real
+memcached listening on a UNIX socket (``memcached -s PATH``) works
+just as well. As with Swift's own memcache client, keys are hashed,
+values are stored as JSON, and any error talking to the server is
+treated as a cache miss.
+
+See swift.common.memcached.MemcacheRing for what this is acting as.
+"""
+"""
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import json
+import math
+import optparse
+import os
+import socket
+import sys
+import threading
+
+import six
+from six.moves import socketserver
+
+from swiftly.client.localmemcache import LocalMemcache, _expires
+
+
+#: The flags of values stored as JSON, as Swift uses.
+_JSON_FLAG = 2
+
+
+def _exptime(timeout, time):
+    # Swift passes time= now; older releases passed timeout=. memcached
+    # only takes whole seconds.
+    return int(math.ceil(time or timeout or 0))
+
+
+class UnixMemcache(object):
+    """
+    A memcache lookalike backed by the memcached listening on the UNIX
+    socket at path.
+
+    :param path: The path of the server's socket.
+    :param timeout: Seconds to wait on the server before giving up
+        and treating the request as a miss. Default: 1
+    :param max_connections: The most idle connections kept open for
+        reuse. Default: 10
+    """
+
+    def __init__(self, path, timeout=1, max_connections=10):
+        self.path = path
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.idle = []
+        self.lock = threading.Lock()
+        #: The number of gets answered from the cache.
+        self.hits = 0
+        #: The number of gets not answered from the cache.
+        self.misses = 0
+        #: The number of requests that failed talking to the server.
+        self.errors = 0
+
+    def _key(self, key):
+        if isinstance(key, six.text_type):
+            key = key.encode('utf8')
+        return hashlib.md5(key).hexdigest().encode('ascii')
+
+    def _request(self, command, body=None, values=False):
+        """
+        Sends command and returns the response line, or the dict of
+        keys to (flags, data) of the values returned if values is True.
+        Returns None if the server could not be talked to.
+        """
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        try:
+            if conn is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                conn = (sock, sock.makefile('rb'))
+            sock, fp = conn
+            request = command + b'\r\n'
+            if body is not None:
+                request += body + b'\r\n'
+            sock.sendall(request)
+            if values:
+                result = {}
+                while True:
+                    line = fp.readline()
+                    if not line.endswith(b'\r\n'):
+                        raise socket.error('Connection lost')
+                    if line == b'END\r\n':
+                        break
+                    parts = line.split()
+                    if parts[0] != b'VALUE':
+                        raise socket.error('Unexpected %r' % line)
+                    data = fp.read(int(parts[3]) + 2)
+                    result[parts[1]] = (int(parts[2]), data[:-2])
+            else:
+                result = fp.readline()
+                if not result.endswith(b'\r\n'):
+                    raise socket.error('Connection lost')
+                result = result[:-2]
+        except (socket.error, socket.timeout, IOError, ValueError,
+                IndexError):
+            self.errors += 1
+            if conn:
+                conn[1].close()
+                conn[0].close()
+            return None
+        with self.lock:
+            if len(self.idle) < self.max_connections:
+                self.idle.append(conn)
+                conn = None
+        if conn:
+            conn[1].close()
+            conn[0].close()
+        return result
+
+    def _store(self, command, key, value, exptime):
+        data = json.dumps(value).encode('utf8')
+        return self._request(
+            b'%s %s %d %d %d' % (command, key, _JSON_FLAG, exptime, len(data)),
+            data)
+
+    def set(self, key, value, serialize=True, timeout=0, time=0):
+        self._store(b'set', self._key(key), value, _exptime(timeout, time))
+
+    def get(self, key):
+        key = self._key(key)
+        values = self._request(b'get ' + key, values=True)
+        value = None
+        if values and key in values:
+            flags, data = values[key]
+            try:
+                value = json.loads(data.decode('utf8')) \
+                    if flags & _JSON_FLAG else data
+            except ValueError:
+                pass
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def incr(self, key, delta=1, timeout=0, time=0):
+        key = self._key(key)
+        command = b'incr' if delta >= 0 else b'decr'
+        for attempt in six.moves.range(2):
+            result = self._request(b'%s %s %d' % (command, key, abs(delta)))
+            if result is None:
+                return None
+            if result != b'NOT_FOUND':
+                return int(result)
+            # As with memcached, a new counter gets the expiry given.
+            if self._store(
+                    b'add', key, max(delta, 0),
+                    _exptime(timeout, time)) == b'STORED':
+                return max(delta, 0)
+        return None
+
+    def decr(self, key, delta=1, timeout=0, time=0):
+        return self.incr(key, delta=-delta, timeout=timeout, time=time)
+
+    def delete(self, key):
+        self._request(b'delete ' + self._key(key))
+
+    def set_multi(self, mapping, server_key, serialize=True, timeout=0,
+                  time=0):
+        exptime = _exptime(timeout, time)
+        for key, value in six.iteritems(mapping):
+            self._store(b'set', self._key(key), value, exptime)
+
+    def get_multi(self, keys, server_key):
+        return [self.get(k) for k in keys]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        memcache = self.server.memcache
+        while True:
+            line = self.rfile.readline()
+            if not line.endswith(b'\r\n'):
+                return
+            parts = line.split()
+            if not parts:
+                self.wfile.write(b'ERROR\r\n')
+                continue
+            command = parts[0]
+            try:
+                if command in (b'get', b'gets'):
+                    for key in parts[1:]:
+                        entry = memcache.get(key)
+                        if entry is not None:
+                            self.wfile.write(b'VALUE %s %d %d\r\n%s\r\n' % (
+                                key, entry[0], len(entry[1]), entry[1]))
+                    self.wfile.write(b'END\r\n')
+                elif command in (b'set', b'add', b'replace'):
+                    key, flags, exptime, size = parts[1:5]
+                    data = self.rfile.read(int(size) + 2)[:-2]
+                    with memcache.lock:
+                        exists = memcache._get(key) is not None
+                        if (command == b'add' and exists) or \
+                                (command == b'replace' and not exists):
+                            response = b'NOT_STORED'
+                        else:
+                            memcache._set(
+                                key, (int(flags), data),
+                                self.server.expires(int(exptime)))
+                            response = b'STORED'
+                    if parts[-1] != b'noreply':
+                        self.wfile.write(response + b'\r\n')
+                elif command in (b'incr', b'decr'):
+                    key, delta = parts[1], int(parts[2])
+                    with memcache.lock:
+                        entry = memcache._get(key)
+                        if entry is None:
+                            response = b'NOT_FOUND'
+                        else:
+                            value = int(entry[2][1])
+                            if command == b'incr':
+                                value += delta
+                            else:
+                                value = max(value - delta, 0)
+                            response = str(value).encode('ascii')
+                            memcache._set(
+                                key, (entry[2][0], response), entry[0])
+                    if parts[-1] != b'noreply':
+                        self.wfile.write(response + b'\r\n')
+                elif command == b'delete':
+                    with memcache.lock:
+                        found = memcache._get(parts[1]) is not None
+                    memcache.delete(parts[1])
+                    if parts[-1] != b'noreply':
+                        self.wfile.write(
+                            b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+                elif command == b'version':
+                    self.wfile.write(b'VERSION swiftly\r\n')
+                elif command == b'quit':
+                    return
+                else:
+                    self.wfile.write(b'ERROR\r\n')
+            except (ValueError, IndexError):
+                self.wfile.write(b'CLIENT_ERROR bad command line format\r\n')
+            self.wfile.flush()
+
+
+class UnixMemcacheServer(socketserver.ThreadingMixIn,
+                         socketserver.UnixStreamServer):
+    """
+    A memcached text protocol server on the UNIX socket at path,
+    keeping entries in memcache, a :py:class:`LocalMemcache` created
+    with the default limits if not given. Any stale socket file at
+    path is replaced.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, memcache=None):
+        self.memcache = memcache or LocalMemcache()
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+    def expires(self, exptime):
+        """
+        Returns the time an entry set with the memcached exptime given
+        expires, or None if it does not.
+        """
+        # memcached takes a negative exptime as already expired.
+        return _expires(0, exptime) if exptime >= 0 else 1
+
+
+def main(args=None):
+    """
+    Runs a :py:class:`UnixMemcacheServer` in the foreground until
+    interrupted.
+    """
+    parser = optparse.OptionParser(
+        usage='Usage: python -m swiftly.client.unixmemcache [options] PATH')
+    parser.add_option(
+        '--max-count', type='int', default=100000,
+        help='The most entries to keep. Default: %default')
+    parser.add_option(
+        '--max-bytes', type='int', default=256 * 1024 * 1024,
+        help='The most bytes of entries to keep, estimated. '
+             'Default: %default')
+    options, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error('A socket PATH is required.')
+    server = UnixMemcacheServer(args[0], LocalMemcache(parsed_conf={
+        'max_count': options.max_count, 'max_bytes': options.max_bytes}))
+    sys.stdout.write('Serving memcache on %s\n' % args[0])
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    os.unlink(args[0])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,8 +17,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import six
+import calendar
 import hashlib
 import hmac
+import re
 import time
 from six.moves import urllib_parse as parse
 
@@ -54,6 +56,32 @@ def get_trans_id_time(trans_id):
     return None
 
 
+def iso8601_to_timestamp(value):
+    """
+    Returns the time.time() for an ISO 8601 date and time string such
+    as those found in auth responses (2014-06-10T14:58:35Z,
+    2014-06-10T14:58:35.000000-05:00, etc.) or None if the value is
+    not understood. Values without a time zone are treated as UTC.
+    """
+    match = re.match(
+        r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(\.\d+)?'
+        r'(Z|[+-]\d\d:?\d\d)?$', (value or '').strip())
+    if not match:
+        return None
+    timestamp = calendar.timegm(
+        tuple(int(v) for v in match.groups()[:6]))
+    if match.group(7):
+        timestamp += float(match.group(7))
+    zone = match.group(8)
+    if zone and zone != 'Z':
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:]) * 60
+        if zone[0] == '+':
+            timestamp -= offset
+        else:
+            timestamp += offset
+    return timestamp
+
+
 def quote(value, safe='/:'):
     """
     Much like parse.quote in that it returns a URL encoded string
@@ -30,7 +30,15 @@ class FileLikeIter(object):
         self.iterator = iter(iterable)
         self.limit = limit
         self.left = limit
+        # The data taken from the iterator but not yet returned is
+        # self.buf[self.pos:]; keeping an offset rather than slicing off
+        # what was returned avoids copying the rest of a large chunk on
+        # every small read.
         self.buf = None
+        self.pos = 0
+        # An empty value of the same type as the chunks, once one has
+        # been seen.
+        self.empty = ''
         self.closed = False
 
     def __iter__(self):
@@ -40,14 +48,62 @@ class FileLikeIter(object):
         """
         x.__next__() -> the next value, or raise StopIteration
         """
+        chunk = self._take(None)
+        if not chunk:
+            raise StopIteration
+        return chunk
+
+    next = __next__
+
+    def _next_chunk(self):
+        """
+        Returns the next non-empty chunk from the iterator, or None.
+        """
+        for chunk in self.iterator:
+            if chunk:
+                self.empty = chunk[:0]
+                return chunk
+        return None
+
+    def _fill(self):
+        """
+        Ensures there is buffered data, returning False at the end of
+        the iterator.
+        """
         if self.closed:
             raise ValueError('I/O operation on closed file')
-        if self.buf:
-            rv = self.buf
+        if self.buf is None:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return False
+            self.buf = chunk
+            self.pos = 0
+        return True
+
+    def _take(self, size):
+        """
+        Returns up to size bytes, or the rest of the current chunk if
+        size is None, from a single chunk and within the limit.
+        """
+        if self.left is not None:
+            size = self.left if size is None else min(size, self.left)
+        if size == 0 or not self._fill():
+            return self.empty
+        end = len(self.buf)
+        if size is not None:
+            end = min(self.pos + size, end)
+        if self.pos == 0 and end == len(self.buf):
+            chunk = self.buf
+        else:
+            chunk = self.buf[self.pos:end]
+        if end == len(self.buf):
             self.buf = None
-            return rv
+            self.pos = 0
         else:
-            return next(self.iterator)
+            self.pos = end
+        if self.left is not None:
+            self.left -= len(chunk)
+        return chunk
 
     def reset_limit(self):
         """
@@ -60,31 +116,40 @@ class FileLikeIter(object):
         read([size]) -> read at most size bytes, returned as a string.
 
         If the size argument is negative or omitted, read until EOF is reached.
-        Notice that when in non-blocking mode, less data than what was
-        requested may be returned, even if no size parameter was given.
+        Otherwise, fewer than size bytes are only returned at EOF.
         """
-        if self.left is not None:
-            size = min(size, self.left)
         if self.closed:
             raise ValueError('I/O operation on closed file')
-        if size < 0:
-            return ''.join(self)
-        elif not size:
-            chunk = ''
-        elif self.buf:
-            chunk = self.buf
-            self.buf = None
-        else:
-            try:
-                chunk = next(self.iterator)
-            except StopIteration:
-                return ''
-        if len(chunk) > size:
-            self.buf = chunk[size:]
-            chunk = chunk[:size]
-        if self.left is not None:
-            self.left -= len(chunk)
-        return chunk
+        if size is None or size < 0:
+            size = None
+        chunks = []
+        got = 0
+        while size is None or got < size:
+            chunk = self._take(None if size is None else size - got)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            got += len(chunk)
+        if len(chunks) == 1:
+            return chunks[0]
+        return self.empty.join(chunks)
+
+    def readinto(self, b):
+        """
+        readinto(b) -> read up to len(b) bytes into b, returning the
+        number of bytes read; fewer are only read at EOF.
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        view = memoryview(b)
+        got = 0
+        while got < len(view):
+            chunk = self._take(len(view) - got)
+            if not chunk:
+                break
+            view[got:got + len(chunk)] = chunk
+            got += len(chunk)
+        return got
 
     def readline(self, size=-1):
         """
@@ -96,23 +161,29 @@ class FileLikeIter(object):
         """
         if self.closed:
             raise ValueError('I/O operation on closed file')
-        data = ''
-        while '\n' not in data and (size < 0 or len(data) < size):
-            if size < 0:
-                chunk = self.read(1024)
+        chunks = []
+        got = 0
+        while size < 0 or got < size:
+            if not self._fill():
+                break
+            newline = b'\n' if isinstance(self.buf, bytes) else u'\n'
+            end = self.buf.find(newline, self.pos)
+            if end < 0:
+                want = len(self.buf) - self.pos
             else:
-                chunk = self.read(size - len(data))
+                want = end + 1 - self.pos
+            if size >= 0:
+                want = min(want, size - got)
+            chunk = self._take(want)
             if not chunk:
                 break
-            data += chunk
-        if '\n' in data:
-            data, sep, rest = data.partition('\n')
-            data += sep
-            if self.buf:
-                self.buf = rest + self.buf
-            else:
-                self.buf = rest
-        return data
+            chunks.append(chunk)
+            got += len(chunk)
+            if chunk[-1:] == newline:
+                break
+        if len(chunks) == 1:
+            return chunks[0]
+        return self.empty.join(chunks)
 
     def readlines(self, sizehint=-1):
         """
@@ -138,17 +209,11 @@ class FileLikeIter(object):
 
     def is_empty(self):
         """
-        Check whether the "file" is empty reading the single byte.
+        Check whether the "file" is empty, without consuming anything.
         """
-        something = self.read(1)
-        if something:
-            if self.buf:
-                self.buf = something + self.buf
-            else:
-                self.buf = something
-            return False
-        else:
+        if self.left == 0:
             return True
+        return not self._fill()
 
     def close(self):
         """
@@ -160,4 +225,5 @@ class FileLikeIter(object):
         may return an exit status upon closing.
         """
         self.iterator = None
+        self.buf = None
         self.closed = True
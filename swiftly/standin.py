@@ -0,0 +1,1114 @@
+"""
+Provides a lightweight, in-memory stand-in for a Swift proxy server.
+
+This is meant for offline benchmarking and experimentation with the
+Swiftly clients; it implements the parts of the Swift API Swiftly
+itself uses and keeps everything in memory, so don't store anything
+you care about in it. Latency and errors can be injected to exercise
+client transport and retry behavior.
+
+If the h2 package is installed, the server also speaks HTTP/2 to
+clients that open a connection with the HTTP/2 preface (h2c with prior
+knowledge), handling each stream in its own thread.
+
+It can also be run on its own, see ``python -m swiftly.standin -h``.
+
+Example::
+
+    from swiftly.client import StandardClient
+    from swiftly.standin import StandinServer
+
+    with StandinServer() as server:
+        client = StandardClient(
+            auth_url=server.auth_url, auth_user='test:tester',
+            auth_key='testing')
+        print(client.put_container('test'))
+
+Copyright 2014 Gregory Holt
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bisect
+import email.utils
+import hashlib
+import io
+import json
+import optparse
+import random
+import sys
+import tarfile
+import threading
+import time
+import uuid
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves import urllib_parse as parse
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+except ImportError:
+    h2 = None
+
+
+_H2_PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+
+def _trans_id():
+    # Same layout Swift uses so get_trans_id_time works on these too.
+    return 'tx%s-%010x' % (uuid.uuid4().hex[:21], int(time.time()))
+
+
+def _http_date(timestamp):
+    return time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(timestamp))
+
+
+def _iso_date(timestamp):
+    return time.strftime(
+        '%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + \
+        ('%.06f' % (timestamp % 1))[1:]
+
+
+class _Object(object):
+
+    def __init__(self, body, content_type, metadata, manifest=None,
+                 slo=False):
+        self.body = body
+        self.content_type = content_type
+        self.metadata = metadata
+        #: The container/prefix of a dynamic large object's segments.
+        self.manifest = manifest
+        #: True if body is a static large object manifest.
+        self.slo = slo
+        self.etag = hashlib.md5(body).hexdigest()
+        self.timestamp = time.time()
+
+
+class _Container(object):
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.objects = {}
+        self.names = []
+        self.bytes_used = 0
+
+    def put(self, name, obj):
+        old = self.objects.get(name)
+        if old:
+            self.bytes_used -= len(old.body)
+        else:
+            bisect.insort(self.names, name)
+        self.objects[name] = obj
+        self.bytes_used += len(obj.body)
+
+    def delete(self, name):
+        obj = self.objects.pop(name, None)
+        if obj:
+            self.bytes_used -= len(obj.body)
+            del self.names[bisect.bisect_left(self.names, name)]
+        return obj
+
+
+class StandinApp(object):
+    """
+    WSGI application acting as an in-memory Swift proxy.
+
+    Supports auth v1 (``/auth/v1.0``) and v2 (``/v2.0/tokens``),
+    account, container and object requests, listings with prefix,
+    delimiter, marker, end_marker and limit, dynamic and static large
+    objects, server side copies, bulk delete and extract-archive.
+
+    Latency and faults can be injected to exercise client transport
+    and retry behavior; faults are only injected into storage
+    requests, never auth requests. A single random roll per request
+    picks at most one fault, so the fault rates should sum to no more
+    than 1.0.
+
+    :param account: The name of the single account served.
+    :param auth_user: The user name accepted by auth.
+    :param auth_key: The key accepted by auth.
+    :param token_ttl: Seconds an auth token remains valid.
+    :param latency: Seconds to wait before answering each request.
+    :param latency_jitter: Up to this many seconds more are randomly
+        added to latency.
+    :param error_rate: The fraction, 0.0 to 1.0, of storage requests
+        to answer with error_status instead of handling them.
+    :param error_status: The status given for injected errors.
+    :param storm_length: Each injected error begins a storm of this
+        many consecutive errors. Default: 1
+    :param reset_rate: The fraction of storage requests whose
+        connection is dropped without a response, after reading up to
+        half of any request body.
+    :param disconnect_rate: The fraction of storage requests whose
+        connection is dropped after sending the response headers and
+        half of the response body.
+    :param slow_rate: The fraction of storage requests that wait
+        slow_seconds before sending response headers.
+    :param slow_seconds: How long slow and stalled requests wait.
+    :param stall_rate: The fraction of storage requests whose
+        response stalls for slow_seconds after the headers are sent.
+    :param seed: Seed for the random number generator used for
+        jitter and injected errors, for repeatable runs.
+    """
+
+    def __init__(self, account='AUTH_test', auth_user='test:tester',
+                 auth_key='testing', token_ttl=86400, latency=0,
+                 latency_jitter=0, error_rate=0,
+                 error_status='503 Service Unavailable', storm_length=1,
+                 reset_rate=0, disconnect_rate=0, slow_rate=0,
+                 slow_seconds=1, stall_rate=0, seed=None):
+        self.account = account
+        self.auth_user = auth_user
+        self.auth_key = auth_key
+        self.token_ttl = token_ttl
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.storm_length = storm_length
+        self.reset_rate = reset_rate
+        self.disconnect_rate = disconnect_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.stall_rate = stall_rate
+        self.random = random.Random(seed)
+        #: The number of storage requests received.
+        self.request_count = 0
+        #: A count of each fault injected, by fault name.
+        self.fault_counts = dict(
+            (f, 0) for f in (
+                'error', 'reset', 'disconnect', 'slow', 'stall'))
+        self.storm_left = 0
+        self.tokens = {}
+        self.containers = {}
+        self.container_names = []
+        self.metadata = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, env, start_response):
+        if self.latency or self.latency_jitter:
+            time.sleep(
+                self.latency + self.random.uniform(0, self.latency_jitter))
+        status, headers, body = self.handle(env)
+        headers.setdefault('x-trans-id', _trans_id())
+        if env['REQUEST_METHOD'] == 'HEAD':
+            headers.setdefault('content-length', str(len(body)))
+            body = b''
+        else:
+            headers['content-length'] = str(len(body))
+        start_response(status, list(six.iteritems(headers)))
+        return [body]
+
+    def handle(self, env):
+        """
+        Handles the request described by the WSGI env and returns
+        a tuple of (status, headers, body).
+        """
+        path = env.get('PATH_INFO') or '/'
+        if path.startswith('/auth/'):
+            return self._auth1(env)
+        if path.startswith('/v2.0/') and path.endswith('/tokens'):
+            return self._auth2(env)
+        parts = path.split('/', 4)
+        if len(parts) < 3 or parts[1] != 'v1' or parts[2] != self.account:
+            return '404 Not Found', {}, b''
+        if self.tokens.get(env.get('HTTP_X_AUTH_TOKEN'), 0) < time.time():
+            return '401 Unauthorized', {}, b''
+        fault = self._fault()
+        if fault == 'error':
+            return self.error_status, {}, b''
+        elif fault == 'reset':
+            content_length = int(env.get('CONTENT_LENGTH') or 0)
+            env['wsgi.input'].read(
+                content_length // 2 if content_length else 65536)
+            env['swiftly.standin.fault'] = fault
+            return self.error_status, {}, b''
+        elif fault == 'disconnect':
+            env['swiftly.standin.fault'] = fault
+        elif fault == 'slow':
+            time.sleep(self.slow_seconds)
+        elif fault == 'stall':
+            env['swiftly.standin.fault'] = fault
+            env['swiftly.standin.stall_seconds'] = self.slow_seconds
+        query = dict(parse.parse_qsl(
+            env.get('QUERY_STRING') or '', keep_blank_values=True))
+        container = parts[3] if len(parts) > 3 else ''
+        obj = parts[4] if len(parts) > 4 else ''
+        method = env['REQUEST_METHOD']
+        # Read the request body outside the lock so slow uploads don't
+        # hold up everybody else.
+        body = env['wsgi.input'].read()
+        with self.lock:
+            if 'bulk-delete' in query and method in ('DELETE', 'POST'):
+                return self._bulk_delete(env, body)
+            if 'extract-archive' in query and method == 'PUT':
+                return self._extract_archive(
+                    env, query, body, container, obj)
+            if obj:
+                return self._object(env, query, body, container, obj)
+            elif container:
+                return self._container(env, query, container)
+            return self._account(env, query)
+
+    def _fault(self):
+        with self.lock:
+            self.request_count += 1
+            fault = None
+            if self.storm_left:
+                self.storm_left -= 1
+                fault = 'error'
+            else:
+                roll = self.random.random()
+                for fault, rate in (
+                        ('error', self.error_rate),
+                        ('reset', self.reset_rate),
+                        ('disconnect', self.disconnect_rate),
+                        ('slow', self.slow_rate),
+                        ('stall', self.stall_rate)):
+                    if roll < rate:
+                        break
+                    roll -= rate
+                else:
+                    return None
+                if fault == 'error':
+                    self.storm_left = self.storm_length - 1
+            self.fault_counts[fault] += 1
+            return fault
+
+    def _not_modified(self, env, etag, timestamp):
+        if_none_match = env.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            return if_none_match.strip() == '*' or etag.strip('"') in [
+                t.strip().strip('"') for t in if_none_match.split(',')]
+        if_modified_since = env.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            parsed = email.utils.parsedate_tz(if_modified_since)
+            if parsed:
+                return int(timestamp) <= email.utils.mktime_tz(parsed)
+        return False
+
+    def _new_token(self):
+        token = 'AUTH_tk' + uuid.uuid4().hex
+        expires = time.time() + self.token_ttl
+        self.tokens[token] = expires
+        return token, expires
+
+    def _storage_url(self, env):
+        return '%s://%s/v1/%s' % (
+            env.get('wsgi.url_scheme', 'http'), env['HTTP_HOST'],
+            self.account)
+
+    def _auth1(self, env):
+        if env.get('HTTP_X_AUTH_USER') != self.auth_user or \
+                env.get('HTTP_X_AUTH_KEY') != self.auth_key:
+            return '401 Unauthorized', {}, b''
+        token, expires = self._new_token()
+        return '200 OK', {
+            'x-storage-url': self._storage_url(env), 'x-auth-token': token,
+            'x-storage-token': token,
+            'x-auth-token-expires': str(int(expires - time.time()))}, b''
+
+    def _auth2(self, env):
+        if env['REQUEST_METHOD'] != 'POST':
+            return '405 Method Not Allowed', {}, b''
+        try:
+            auth = json.loads(env['wsgi.input'].read().decode('utf-8'))
+            auth = auth['auth']
+            creds = auth.get('passwordCredentials') or \
+                auth.get('RAX-KSKEY:apiKeyCredentials') or {}
+        except (ValueError, KeyError, AttributeError):
+            return '400 Bad Request', {}, b''
+        if creds.get('username') != self.auth_user or \
+                (creds.get('password') or creds.get('apiKey')) != \
+                self.auth_key:
+            return '401 Unauthorized', {}, b''
+        token, expires = self._new_token()
+        url = self._storage_url(env)
+        body = json.dumps({'access': {
+            'token': {
+                'id': token,
+                'expires': _iso_date(expires)[:19] + 'Z',
+                'tenant': {'id': self.account, 'name': auth.get(
+                    'tenantName', self.auth_user)}},
+            'user': {'name': self.auth_user},
+            'serviceCatalog': [{
+                'type': 'object-store', 'name': 'swift',
+                'endpoints': [{
+                    'region': 'RegionOne', 'publicURL': url,
+                    'internalURL': url}]}]}}).encode('utf-8')
+        return '200 OK', {'content-type': 'application/json'}, body
+
+    def _metadata_headers(self, env, prefix):
+        return dict(
+            (k[5:].lower().replace('_', '-'), v)
+            for k, v in six.iteritems(env)
+            if k.startswith('HTTP_' + prefix.upper().replace('-', '_')))
+
+    def _listing(self, env, query, names, entry):
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter')
+        marker = query.get('marker', '')
+        end_marker = query.get('end_marker')
+        limit = int(query.get('limit') or 10000)
+        start = bisect.bisect_right(names, marker) if marker else 0
+        if prefix:
+            start = max(start, bisect.bisect_left(names, prefix))
+        listing = []
+        index = start
+        while index < len(names) and len(listing) < limit:
+            name = names[index]
+            if end_marker and name >= end_marker:
+                break
+            if not name.startswith(prefix):
+                break
+            if delimiter:
+                end = name.find(delimiter, len(prefix))
+                if end >= 0:
+                    subdir = name[:end + 1]
+                    if subdir != marker:
+                        listing.append({'subdir': subdir})
+                    # Skip past everything rolled up into the subdir.
+                    index = bisect.bisect_left(
+                        names, name[:end] + chr(ord(delimiter) + 1))
+                    continue
+            listing.append(entry(name))
+            index += 1
+        if query.get('format') == 'json':
+            body = json.dumps(listing).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        else:
+            body = ''.join(
+                (item.get('name') or item['subdir']) + '\n'
+                for item in listing).encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        if not listing:
+            return '204 No Content', {'content-type': content_type}, b''
+        return '200 OK', {'content-type': content_type}, body
+
+    def _bulk_response(self, env, status, info, errors):
+        info['Response Status'] = status
+        info['Response Body'] = ''
+        info['Errors'] = errors
+        if 'json' in env.get('HTTP_ACCEPT', ''):
+            return '200 OK', {'content-type': 'application/json'}, \
+                json.dumps(info).encode('utf-8')
+        body = ''.join(
+            '%s: %s\n' % (k, v) for k, v in sorted(six.iteritems(info))
+            if k != 'Errors')
+        body += 'Errors:\n' + ''.join('%s, %s\n' % e for e in errors)
+        return '200 OK', {'content-type': 'text/plain'}, body.encode('utf-8')
+
+    def _bulk_delete(self, env, body):
+        deleted = not_found = 0
+        errors = []
+        for line in body.decode('utf-8').splitlines():
+            path = parse.unquote(line.strip()).lstrip('/')
+            if not path:
+                continue
+            container, _junk, obj = path.partition('/')
+            cont = self.containers.get(container)
+            if obj:
+                if cont and cont.delete(obj):
+                    deleted += 1
+                else:
+                    not_found += 1
+            elif not cont:
+                not_found += 1
+            elif cont.objects:
+                errors.append((path, '409 Conflict'))
+            else:
+                self._delete_container(container)
+                deleted += 1
+        return self._bulk_response(
+            env, '400 Bad Request' if errors else '200 OK',
+            {'Number Deleted': deleted, 'Number Not Found': not_found},
+            errors)
+
+    def _extract_archive(self, env, query, body, container, obj):
+        mode = {'tar': 'r|', 'tar.gz': 'r|gz', 'tar.bz2': 'r|bz2'}.get(
+            query['extract-archive'])
+        if not mode:
+            return '400 Bad Request', {}, b'Unsupported archive format'
+        created = 0
+        errors = []
+        base = '/'.join(p for p in (container, obj) if p)
+        try:
+            archive = tarfile.open(mode=mode, fileobj=io.BytesIO(body))
+            for member in archive:
+                if not member.isfile():
+                    continue
+                path = (base + '/' + member.name.lstrip('./')).lstrip('/')
+                cont_name, _junk, obj_name = path.partition('/')
+                if not obj_name:
+                    errors.append((path, '400 Bad Request'))
+                    continue
+                if cont_name not in self.containers:
+                    self._put_container(cont_name, {})
+                self.containers[cont_name].put(obj_name, _Object(
+                    archive.extractfile(member).read(),
+                    'application/octet-stream', {}))
+                created += 1
+        except tarfile.TarError as err:
+            return self._bulk_response(
+                env, '400 Bad Request', {'Number Files Created': created},
+                [('', str(err))])
+        return self._bulk_response(
+            env, '400 Bad Request' if errors else '201 Created',
+            {'Number Files Created': created}, errors)
+
+    def _account(self, env, query):
+        method = env['REQUEST_METHOD']
+        if method in ('GET', 'HEAD'):
+            status, headers, body = self._listing(
+                env, query, self.container_names,
+                lambda name: {
+                    'name': name,
+                    'count': len(self.containers[name].objects),
+                    'bytes': self.containers[name].bytes_used})
+            headers.update(self.metadata)
+            headers['x-account-container-count'] = str(len(self.containers))
+            headers['x-account-object-count'] = str(sum(
+                len(c.objects) for c in six.itervalues(self.containers)))
+            headers['x-account-bytes-used'] = str(sum(
+                c.bytes_used for c in six.itervalues(self.containers)))
+            return status, headers, body
+        elif method == 'POST':
+            self.metadata.update(
+                self._metadata_headers(env, 'x-account-meta-'))
+            return '204 No Content', {}, b''
+        return '405 Method Not Allowed', {}, b''
+
+    def _put_container(self, container, metadata):
+        self.containers[container] = _Container(metadata)
+        bisect.insort(self.container_names, container)
+
+    def _delete_container(self, container):
+        del self.containers[container]
+        del self.container_names[
+            bisect.bisect_left(self.container_names, container)]
+
+    def _container(self, env, query, container):
+        method = env['REQUEST_METHOD']
+        cont = self.containers.get(container)
+        if method == 'PUT':
+            metadata = self._metadata_headers(env, 'x-container-meta-')
+            if cont:
+                cont.metadata.update(metadata)
+                return '202 Accepted', {}, b''
+            self._put_container(container, metadata)
+            return '201 Created', {}, b''
+        if not cont:
+            return '404 Not Found', {}, b''
+        if method in ('GET', 'HEAD'):
+            status, headers, body = self._listing(
+                env, query, cont.names,
+                lambda name: {
+                    'name': name,
+                    'bytes': len(cont.objects[name].body),
+                    'hash': cont.objects[name].etag,
+                    'last_modified': _iso_date(cont.objects[name].timestamp),
+                    'content_type': cont.objects[name].content_type})
+            headers.update(cont.metadata)
+            headers['x-container-object-count'] = str(len(cont.objects))
+            headers['x-container-bytes-used'] = str(cont.bytes_used)
+            return status, headers, body
+        elif method == 'POST':
+            cont.metadata.update(
+                self._metadata_headers(env, 'x-container-meta-'))
+            return '204 No Content', {}, b''
+        elif method == 'DELETE':
+            if cont.objects:
+                return '409 Conflict', {}, b''
+            self._delete_container(container)
+            return '204 No Content', {}, b''
+        return '405 Method Not Allowed', {}, b''
+
+    def _segment(self, path):
+        container, _junk, obj = path.lstrip('/').partition('/')
+        cont = self.containers.get(container)
+        return cont.objects.get(obj) if cont else None
+
+    def _put_slo(self, env, body, content_type, metadata):
+        try:
+            segments = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return None, '400 Bad Request', b'Manifest must be valid JSON'
+        manifest = []
+        problems = []
+        for segment in segments:
+            path = segment.get('path') or ''
+            seg = self._segment(path)
+            if not seg:
+                problems.append('%s: 404 Not Found' % path)
+            elif segment.get('etag') not in (None, seg.etag):
+                problems.append('%s: Etag Mismatch' % path)
+            elif segment.get('size_bytes') not in (None, len(seg.body)):
+                problems.append('%s: Size Mismatch' % path)
+            else:
+                manifest.append({
+                    'name': '/' + path.lstrip('/'), 'hash': seg.etag,
+                    'bytes': len(seg.body),
+                    'content_type': seg.content_type})
+        if problems:
+            return None, '400 Bad Request', \
+                '\n'.join(problems).encode('utf-8')
+        return _Object(
+            json.dumps(manifest).encode('utf-8'), content_type, metadata,
+            slo=True), None, None
+
+    def _large_object(self, existing):
+        """
+        Returns the (etag, segments) for a large object manifest.
+        """
+        if existing.slo:
+            segments = [
+                self._segment(s['name'])
+                for s in json.loads(existing.body.decode('utf-8'))]
+        else:
+            container, _junk, prefix = existing.manifest.partition('/')
+            cont = self.containers.get(container)
+            segments = []
+            if cont:
+                index = bisect.bisect_left(cont.names, prefix)
+                while index < len(cont.names) and \
+                        cont.names[index].startswith(prefix):
+                    segments.append(cont.objects[cont.names[index]])
+                    index += 1
+        segments = [s for s in segments if s]
+        etag = hashlib.md5(
+            ''.join(s.etag for s in segments).encode('utf-8')).hexdigest()
+        return '"%s"' % etag, segments
+
+    def _copy(self, env, query, source, destination):
+        """
+        Copies the object at the source container/object path to the
+        destination one, as a PUT with X-Copy-From or a COPY does.
+
+        The copy keeps the source's content type and metadata, updated
+        with any given unless X-Fresh-Metadata is true. Large objects
+        are copied as the contents of their segments unless
+        multipart-manifest=get asks for the manifest itself.
+        """
+        source = source.lstrip('/')
+        destination = destination.lstrip('/')
+        if '/' not in source or '/' not in destination:
+            return '412 Precondition Failed', {}, \
+                b'The copy source and destination must be of the form ' \
+                b'<container name>/<object name>'
+        container, _junk, obj = destination.partition('/')
+        cont = self.containers.get(container)
+        existing = self._segment(source)
+        if not cont or not existing:
+            return '404 Not Found', {}, b''
+        metadata = {}
+        if env.get('HTTP_X_FRESH_METADATA', '').lower() not in (
+                '1', 'on', 't', 'true', 'y', 'yes'):
+            metadata.update(existing.metadata)
+        metadata.update(self._metadata_headers(env, 'x-object-meta-'))
+        content_type = env.get('CONTENT_TYPE') or existing.content_type
+        if (existing.manifest or existing.slo) and \
+                query.get('multipart-manifest') != 'get':
+            new_obj = _Object(
+                b''.join(s.body for s in self._large_object(existing)[1]),
+                content_type, metadata)
+        else:
+            new_obj = _Object(
+                existing.body, content_type, metadata,
+                manifest=existing.manifest, slo=existing.slo)
+        cont.put(obj, new_obj)
+        etag = new_obj.etag
+        if new_obj.manifest or new_obj.slo:
+            etag = self._large_object(new_obj)[0]
+        return '201 Created', {
+            'etag': etag,
+            'x-copied-from': parse.quote(source),
+            'x-copied-from-last-modified': _http_date(existing.timestamp)
+        }, b''
+
+    def _object(self, env, query, body, container, obj):
+        method = env['REQUEST_METHOD']
+        if method == 'COPY':
+            return self._copy(
+                env, query, '%s/%s' % (container, obj),
+                parse.unquote(env.get('HTTP_DESTINATION', '')))
+        if method == 'PUT' and 'HTTP_X_COPY_FROM' in env:
+            return self._copy(
+                env, query, parse.unquote(env['HTTP_X_COPY_FROM']),
+                '%s/%s' % (container, obj))
+        cont = self.containers.get(container)
+        if not cont:
+            return '404 Not Found', {}, b''
+        if method == 'PUT':
+            content_type = \
+                env.get('CONTENT_TYPE') or 'application/octet-stream'
+            metadata = self._metadata_headers(env, 'x-object-meta-')
+            if query.get('multipart-manifest') == 'put':
+                new_obj, status, message = self._put_slo(
+                    env, body, content_type, metadata)
+                if not new_obj:
+                    return status, {}, message
+                etag = self._large_object(new_obj)[0]
+            else:
+                new_obj = _Object(
+                    body, content_type, metadata,
+                    manifest=env.get('HTTP_X_OBJECT_MANIFEST'))
+                etag = env.get('HTTP_ETAG')
+                if etag and etag.strip('"') != new_obj.etag:
+                    return '422 Unprocessable Entity', {}, b''
+                etag = new_obj.etag
+            cont.put(obj, new_obj)
+            return '201 Created', {'etag': etag}, b''
+        existing = cont.objects.get(obj)
+        if not existing:
+            return '404 Not Found', {}, b''
+        if method in ('GET', 'HEAD'):
+            headers = dict(existing.metadata)
+            headers['etag'] = existing.etag
+            headers['content-type'] = existing.content_type
+            headers['last-modified'] = _http_date(existing.timestamp)
+            headers['accept-ranges'] = 'bytes'
+            body = existing.body
+            if existing.manifest:
+                headers['x-object-manifest'] = existing.manifest
+            if existing.slo:
+                headers['x-static-large-object'] = 'True'
+            if (existing.manifest or existing.slo) and \
+                    query.get('multipart-manifest') != 'get':
+                headers['etag'], segments = self._large_object(existing)
+                body = b''.join(s.body for s in segments)
+            if self._not_modified(env, headers['etag'], existing.timestamp):
+                return '304 Not Modified', {
+                    'etag': headers['etag'],
+                    'last-modified': headers['last-modified']}, b''
+            return '200 OK', headers, body
+        elif method == 'POST':
+            existing.metadata = self._metadata_headers(env, 'x-object-meta-')
+            if env.get('CONTENT_TYPE'):
+                existing.content_type = env['CONTENT_TYPE']
+            return '202 Accepted', {}, b''
+        elif method == 'DELETE':
+            if existing.slo and \
+                    query.get('multipart-manifest') == 'delete':
+                deleted = not_found = 0
+                for segment in json.loads(existing.body.decode('utf-8')):
+                    seg_cont, _junk, seg_obj = \
+                        segment['name'].lstrip('/').partition('/')
+                    seg_cont = self.containers.get(seg_cont)
+                    if seg_cont and seg_cont.delete(seg_obj):
+                        deleted += 1
+                    else:
+                        not_found += 1
+                cont.delete(obj)
+                return self._bulk_response(
+                    env, '200 OK', {
+                        'Number Deleted': deleted + 1,
+                        'Number Not Found': not_found}, [])
+            cont.delete(obj)
+            return '204 No Content', {}, b''
+        return '405 Method Not Allowed', {}, b''
+
+
+class _ChunkedReader(object):
+    """
+    Decodes a chunked transfer encoded request body.
+    """
+
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.left = 0
+        self.done = False
+
+    def read(self, size=-1):
+        parts = []
+        while not self.done and size != 0:
+            if not self.left:
+                line = self.rfile.readline()
+                try:
+                    self.left = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    self.left = 0
+                if not self.left:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    self.done = True
+                    break
+            chunk = self.rfile.read(
+                self.left if size < 0 else min(size, self.left))
+            if not chunk:
+                self.done = True
+                break
+            self.left -= len(chunk)
+            if not self.left:
+                self.rfile.readline()
+            parts.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(parts)
+
+
+class _LimitedReader(object):
+    """
+    Reads at most the Content-Length of a request body.
+    """
+
+    def __init__(self, rfile, left):
+        self.rfile = rfile
+        self.left = left
+
+    def read(self, size=-1):
+        if size < 0 or size > self.left:
+            size = self.left
+        chunk = self.rfile.read(size) if size else b''
+        self.left -= len(chunk)
+        if size and not chunk:
+            self.left = 0
+        return chunk
+
+
+class _StandinRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Minimal HTTP/1.1 keep-alive WSGI gateway for the stand-in.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        if h2 and hasattr(self.rfile, 'peek') and \
+                self.rfile.peek(len(_H2_PREFACE)).startswith(_H2_PREFACE):
+            _StandinH2Connection(self).serve()
+        else:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+
+    def environ(self, method, path, headers, protocol):
+        """
+        Returns a WSGI env, less wsgi.input, for a request.
+        """
+        path, _junk, query = path.partition('?')
+        env = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': parse.unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.server.server_address[0],
+            'SERVER_PORT': str(self.server.server_address[1]),
+            'SERVER_PROTOCOL': protocol,
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False}
+        for key, value in headers:
+            key = key.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            env[key] = value
+        return env
+
+    def _handle(self):
+        env = self.environ(
+            self.command, self.path, self.headers.items(),
+            self.request_version)
+        if env.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+            env['wsgi.input'] = _ChunkedReader(self.rfile)
+        else:
+            env['wsgi.input'] = _LimitedReader(
+                self.rfile, int(env.get('CONTENT_LENGTH') or 0))
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+
+        body = self.server.app(env, start_response)
+        fault = env.get('swiftly.standin.fault')
+        if fault == 'reset':
+            # Closing with unread input pending makes for a real reset.
+            self.close_connection = True
+            return
+        # Drain any unread request body to keep the connection in sync.
+        while env['wsgi.input'].read(65536):
+            pass
+        status, headers = response
+        code, reason = status.split(' ', 1)
+        self.send_response(int(code), reason)
+        for key, value in headers:
+            self.send_header(key, value)
+        try:
+            self.end_headers()
+            if fault == 'disconnect':
+                body = b''.join(body)
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            if fault == 'stall':
+                self.wfile.flush()
+                time.sleep(env['swiftly.standin.stall_seconds'])
+            for chunk in body:
+                self.wfile.write(chunk)
+        except (IOError, OSError):
+            # The client went away; nothing more to do for it.
+            self.close_connection = True
+        if hasattr(body, 'close'):
+            body.close()
+
+    do_COPY = do_DELETE = do_GET = do_HEAD = do_POST = do_PUT = _handle
+
+
+class _StandinH2Connection(object):
+    """
+    Serves the HTTP/2 streams of one connection, running the app for
+    each stream in its own thread once its request body has arrived.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sock = handler.connection
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=False, header_encoding=None))
+        self.condition = threading.Condition()
+        self.requests = {}
+        self.closed = False
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def serve(self):
+        with self.condition:
+            self.conn.initiate_connection()
+            # Windows large enough that concurrent uploads don't wait on
+            # each other's window updates.
+            self.conn.update_settings({
+                h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: 1048576})
+            self.conn.increment_flow_control_window(16777216 - 65535)
+            self._flush()
+        try:
+            while not self.closed:
+                data = self.handler.rfile.read1(65536)
+                if not data:
+                    break
+                with self.condition:
+                    self._receive(data)
+                    self._flush()
+                    self.condition.notify_all()
+        except (IOError, OSError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+
+    def _receive(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                self.requests[event.stream_id] = (event.headers, [])
+            elif isinstance(event, h2.events.DataReceived):
+                if event.stream_id in self.requests:
+                    self.requests[event.stream_id][1].append(event.data)
+                self.conn.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                headers, body = self.requests.pop(event.stream_id)
+                thread = threading.Thread(
+                    target=self._respond,
+                    args=(event.stream_id, headers, b''.join(body)))
+                thread.daemon = True
+                thread.start()
+            elif isinstance(event, h2.events.StreamReset):
+                self.requests.pop(event.stream_id, None)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.closed = True
+
+    def _respond(self, stream_id, headers, body):
+        headers = [
+            (k.decode('latin-1'), v.decode('latin-1')) for k, v in headers]
+        pseudo = dict(h for h in headers if h[0].startswith(':'))
+        env = self.handler.environ(
+            pseudo[':method'], pseudo[':path'],
+            [h for h in headers if not h[0].startswith(':')], 'HTTP/2.0')
+        env['wsgi.input'] = io.BytesIO(body)
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+
+        body = b''.join(self.handler.server.app(env, start_response))
+        fault = env.get('swiftly.standin.fault')
+        status, headers = response
+        try:
+            with self.condition:
+                if fault == 'reset':
+                    self.conn.reset_stream(stream_id)
+                    self._flush()
+                    return
+                self.conn.send_headers(
+                    stream_id,
+                    [(':status', status.split(' ', 1)[0])] +
+                    [(k.lower(), v) for k, v in headers],
+                    end_stream=env['REQUEST_METHOD'] == 'HEAD')
+                if env['REQUEST_METHOD'] == 'HEAD':
+                    self._flush()
+                    return
+                if fault == 'stall':
+                    self._flush()
+                    until = time.time() + env['swiftly.standin.stall_seconds']
+                    while not self.closed and time.time() < until:
+                        self.condition.wait(until - time.time())
+                if fault == 'disconnect':
+                    body = body[:len(body) // 2]
+                offset = 0
+                while not self.closed:
+                    size = min(
+                        self.conn.local_flow_control_window(stream_id),
+                        self.conn.max_outbound_frame_size,
+                        len(body) - offset)
+                    if size > 0 or offset == len(body):
+                        self.conn.send_data(
+                            stream_id, body[offset:offset + size],
+                            end_stream=offset + size == len(body) and
+                            fault != 'disconnect')
+                        offset += size
+                        self._flush()
+                        if offset == len(body):
+                            break
+                    else:
+                        self.condition.wait(1)
+                if fault == 'disconnect':
+                    self.conn.reset_stream(stream_id)
+                    self._flush()
+        except (IOError, OSError, h2.exceptions.H2Error):
+            # The stream or connection went away; nothing more to do.
+            pass
+
+
+class _StandinHTTPServer(socketserver.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandinServer(object):
+    """
+    Runs a WSGI app, by default a new :py:class:`StandinApp`, on a
+    local HTTP/1.1 server in a background thread.
+
+    Can be used as a context manager that starts and stops the
+    server.
+
+    :param app: The WSGI app to serve. Default: a new StandinApp.
+    :param host: The address to listen on. Default: 127.0.0.1
+    :param port: The port to listen on. Default: 0, meaning any free
+        port.
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0):
+        self.app = app or StandinApp()
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        """The base URL the server is listening on."""
+        return 'http://%s:%s' % (self.host, self.port)
+
+    @property
+    def auth_url(self):
+        """The auth v1 URL of the server."""
+        return self.url + '/auth/v1.0'
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self.server = _StandinHTTPServer(
+            (self.host, self.port), _StandinRequestHandler)
+        self.server.app = self.app
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops serving and waits for the background thread to exit.
+        """
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+            self.thread = None
+
+
+def main(args=None):
+    """
+    Runs a :py:class:`StandinServer` in the foreground until
+    interrupted.
+    """
+    parser = optparse.OptionParser(
+        usage='Usage: python -m swiftly.standin [options]')
+    parser.add_option(
+        '--host', default='127.0.0.1',
+        help='The address to listen on. Default: %default')
+    parser.add_option(
+        '--port', type='int', default=8080,
+        help='The port to listen on. Default: %default')
+    parser.add_option(
+        '--latency', type='float', default=0, metavar='SECONDS',
+        help='Seconds to wait before answering each request.')
+    parser.add_option(
+        '--latency-jitter', type='float', default=0, metavar='SECONDS',
+        help='Up to this many seconds more are randomly added to latency.')
+    parser.add_option(
+        '--error-rate', type='float', default=0, metavar='FRACTION',
+        help='The fraction of storage requests to answer with a 503.')
+    options, args = parser.parse_args(args)
+    server = StandinServer(
+        StandinApp(
+            latency=options.latency, latency_jitter=options.latency_jitter,
+            error_rate=options.error_rate),
+        host=options.host, port=options.port)
+    server.start()
+    sys.stdout.write(
+        'Serving on %s auth v1 %s user test:tester key testing\n' %
+        (server.url, server.auth_url))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())